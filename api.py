@@ -1,12 +1,57 @@
-from typing import Any, Dict, Optional
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
 
-from fastapi import FastAPI, Body, Query
+from fastapi import FastAPI, Body, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+import jsonutil
+import logs
+import metrics
+
+from config import settings
+from storage import searches
+from watcher import add_watch, watch_store, watcher
+from eto_client import (
+    aclose_clients,
+    aprewarm_lists,
+    async_modresult,
+    async_modsearch,
+    async_result_delta,
+    async_search_tours,
+    async_search_tours_batch,
+    async_search_page,
+    async_search_state,
+    async_search_tours_flexible,
+    async_search_tours_stream,
+)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    # Прогрев справочников в фоне: старт не ждёт загрузки listcountry/listdev
+    prewarm = asyncio.create_task(aprewarm_lists()) if settings.list_prewarm else None
+    if settings.watch_enabled:
+        watcher.start()
+    yield
+    if prewarm:
+        prewarm.cancel()
+    await watcher.stop()
+    await aclose_clients()
+    logs.logger.close()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON через jsonutil (orjson/msgspec, если установлены)."""
 
-from eto_client import modresult, modsearch, search_tours
+    def render(self, content: Any) -> bytes:
+        return jsonutil.dumps(content).encode("utf-8")
 
-app = FastAPI(title="eto-tours-mcp")
 
+app = FastAPI(title="eto-tours-mcp", lifespan=lifespan, default_response_class=FastJSONResponse)
+
+app.add_middleware(logs.RequestLogMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -21,38 +66,147 @@ def health() -> Dict[str, Any]:
     return {"ok": True}
 
 
+@app.get("/metrics")
+def metrics_api() -> PlainTextResponse:
+    """Метрики в формате Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.post("/modsearch")
-def modsearch_api(payload: Dict[str, Any] = Body(default_factory=dict)) -> Dict[str, Any]:
-    return modsearch(payload)
+async def modsearch_api(payload: Dict[str, Any] = Body(default_factory=dict)) -> FastJSONResponse:
+    return FastJSONResponse(await async_modsearch(payload))
 
 
 @app.get("/modresult")
-def modresult_api(requestid: Optional[str] = Query(default=None)) -> Dict[str, Any]:
+async def modresult_api(requestid: Optional[str] = Query(default=None)) -> FastJSONResponse:
     if not requestid:
-        return {"success": False, "error": "requestid обязателен"}
-    return modresult(requestid)
+        return FastJSONResponse({"success": False, "error": "requestid обязателен"})
+    return FastJSONResponse(await async_modresult(requestid))
 
 
 @app.post("/modresult")
-def modresult_api_post(payload: Dict[str, Any] = Body(default_factory=dict)) -> Dict[str, Any]:
+async def modresult_api_post(payload: Dict[str, Any] = Body(default_factory=dict)) -> FastJSONResponse:
     requestid = payload.get("requestid") or payload.get("search_id")
     if not requestid:
-        return {"success": False, "error": "requestid обязателен"}
-    return modresult(requestid)
+        return FastJSONResponse({"success": False, "error": "requestid обязателен"})
+    return FastJSONResponse(await async_modresult(requestid))
 
 
 @app.post("/search")
-def search(payload: Dict[str, Any] = Body(default_factory=dict)) -> Dict[str, Any]:
-    return modsearch(payload)
+async def search(payload: Dict[str, Any] = Body(default_factory=dict)) -> FastJSONResponse:
+    return FastJSONResponse(await async_modsearch(payload))
 
 
 @app.post("/search_tours")
-def search_tours_api(payload: Dict[str, Any] = Body(default_factory=dict)) -> Dict[str, Any]:
-    return search_tours(payload)
+async def search_tours_api(payload: Dict[str, Any] = Body(default_factory=dict)) -> FastJSONResponse:
+    return FastJSONResponse(await async_search_tours(payload))
+
+
+@app.post("/search_tours/batch")
+async def search_tours_batch_api(payload: Dict[str, Any] = Body(default_factory=dict)) -> FastJSONResponse:
+    """{"searches": [{...}, ...], общие параметры, limit, sort} — общий рейтинг туров."""
+    return FastJSONResponse(await async_search_tours_batch(payload))
+
+
+@app.post("/search_tours/flexible")
+async def search_tours_flexible_api(payload: Dict[str, Any] = Body(default_factory=dict)) -> FastJSONResponse:
+    """Широкий диапазон дат/ночей: параллельные подзапросы, рейтинг и календарь цен."""
+    return FastJSONResponse(await async_search_tours_flexible(payload))
+
+
+@app.get("/search_tours/page")
+async def search_tours_page_api(
+    cursor: Optional[str] = Query(default=None),
+    limit: Optional[int] = Query(default=None),
+) -> FastJSONResponse:
+    """Следующая страница выдачи по next_cursor из /search_tours."""
+    if not cursor:
+        return FastJSONResponse({"success": False, "error": "cursor обязателен"})
+    return FastJSONResponse(await async_search_page(cursor, limit))
+
+
+@app.post("/search_tours/stream")
+async def search_tours_stream_api(
+    request: Request,
+    payload: Dict[str, Any] = Body(default_factory=dict),
+    format: Optional[str] = Query(default=None),
+) -> StreamingResponse:
+    """Новые туры по мере прихода снимков modresult: NDJSON или SSE (format=sse / Accept: text/event-stream)."""
+    sse = format == "sse" or (format is None and "text/event-stream" in request.headers.get("accept", ""))
+
+    async def events() -> AsyncIterator[str]:
+        async for event in async_search_tours_stream(payload):
+            line = jsonutil.dumps(event)
+            if sse:
+                yield f"event: {event['event']}\ndata: {line}\n\n"
+            else:
+                yield line + "\n"
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
 
 
 @app.get("/result")
-def result(requestid: Optional[str] = Query(default=None)) -> Dict[str, Any]:
+async def result(requestid: Optional[str] = Query(default=None)) -> FastJSONResponse:
+    if not requestid:
+        return FastJSONResponse({"success": False, "error": "requestid обязателен"})
+    return FastJSONResponse(await async_modresult(requestid))
+
+
+@app.get("/searches")
+async def searches_api(
+    status: Optional[str] = Query(default=None),
+    limit: int = Query(default=50),
+) -> FastJSONResponse:
+    """Идущие и недавние поиски процесса (status=running|done|failed), новые первыми."""
+    items = searches.list(status, limit)
+    return FastJSONResponse({"success": True, "count": len(items), "searches": items})
+
+
+@app.get("/searches/{requestid}")
+async def search_state_api(requestid: str, limit: int = Query(default=0)) -> FastJSONResponse:
+    """Прогресс поиска; limit > 0 — ещё и лучшие туры, найденные к этому моменту."""
+    return FastJSONResponse(await async_search_state(requestid, limit))
+
+
+@app.get("/result/delta")
+async def result_delta(
+    requestid: Optional[str] = Query(default=None),
+    country: Optional[int] = Query(default=None),
+    sort: Optional[str] = Query(default=None),
+) -> FastJSONResponse:
+    """Туры, появившиеся с прошлого запроса по этому requestid."""
     if not requestid:
-        return {"success": False, "error": "requestid обязателен"}
-    return modresult(requestid)
+        return FastJSONResponse({"success": False, "error": "requestid обязателен"})
+    return FastJSONResponse(await async_result_delta(requestid, country, sort))
+
+
+@app.post("/watches")
+async def watches_add(payload: Dict[str, Any] = Body(default_factory=dict)) -> FastJSONResponse:
+    """Наблюдение: параметры как у /search_tours (можно с filter) и interval в секундах."""
+    return FastJSONResponse(await add_watch(payload))
+
+
+@app.get("/watches")
+async def watches_list() -> FastJSONResponse:
+    items = await asyncio.to_thread(watch_store.list)
+    return FastJSONResponse({"success": True, "watches": items})
+
+
+@app.get("/watches/{watch_id}/events")
+async def watches_events(
+    watch_id: str,
+    since: int = Query(default=0),
+    limit: int = Query(default=100),
+) -> FastJSONResponse:
+    """Новые предложения и снижения цены после события с id since."""
+    if await asyncio.to_thread(watch_store.get, watch_id) is None:
+        return FastJSONResponse({"success": False, "error": "Наблюдение не найдено"})
+    events = await asyncio.to_thread(watch_store.events, watch_id, since, limit)
+    return FastJSONResponse({"success": True, "events": events, "last_id": events[-1]["id"] if events else since})
+
+
+@app.delete("/watches/{watch_id}")
+async def watches_remove(watch_id: str) -> FastJSONResponse:
+    removed = await asyncio.to_thread(watch_store.remove, watch_id)
+    return FastJSONResponse({"success": removed} if removed else {"success": False, "error": "Наблюдение не найдено"})
@@ -0,0 +1,83 @@
+"""Бенчмарк прогрессивной выдачи: нормализация каждого накопленного снимка
+modresult против нормализации только дельты (SnapshotDiff).
+
+    python -m bench.delta --tours 20000 --polls 10 [--mode append|grow]
+
+append — новые блоки дописываются в конец (как операторы в Tourvisor),
+grow — у каждого отеля с каждым снимком прибавляются туры (худший случай).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from typing import Any, Dict
+
+os.environ.setdefault("HOTEL_DB_PATH", ":memory:")
+
+from bench.normalize import best_of  # noqa: E402
+from bench.payloads import load_payload  # noqa: E402
+from eto_client import _normalize_result  # noqa: E402
+from snapshots import SnapshotDiff  # noqa: E402
+
+
+def _snapshots(raw: Dict[str, Any], polls: int, mode: str) -> list[Dict[str, Any]]:
+    data = raw.get("data", raw)
+    blocks = data["block"]
+    out = []
+    for i in range(1, polls + 1):
+        snap = dict(data)
+        if mode == "grow":
+            snap["block"] = [
+                {"hotel": [{**h, "tour": h["tour"][:max(1, len(h["tour"]) * i // polls)]} for h in b["hotel"]]}
+                for b in blocks
+            ]
+        else:
+            snap["block"] = blocks[:max(1, len(blocks) * i // polls)]
+        out.append({"data": snap})
+    return out
+
+
+def run(tours: int, polls: int = 10, mode: str = "append", payload_path: str = "", repeat: int = 3) -> Dict[str, Any]:
+    snaps = _snapshots(load_payload(payload_path or None, tours), polls, mode)
+    args = dict(country_id=None, session=None, referrer=None)
+
+    def full() -> int:
+        return sum(len(_normalize_result(s, **args)) for s in snaps)
+
+    def delta() -> int:
+        diff = SnapshotDiff()
+        total = 0
+        for s in snaps:
+            part = diff.feed(s)
+            if part is not None:
+                total += len(_normalize_result(part, **args))
+        return total
+
+    report: Dict[str, Any] = {
+        "benchmark": "snapshot_delta",
+        "tours": tours,
+        "polls": polls,
+        "mode": mode,
+        "full_s": best_of(repeat, full),
+        "delta_s": best_of(repeat, delta),
+        "tours_normalized_full": full(),
+        "tours_normalized_delta": delta(),
+    }
+    report["speedup"] = round(report["full_s"] / report["delta_s"], 2)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tours", type=int, default=20000)
+    parser.add_argument("--polls", type=int, default=10)
+    parser.add_argument("--mode", choices=("append", "grow"), default="append")
+    parser.add_argument("--payload", default="", help="JSON-файл с записанным ответом modresult")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.tours, args.polls, args.mode, args.payload, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Сквозной бенчмарк против локального заменителя Tourvisor (bench.mock_server).
+
+    python -m bench.e2e --sizes 100,1000,10000,50000 --repeat 5 \\
+        --load-tours 1000 --concurrency 16 --requests 200 [--out e2e.json]
+
+latency — async_search_tours в одном event loop на ответах разного размера
+(кэш поиска выключен, каждый запрос — полный modsearch + опрос modresult);
+load — пропускная способность POST /search_tours у api.py и MCP tools/call
+у mcp_http.py, запущенных отдельными процессами uvicorn.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bench.mock_server import MockTourvisor
+from bench.report import emit
+
+# Настройки клиента на время бенчмарка: без кэша результатов и лимитов,
+# короткий опрос — меряется наш код, а не паузы
+BENCH_ENV = {
+    "SEARCH_CACHE_TTL": "0",
+    "CACHE_BACKEND": "memory",
+    "HOTEL_DB_PATH": ":memory:",
+    "LIST_PREWARM": "0",
+    "UPSTREAM_RATE_LIMIT": "0",
+    "POLL_INTERVAL": "0.05",
+    "POLL_MIN_INTERVAL": "0.05",
+    "POLL_MAX_INTERVAL": "0.5",
+    "POLL_GOOD_ENOUGH_TOURS": "0",
+}
+SEARCH = {"country": "Турция", "city_from": "Москва", "nights": 7, "adults": 2, "limit": 20}
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "min_ms": ordered[0] * 1000,
+        "p50_ms": pick(0.5) * 1000,
+        "p95_ms": pick(0.95) * 1000,
+        "p99_ms": pick(0.99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _latency(mock: MockTourvisor, sizes: List[int], repeat: int) -> Dict[str, Any]:
+    from eto_client import aclose_clients, async_search_tours
+
+    out: Dict[str, Any] = {}
+    try:
+        for size in sizes:
+            mock.tours = size
+            mock.snapshots(size)  # сериализация снимков — не часть замера
+            samples = []
+            errors = 0
+            for _ in range(repeat):
+                started = time.perf_counter()
+                result = await async_search_tours(dict(SEARCH))
+                samples.append(time.perf_counter() - started)
+                errors += not result.get("success")
+            out[str(size)] = {"repeat": repeat, "errors": errors, **_percentiles(samples)}
+    finally:
+        await aclose_clients()
+    return out
+
+
+def _serve(target: List[str], port: int, env: Dict[str, str]) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", *target, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"uvicorn {' '.join(target)} не поднялся на порту {port}")
+
+
+async def _load(
+    call: Callable[[Any], Awaitable[bool]], concurrency: int, requests: int
+) -> Dict[str, Any]:
+    import httpx
+
+    samples: List[float] = []
+    errors = 0
+    queue: "asyncio.Queue[int]" = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker(client: Any) -> None:
+        nonlocal errors
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                ok = await call(client)
+            except Exception:
+                ok = False
+            samples.append(time.perf_counter() - started)
+            errors += not ok
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "rps": requests / elapsed if elapsed else 0.0,
+        **_percentiles(samples),
+    }
+
+
+def _api_call(base: str) -> Callable[[Any], Awaitable[bool]]:
+    async def call(client: Any) -> bool:
+        r = await client.post(f"{base}/search_tours", json=SEARCH)
+        return r.status_code == 200 and r.json().get("success") is True
+
+    return call
+
+
+def _mcp_call(base: str) -> Callable[[Any], Awaitable[bool]]:
+    body = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "tools/call",
+        "params": {"name": "search_tours", "arguments": SEARCH},
+    }
+    headers = {"Accept": "application/json, text/event-stream"}
+
+    async def call(client: Any) -> bool:
+        r = await client.post(f"{base}/mcp", json=body, headers=headers)
+        return r.status_code == 200 and '"isError":false' in r.text
+
+    return call
+
+
+def run(
+    sizes: List[int],
+    repeat: int = 5,
+    load_tours: int = 1000,
+    concurrency: int = 16,
+    requests: int = 200,
+    duration: float = 0.5,
+    delay: float = 0.0,
+    payload_path: str = "",
+    targets: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    targets = targets if targets is not None else ["api", "mcp"]
+    with MockTourvisor(tours=load_tours, duration=duration, delay=delay, payload_path=payload_path) as mock:
+        env = {**os.environ, **BENCH_ENV, **mock.env()}
+        os.environ.update(env)
+        report: Dict[str, Any] = {
+            "benchmark": "e2e",
+            "mock": {"duration_s": duration, "delay_s": delay, "steps": mock.steps},
+            "latency": asyncio.run(_latency(mock, sizes, repeat)) if sizes else {},
+            "load": {"tours": load_tours},
+        }
+        mock.tours = load_tours
+        mock.snapshots(load_tours)
+        servers = {
+            "api": (["api:app"], _api_call),
+            "mcp": (["--factory", "mcp_http:build_app"], _mcp_call),
+        }
+        for name in targets:
+            target, make_call = servers[name]
+            port = _free_port()
+            proc = _serve(target, port, env)
+            try:
+                call = make_call(f"http://127.0.0.1:{port}")
+                report["load"][name] = asyncio.run(_load(call, concurrency, requests))
+            finally:
+                proc.terminate()
+                proc.wait(timeout=10)
+        report["mock"]["counts"] = dict(mock.counts)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000,50000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--load-tours", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=0.5, help="секунд до state=finished у mock")
+    parser.add_argument("--delay", type=float, default=0.0, help="задержка ответа modresult у mock, с")
+    parser.add_argument("--payload", default="", help="JSON-файл с записанным ответом modresult")
+    parser.add_argument("--targets", default="api,mcp", help="api,mcp или пусто — только latency")
+    parser.add_argument("--out", default="", help="куда записать JSON-отчёт")
+    args = parser.parse_args()
+    report = run(
+        [int(x) for x in args.sizes.split(",") if x.strip()],
+        repeat=args.repeat,
+        load_tours=args.load_tours,
+        concurrency=args.concurrency,
+        requests=args.requests,
+        duration=args.duration,
+        delay=args.delay,
+        payload_path=args.payload,
+        targets=[x for x in args.targets.split(",") if x.strip()],
+    )
+    emit(report, args.out)
+
+
+if __name__ == "__main__":
+    main()
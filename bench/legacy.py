@@ -0,0 +1,149 @@
+"""Исходная (до однопроходной) версия _normalize_result — эталон для bench.normalize."""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+from config import settings
+from eto_client import (
+    _block_hotel_ids,
+    _ensure_hotels,
+    _get_meal_names,
+    _get_operator_names,
+    _get_room_names,
+    _to_date,
+    _to_int,
+)
+from hotel_directory import hotel_directory, hotel_from_item
+
+
+def normalize_result(
+    raw: Dict[str, Any],
+    country_id: Optional[int],
+    session: Optional[str],
+    referrer: Optional[str],
+    refresh_hotels: bool = False,
+) -> list[Dict[str, Any]]:
+    data = raw.get("data", raw)
+    if not isinstance(data, dict):
+        return []
+
+    block = data.get("block")
+    if not isinstance(block, list):
+        return []
+
+    # Prefer in-response dictionaries (they often contain full names)
+    hotel_dict: Dict[str, Any] = {}
+    if isinstance(data.get("hotels"), dict):
+        hotel_dict = data.get("hotels") or {}
+    elif isinstance(data.get("hotel"), dict):
+        maybe = data.get("hotel") or {}
+        if all(isinstance(v, dict) for v in maybe.values()):
+            hotel_dict = maybe
+
+    if not hotel_dict:
+        # Try treating top-level dict as hotels map: keep only numeric keys with hotel-like fields
+        filtered: Dict[str, Any] = {}
+        for k, v in data.items():
+            if not isinstance(k, str) or not k.isdigit():
+                continue
+            if not isinstance(v, dict) or "name" not in v:
+                continue
+            if "countrycode" in v or "stars" in v or "region" in v or "link" in v:
+                filtered[k] = v
+        if filtered:
+            hotel_dict = filtered
+
+    room_dict = data.get("rooms") if isinstance(data.get("rooms"), dict) else {}
+    meal_dict = data.get("meal") if isinstance(data.get("meal"), dict) else {}
+
+    op_dict: Dict[int, str] = {}
+    ops = data.get("operators")
+    if isinstance(ops, list):
+        for o in ops:
+            if isinstance(o, dict) and o.get("id") is not None:
+                try:
+                    op_dict[int(o["id"])] = str(o.get("name") or "").strip() or None
+                except Exception:
+                    continue
+
+    # Fallback to list endpoints if needed
+    hotel_names: Dict[int, str] = {}
+    if hotel_dict:
+        # Отели из ответа пополняют справочник на диске (пишутся только изменения)
+        seen_hotels = [hotel_from_item(k, v, country_id) for k, v in hotel_dict.items() if isinstance(v, dict)]
+        hotel_directory.upsert(info for info in seen_hotels if info)
+    else:
+        _ensure_hotels(country_id, session=session, referrer=referrer, force_refresh=refresh_hotels)
+        hotel_names = {hid: info.name for hid, info in hotel_directory.lookup(_block_hotel_ids(block)).items()}
+    meal_names = _get_meal_names() if not meal_dict else {}
+    room_names = _get_room_names() if not room_dict else {}
+    op_names = _get_operator_names() if not op_dict else {}
+
+    tours: list[Dict[str, Any]] = []
+    for b in block:
+        hotels = b.get("hotel") if isinstance(b, dict) else None
+        if hotels is None:
+            continue
+        if isinstance(hotels, dict):
+            hotels = [hotels]
+        if not isinstance(hotels, list):
+            continue
+        for h in hotels:
+            if not isinstance(h, dict):
+                continue
+            hotel_id = h.get("hotelid") or h.get("id")
+            tours_list = h.get("tour")
+            if tours_list is None:
+                continue
+            if isinstance(tours_list, dict):
+                tours_list = [tours_list]
+            if not isinstance(tours_list, list):
+                continue
+            for t in tours_list:
+                if not isinstance(t, dict):
+                    continue
+                price = _to_int(t.get("price") or t.get("pr"))
+                if price is None:
+                    continue
+                tours.append(
+                    {
+                        "hotel_id": _to_int(hotel_id),
+                        "hotel_name": (
+                            (hotel_dict.get(str(hotel_id)) or {}).get("name")
+                            if hotel_dict and hotel_id is not None
+                            else (hotel_names.get(_to_int(hotel_id)) or f"Hotel {hotel_id}") if _to_int(hotel_id) else None
+                        ),
+                        "hotel": (
+                            (hotel_dict.get(str(hotel_id)) or {}).get("name")
+                            if hotel_dict and hotel_id is not None
+                            else (hotel_names.get(_to_int(hotel_id)) or f"Hotel {hotel_id}") if _to_int(hotel_id) else f"Hotel {hotel_id}"
+                        ),
+                        "hotel_link": (
+                            settings.hotel_link_base + str((hotel_dict.get(str(hotel_id)) or {}).get("link"))
+                            if hotel_dict and hotel_id is not None and (hotel_dict.get(str(hotel_id)) or {}).get("link")
+                            else None
+                        ),
+                        "operator": _to_int(t.get("operator") or t.get("op")),
+                        "operator_name": (
+                            op_dict.get(_to_int(t.get("operator") or t.get("op")))
+                            if _to_int(t.get("operator") or t.get("op")) is not None
+                            else op_names.get(_to_int(t.get("operator") or t.get("op")))
+                        ),
+                        "date": _to_date(t.get("date") or t.get("dt")),
+                        "nights": _to_int(t.get("nights") or t.get("nt")),
+                        "price": price,
+                        "room": _to_int(t.get("room") or t.get("rm")),
+                        "room_name": (
+                            (room_dict.get(str(_to_int(t.get("room") or t.get("rm")))) or {}).get("name")
+                            if room_dict and _to_int(t.get("room") or t.get("rm")) is not None
+                            else room_names.get(_to_int(t.get("room") or t.get("rm")))
+                        ),
+                        "meal": _to_int(t.get("meal") or t.get("ml")),
+                        "meal_name": (
+                            (meal_dict.get(str(_to_int(t.get("meal") or t.get("ml")))) or {}).get("name")
+                            if meal_dict and _to_int(t.get("meal") or t.get("ml")) is not None
+                            else meal_names.get(_to_int(t.get("meal") or t.get("ml")))
+                        ),
+                    }
+                )
+    return tours
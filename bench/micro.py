@@ -0,0 +1,65 @@
+"""Микробенчмарки горячего пути на ответах разного размера.
+
+    python -m bench.micro --sizes 100,1000,10000,50000 [--payload recorded.json] [--out micro.json]
+
+Для каждого размера: _normalize_result (dict и compact), _has_tour_data
+(по готовому и по «пустому» снимку — худший случай, полный проход) и
+_unique_hotels по нормализованным турам.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from typing import Any, Dict, List
+
+os.environ.setdefault("HOTEL_DB_PATH", ":memory:")
+
+from bench.normalize import best_of  # noqa: E402
+from bench.payloads import load_payload  # noqa: E402
+from bench.report import emit  # noqa: E402
+from eto_client import _has_tour_data, _normalize_result, _unique_hotels  # noqa: E402
+
+
+def _unpriced(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Тот же снимок без цен: _has_tour_data проходит его целиком."""
+    drop = ("price", "pr")
+    return json.loads(json.dumps(raw), object_hook=lambda d: {k: v for k, v in d.items() if k not in drop})
+
+
+def run_size(tours: int, payload_path: str = "", repeat: int = 5) -> Dict[str, Any]:
+    raw = load_payload(payload_path or None, tours)
+    args = dict(country_id=None, session=None, referrer=None)
+    normalized = _normalize_result(raw, **args)
+    empty = _unpriced(raw)
+    return {
+        "tours": len(normalized),
+        "normalize_result_s": best_of(repeat, lambda: _normalize_result(raw, **args)),
+        "normalize_result_compact_s": best_of(repeat, lambda: _normalize_result(raw, compact=True, **args)),
+        "has_tour_data_s": best_of(repeat, lambda: _has_tour_data(raw)),
+        "has_tour_data_unpriced_s": best_of(repeat, lambda: _has_tour_data(empty)),
+        "unique_hotels_s": best_of(repeat, lambda: _unique_hotels(normalized)),
+    }
+
+
+def run(sizes: List[int], payload_path: str = "", repeat: int = 5) -> Dict[str, Any]:
+    return {
+        "benchmark": "micro",
+        "repeat": repeat,
+        "results": {str(size): run_size(size, payload_path, repeat) for size in sizes},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000,50000")
+    parser.add_argument("--payload", default="", help="JSON-файл с записанным ответом modresult")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", default="", help="куда записать JSON-отчёт")
+    args = parser.parse_args()
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    emit(run(sizes, args.payload, args.repeat), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Локальный заменитель Tourvisor для бенчмарков.
+
+    python -m bench.mock_server --port 8799 --tours 5000 --duration 2 --delay 0.05
+
+modsearch.php выдаёт requestid, modresult.php — накопительные снимки: за
+duration секунд с момента modsearch блоки data.block дописываются по одному
+шагу из steps, затем state=finished. delay — задержка каждого ответа
+modresult. listdev.php и list*.php отдают справочники под синтетический ответ.
+Вместо синтетики можно подставить записанный ответ (--payload, см. bench.record).
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from bench.payloads import _MEALS, _OPERATORS, _ROOMS, load_payload
+
+COUNTRIES = [{"id": 4, "name": "Турция"}, {"id": 1, "name": "Египет"}, {"id": 9, "name": "ОАЭ"}]
+DEPARTURES = [{"id": 1, "name": "Москва"}, {"id": 5, "name": "Санкт-Петербург"}]
+
+
+class MockTourvisor:
+    """HTTP-сервер в фоновом потоке; tours/duration/delay можно менять между прогонами."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        tours: int = 1000,
+        duration: float = 1.0,
+        delay: float = 0.0,
+        steps: int = 5,
+        payload_path: str = "",
+    ) -> None:
+        self.tours = tours
+        self.duration = duration
+        self.delay = delay
+        self.steps = max(1, steps)
+        self.payload_path = payload_path
+        self.counts: Dict[str, int] = {"modsearch": 0, "modresult": 0, "list": 0}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(10 ** 8)
+        self._started: Dict[str, Tuple[float, int]] = {}
+        self._snapshots: Dict[int, List[bytes]] = {}
+        self._payloads: Dict[int, Dict[str, Any]] = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> Dict[str, str]:
+        """Переменные окружения, направляющие eto_client на этот сервер."""
+        base = self.url
+        return {
+            "MODSEARCH_URL": f"{base}/xml/modsearch.php",
+            "MODRESULT_URL": f"{base}/modresult.php",
+            "LISTCOUNTRY_URL": f"{base}/xml/listcountry.php",
+            "LISTDEP_URL": f"{base}/xml/listdep.php",
+            "LISTHOTEL_URL": f"{base}/xml/listhotel.php",
+            "LISTMEAL_URL": f"{base}/xml/listmeal.php",
+            "LISTROOM_URL": f"{base}/xml/listroom.php",
+            "LISTOPERATOR_URL": f"{base}/xml/listoperator.php",
+            "LISTDEV_URL": f"{base}/xml/listdev.php",
+        }
+
+    def start(self) -> "MockTourvisor":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-tourvisor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockTourvisor":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def payload(self, tours: int) -> Dict[str, Any]:
+        with self._lock:
+            if tours not in self._payloads:
+                self._payloads[tours] = load_payload(self.payload_path or None, tours)
+            return self._payloads[tours]
+
+    def snapshots(self, tours: int) -> List[bytes]:
+        """Заранее сериализованные снимки: шаг i — первые i/steps блоков."""
+        with self._lock:
+            cached = self._snapshots.get(tours)
+        if cached is not None:
+            return cached
+        raw = self.payload(tours)
+        data = raw.get("data", raw)
+        blocks = data.get("block") or []
+        out = []
+        for step in range(1, self.steps + 1):
+            visible = blocks[:math.ceil(len(blocks) * step / self.steps)]
+            snap = dict(data)
+            snap["block"] = visible
+            found = sum(len(h.get("tour") or []) for b in visible for h in b.get("hotel") or [])
+            snap["status"] = {
+                "state": "finished" if step == self.steps else "searching",
+                "progress": int(step * 100 / self.steps),
+                "hotelsfound": sum(len(b.get("hotel") or []) for b in visible),
+                "toursfound": found,
+            }
+            out.append(json.dumps({"data": snap}, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            self._snapshots[tours] = out
+        return out
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def _modsearch(self) -> Dict[str, Any]:
+        self._count("modsearch")
+        request_id = str(next(self._ids))
+        with self._lock:
+            self._started[request_id] = (time.monotonic(), self.tours)
+        return {"result": {"requestid": request_id}}
+
+    def _modresult(self, request_id: str) -> bytes:
+        self._count("modresult")
+        if self.delay > 0:
+            time.sleep(self.delay)
+        with self._lock:
+            started, tours = self._started.get(request_id, (time.monotonic(), self.tours))
+        snaps = self.snapshots(tours)
+        fraction = 1.0 if self.duration <= 0 else (time.monotonic() - started) / self.duration
+        step = min(len(snaps), max(1, math.ceil(fraction * len(snaps))))
+        return snaps[step - 1]
+
+    def _list(self, path: str) -> Dict[str, Any]:
+        self._count("list")
+        if path.endswith("listcountry.php"):
+            return {"country": COUNTRIES}
+        if path.endswith("listdep.php"):
+            return {"departure": DEPARTURES}
+        if path.endswith("listmeal.php"):
+            return {"meal": [{"id": int(k), "name": v["name"]} for k, v in _MEALS.items()]}
+        if path.endswith("listroom.php"):
+            return {"room": [{"id": int(k), "name": v["name"]} for k, v in _ROOMS.items()]}
+        if path.endswith("listoperator.php"):
+            return {"operator": [{"id": int(o["id"]), "name": o["name"]} for o in _OPERATORS]}
+        if path.endswith("listdev.php"):
+            hotels = self.payload(self.tours).get("data", {}).get("hotels") or {}
+            items = [{"id": int(k), **v} for k, v in hotels.items()]
+            return {"lists": {"hotels": {"hotel": items}}}
+        return {}
+
+    def _handler(self) -> type:
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if url.path.endswith("modsearch.php"):
+                    body = json.dumps(mock._modsearch()).encode("utf-8")
+                elif url.path.endswith("modresult.php"):
+                    body = mock._modresult(query.get("requestid", ""))
+                elif url.path == "/_counts":
+                    body = json.dumps(mock.counts).encode("utf-8")
+                else:
+                    body = json.dumps(mock._list(url.path), ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--tours", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=1.0, help="секунд до state=finished")
+    parser.add_argument("--delay", type=float, default=0.0, help="задержка ответа modresult, с")
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--payload", default="", help="JSON-файл с записанным ответом modresult")
+    args = parser.parse_args()
+    mock = MockTourvisor(args.host, args.port, args.tours, args.duration, args.delay, args.steps, args.payload)
+    for key, value in mock.env().items():
+        print(f"{key}={value}")
+    try:
+        mock._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Микробенчмарк _normalize_result: однопроходная версия против исходной.
+
+    python -m bench.normalize --tours 10000 [--payload recorded.json] [--repeat 5]
+
+Печатает JSON-отчёт (лучшее время из repeat прогонов) и проверяет, что обе
+версии дают одинаковый результат.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from typing import Any, Callable, Dict
+
+os.environ.setdefault("HOTEL_DB_PATH", ":memory:")
+
+from bench.legacy import normalize_result as legacy_normalize  # noqa: E402
+from bench.payloads import load_payload  # noqa: E402
+from eto_client import _normalize_result  # noqa: E402
+
+
+def best_of(repeat: int, fn: Callable[[], Any]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(tours: int, payload_path: str = "", repeat: int = 5) -> Dict[str, Any]:
+    raw = load_payload(payload_path or None, tours)
+    args = dict(country_id=None, session=None, referrer=None)
+    new = _normalize_result(raw, **args)
+    old = legacy_normalize(raw, **args)
+    report: Dict[str, Any] = {
+        "benchmark": "normalize_result",
+        "tours": len(new),
+        "same_output": new == old,
+        "legacy_s": best_of(repeat, lambda: legacy_normalize(raw, **args)),
+        "dict_s": best_of(repeat, lambda: _normalize_result(raw, **args)),
+        "compact_s": best_of(repeat, lambda: _normalize_result(raw, compact=True, **args)),
+    }
+    report["speedup_dict"] = round(report["legacy_s"] / report["dict_s"], 2)
+    report["speedup_compact"] = round(report["legacy_s"] / report["compact_s"], 2)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tours", type=int, default=10000)
+    parser.add_argument("--payload", default="", help="JSON-файл с записанным ответом modresult")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.tours, args.payload, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Синтетические ответы modresult для бенчмарков."""
+from __future__ import annotations
+
+import json
+import random
+from typing import Any, Dict, Optional
+
+_ROOMS = {"30": {"name": "standard"}, "31": {"name": "superior"}, "32": {"name": "family"}}
+_MEALS = {"1": {"name": "RO"}, "3": {"name": "BB"}, "5": {"name": "HB"}, "7": {"name": "AI"}}
+_OPERATORS = [{"id": str(i), "name": f"Operator {i}"} for i in range(1, 21)]
+
+
+def modresult_payload(
+    tours: int,
+    tours_per_hotel: int = 10,
+    seed: int = 1,
+    with_dicts: bool = True,
+    state: str = "finished",
+) -> Dict[str, Any]:
+    """Ответ modresult с ~tours турами (data.block[].hotel[].tour[])."""
+    rnd = random.Random(seed)
+    n_hotels = max(1, tours // tours_per_hotel)
+    hotels = []
+    hotel_dict: Dict[str, Any] = {}
+    left = tours
+    for i in range(n_hotels):
+        hid = str(10000 + i)
+        count = tours_per_hotel if i < n_hotels - 1 else left
+        left -= count
+        hotels.append(
+            {
+                "hotelid": hid,
+                "tour": [
+                    {
+                        "price": str(40000 + rnd.randint(0, 200000)),
+                        "operator": rnd.choice(_OPERATORS)["id"],
+                        "date": f"2026-07-{rnd.randint(1, 28):02d}",
+                        "nights": str(rnd.choice((7, 8, 9, 10, 11, 12, 14))),
+                        "room": rnd.choice(list(_ROOMS)),
+                        "meal": rnd.choice(list(_MEALS)),
+                    }
+                    for _ in range(count)
+                ],
+            }
+        )
+        hotel_dict[hid] = {
+            "name": f"HOTEL {i}",
+            "link": f"hotel-{i}",
+            "stars": str(rnd.randint(2, 5)),
+            "region": f"Region {i % 12}",
+        }
+    data: Dict[str, Any] = {
+        "status": {"state": state, "hotelsfound": n_hotels, "toursfound": tours, "progress": 100},
+        "block": [{"hotel": hotels[k:k + 50]} for k in range(0, len(hotels), 50)],
+    }
+    if with_dicts:
+        data.update({"hotels": hotel_dict, "rooms": _ROOMS, "meal": _MEALS, "operators": _OPERATORS})
+    return {"data": data}
+
+
+def load_payload(path: Optional[str], tours: int) -> Dict[str, Any]:
+    """Записанный ответ modresult из файла или синтетический на tours туров."""
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return modresult_payload(tours)
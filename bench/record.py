@@ -0,0 +1,62 @@
+"""Запись реального ответа modresult для воспроизведения в бенчмарках.
+
+    python -m bench.record --country Турция --city-from Москва --nights 7 --out recorded.json
+
+Выполняет обычный поиск с текущими настройками (.env / окружение) и
+сохраняет последний снимок modresult с турами как есть. Файл принимают
+bench.micro, bench.e2e и bench.mock_server через --payload.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, Dict
+
+from eto_client import _prepare_search, _run_search, aclose_clients
+
+
+async def record(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """{"success", "requestid", "data"} — data в формате ответа modresult."""
+    try:
+        ctx = await _prepare_search(payload)
+        if not ctx.get("success"):
+            return ctx
+        return await _run_search(ctx)
+    finally:
+        await aclose_clients()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--country", required=True)
+    parser.add_argument("--city-from", required=True)
+    parser.add_argument("--nights", type=int, default=7)
+    parser.add_argument("--adults", type=int, default=2)
+    parser.add_argument("--date-from", default="")
+    parser.add_argument("--date-to", default="")
+    parser.add_argument("--out", required=True, help="куда сохранить снимок modresult")
+    args = parser.parse_args()
+    payload = {
+        "country": args.country,
+        "city_from": args.city_from,
+        "nights": args.nights,
+        "adults": args.adults,
+    }
+    if args.date_from:
+        payload["date_from"] = args.date_from
+    if args.date_to:
+        payload["date_to"] = args.date_to
+    result = asyncio.run(record(payload))
+    if not result.get("success"):
+        print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+        sys.exit(1)
+    data = result["data"]
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(data if "data" in data else {"data": data}, f, ensure_ascii=False)
+    print(f"requestid={result['requestid']} -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
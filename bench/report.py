@@ -0,0 +1,86 @@
+"""Общий формат JSON-отчётов бенчмарков и сравнение двух прогонов.
+
+    python -m bench.report before.json after.json
+
+Сравниваются числовые поля с одинаковым путём: для времени (*_s, *_ms)
+ratio < 1 — стало быстрее, для пропускной способности (*rps) — ratio > 1.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Iterator, Tuple
+
+
+def meta() -> Dict[str, Any]:
+    """Окружение прогона, чтобы отчёты можно было сравнивать."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    import jsonutil
+
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "commit": commit,
+        "json_backend": jsonutil.backend,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def emit(report: Dict[str, Any], out: str = "") -> None:
+    """Печатает отчёт (с meta) и, если задан out, пишет его в файл."""
+    report = {**report, "meta": meta()}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+def _numbers(node: Any, path: str = "") -> Iterator[Tuple[str, float]]:
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key != "meta":
+                yield from _numbers(value, f"{path}.{key}" if path else str(key))
+    elif isinstance(node, list):
+        for i, value in enumerate(node):
+            yield from _numbers(value, f"{path}[{i}]")
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield path, float(node)
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """{путь: {before, after, ratio}} для метрик времени и пропускной способности."""
+    old = dict(_numbers(before))
+    out: Dict[str, Dict[str, float]] = {}
+    for path, value in _numbers(after):
+        leaf = path.rsplit(".", 1)[-1]
+        if path not in old or not (leaf.endswith(("_s", "_ms")) or leaf.endswith("rps")):
+            continue
+        ratio = value / old[path] if old[path] else float("inf")
+        out[path] = {"before": old[path], "after": value, "ratio": round(ratio, 3)}
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    print(json.dumps(compare(before, after), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Бенчмарк выдачи search_tours: «нормализовать всё → _unique_hotels → срез»
+против отбора победителей по сырым турам (_normalize_result с limit).
+
+    python -m bench.select --tours 10000 --limit 20 [--sort price]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tracemalloc
+from typing import Any, Dict
+
+os.environ.setdefault("HOTEL_DB_PATH", ":memory:")
+
+from bench.normalize import best_of  # noqa: E402
+from bench.payloads import load_payload  # noqa: E402
+from eto_client import _normalize_result, _unique_hotels  # noqa: E402
+
+
+def _peak_kib(fn: Any) -> int:
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak // 1024
+
+
+def run(tours: int, limit: int = 20, sort: str = "price", payload_path: str = "", repeat: int = 5) -> Dict[str, Any]:
+    raw = load_payload(payload_path or None, tours)
+    args = dict(country_id=None, session=None, referrer=None)
+
+    def build_all() -> list:
+        out = sorted(_unique_hotels(_normalize_result(raw, **args)), key=lambda t: t["price"])
+        return out[:limit]
+
+    def fused() -> list:
+        return _normalize_result(raw, limit=limit, unique_hotels=True, sort=sort, **args)
+
+    report: Dict[str, Any] = {
+        "benchmark": "select_top_n",
+        "tours": tours,
+        "limit": limit,
+        "sort": sort,
+        "build_all_s": best_of(repeat, build_all),
+        "fused_s": best_of(repeat, fused),
+        "build_all_peak_kib": _peak_kib(build_all),
+        "fused_peak_kib": _peak_kib(fused),
+    }
+    if sort == "price":
+        report["same_prices"] = [t["price"] for t in build_all()] == [t["price"] for t in fused()]
+    report["speedup"] = round(report["build_all_s"] / report["fused_s"], 2)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tours", type=int, default=10000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--sort", default="price")
+    parser.add_argument("--payload", default="", help="JSON-файл с записанным ответом modresult")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.tours, args.limit, args.sort, args.payload, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
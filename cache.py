@@ -0,0 +1,428 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import jsonutil
+import metrics
+from config import settings
+
+# Префикс аренды ключа (SearchCache._lease); такие записи не вытесняются по max_size
+LEASE_PREFIX = "lease:"
+
+# Поля, не влияющие на выдачу Tourvisor: разные пользователи с разными
+# session/referrer должны попадать в один ключ.
+_KEY_IGNORED = {"session", "referrer"}
+
+
+def search_key(normalized: Dict[str, Any]) -> str:
+    """Канонический ключ нормализованного запроса (_normalize_payload)."""
+    items = {
+        k: v for k, v in normalized.items()
+        if k not in _KEY_IGNORED and not k.startswith("__")
+    }
+    raw = json.dumps(items, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _encode(value: Any) -> bytes:
+    """Значение для общих бэкендов: JSON (dict/list/str/числа), ключи словарей — строки."""
+    return jsonutil.dumps(value).encode("utf-8")
+
+
+def _decode(raw: Any) -> Optional[Any]:
+    try:
+        return jsonutil.loads(bytes(raw))
+    except Exception:
+        # испорченная запись или старая pickle-запись — промах
+        return None
+
+
+class CacheBackend:
+    """Хранилище ключ → значение с TTL (секунды, <= 0 — без срока)."""
+
+    name = "base"
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        """Записывает, только если ключа нет (или он истёк); True — записано."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """LRU в памяти процесса; max_size <= 0 — без ограничения размера."""
+
+    name = "memory"
+
+    def __init__(self, max_size: int = 0) -> None:
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires and expires < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._items[key] = (time.time() + ttl if ttl > 0 else 0.0, value)
+            self._items.move_to_end(key)
+            while self.max_size > 0 and len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and not (item[0] and item[0] < time.time()):
+                return False
+            self._items[key] = (time.time() + ttl if ttl > 0 else 0.0, value)
+            self._items.move_to_end(key)
+            while self.max_size > 0 and len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+class SQLiteBackend(CacheBackend):
+    """Файловый кэш, общий для всех процессов на машине (WAL, значения — JSON).
+
+    Не pickle: файл общий, и запись в него не должна давать выполнить код в воркерах.
+    """
+
+    name = "sqlite"
+    _PRUNE_EVERY = 200
+
+    def __init__(self, path: str, table: str = "cache", max_size: int = 0) -> None:
+        if not table.isidentifier():
+            raise ValueError(f"Некорректное имя таблицы: {table}")
+        self.path = path
+        self.table = table
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, expires REAL NOT NULL, value BLOB NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT expires, value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        expires, value = row
+        if expires and expires < time.time():
+            return None
+        return _decode(value)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        blob = _encode(value)
+        expires = time.time() + ttl if ttl > 0 else 0.0
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, expires, value) VALUES (?, ?, ?)",
+                (key, expires, sqlite3.Binary(blob)),
+            )
+            self._writes += 1
+            if self._writes % self._PRUNE_EVERY == 0:
+                self._prune()
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        blob = _encode(value)
+        now = time.time()
+        expires = now + ttl if ttl > 0 else 0.0
+        with self._lock:
+            cur = self._conn.execute(
+                f"INSERT INTO {self.table} (key, expires, value) VALUES (?, ?, ?) "
+                f"ON CONFLICT(key) DO UPDATE SET expires = excluded.expires, value = excluded.value "
+                f"WHERE {self.table}.expires > 0 AND {self.table}.expires < ?",
+                (key, expires, sqlite3.Binary(blob), now),
+            )
+            return cur.rowcount > 0
+
+    def _prune(self) -> None:
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires > 0 AND expires < ?", (time.time(),))
+        if self.max_size > 0:
+            # аренды живут по своему TTL: вытеснить чужую — запустить второй одинаковый поиск
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key NOT LIKE ? AND key NOT IN "
+                f"(SELECT key FROM {self.table} WHERE key NOT LIKE ? ORDER BY expires DESC LIMIT ?)",
+                (LEASE_PREFIX + "%", LEASE_PREFIX + "%", self.max_size),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+
+class RedisBackend(CacheBackend):
+    """Redis (или совместимый: KeyDB, Valkey, Dragonfly); нужен пакет redis."""
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str) -> None:
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis требует пакет redis (pip install redis)") from e
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._client.get(self.prefix + key)
+        if value is None:
+            return None
+        return _decode(value)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        blob = _encode(value)
+        if ttl > 0:
+            self._client.set(self.prefix + key, blob, px=int(ttl * 1000))
+        else:
+            self._client.set(self.prefix + key, blob)
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        blob = _encode(value)
+        return bool(self._client.set(self.prefix + key, blob, px=int(ttl * 1000) if ttl > 0 else None, nx=True))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(self.prefix + key)
+
+    def clear(self) -> None:
+        keys = list(self._client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self._client.delete(*keys)
+
+
+def make_backend(kind: str, namespace: str, max_size: int = 0) -> CacheBackend:
+    """Бэкенд по имени из CACHE_BACKEND: memory | sqlite | redis.
+
+    namespace разделяет хранилища (таблица SQLite, префикс ключей Redis),
+    чтобы вытеснение в одном не задевало другое.
+    """
+    kind = (kind or "memory").strip().lower()
+    if kind == "sqlite":
+        return SQLiteBackend(os.path.expanduser(settings.cache_path), table=namespace, max_size=max_size)
+    if kind == "redis":
+        return RedisBackend(settings.redis_url, f"{settings.cache_prefix}{namespace}:")
+    if kind != "memory":
+        raise RuntimeError(f"Неизвестный CACHE_BACKEND: {kind}")
+    return MemoryBackend(max_size=max_size)
+
+
+class SingleFlight:
+    """Склеивает одновременные вызовы с одинаковым ключом в одну задачу."""
+
+    def __init__(self) -> None:
+        self._tasks: Dict[str, "asyncio.Task[Any]"] = {}
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(key)
+        # Задача из другого loop (sync-обёртка в своём asyncio.run) не подходит
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        # shield: отмена одного ожидающего не отменяет поиск для остальных
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: "asyncio.Task[Any]") -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    def __contains__(self, key: str) -> bool:
+        task = self._tasks.get(key)
+        return task is not None and not task.done()
+
+
+class ThreadSingleFlight:
+    """SingleFlight для синхронного кода в потоках: один fn() на ключ, остальные ждут его результата."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, "Future[Any]"] = {}
+
+    def run(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class SearchCache:
+    """Кэш результатов поиска по нормализованному запросу + single-flight.
+
+    Успешные результаты живут SEARCH_CACHE_TTL секунд, ошибки не кэшируются,
+    но одновременные одинаковые запросы всё равно делят один modsearch и один
+    цикл опроса modresult. Ещё stale_ttl секунд после срока результат доступен
+    через get_stale — на случай, когда Tourvisor не отвечает.
+
+    Если бэкенд общий для процессов (sqlite, redis), склейка работает и между
+    воркерами: поиск запускает тот, кто взял аренду ключа (backend.add), остальные
+    ждут его результата в кэше не дольше lease_ttl.
+    """
+
+    _LEASE_POLL = 0.2
+
+    def __init__(
+        self, backend: CacheBackend, ttl: float, max_size: int, stale_ttl: float = 0, lease_ttl: float = 0
+    ) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = max(0.0, stale_ttl)
+        self.max_size = max_size
+        self.lease_ttl = lease_ttl
+        self.inflight = SingleFlight()
+
+    @property
+    def shared(self) -> bool:
+        return self.backend.name != "memory" and self.lease_ttl > 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+
+    def _entry(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        entry = self.backend.get(key)
+        return entry if isinstance(entry, dict) and "stored" in entry else None
+
+    def _fresh(self, key: str) -> bool:
+        entry = self._entry(key)
+        return entry is not None and entry["stored"] + self.ttl >= time.time()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entry(key)
+        if entry is None or entry["stored"] + self.ttl < time.time():
+            if self.enabled:
+                metrics.cache_requests.inc(cache="search", result="miss")
+            return None
+        metrics.cache_requests.inc(cache="search", result="hit")
+        return entry["result"]
+
+    def get_stale(self, key: str) -> Optional[Dict[str, Any]]:
+        """Результат, даже если SEARCH_CACHE_TTL уже истёк (в пределах stale_ttl)."""
+        entry = self._entry(key)
+        if entry is None:
+            return None
+        metrics.cache_requests.inc(cache="search", result="stale")
+        return entry["result"]
+
+    def set(self, key: str, result: Dict[str, Any]) -> None:
+        if self.enabled and result.get("success"):
+            self.backend.set(key, {"stored": time.time(), "result": result}, self.ttl + self.stale_ttl)
+
+    async def get_or_run(
+        self, key: str, factory: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        async def run() -> Dict[str, Any]:
+            if self.shared:
+                leased = await self._lease(key)
+                if not leased:
+                    # Результат другого воркера; если его нет (поиск упал, аренда истекла) — ищем сами
+                    cached = self.get(key)
+                    if cached is not None:
+                        return cached
+            else:
+                leased = False
+            try:
+                result = await factory()
+                self.set(key, result)
+                return result
+            finally:
+                if leased:
+                    self.backend.delete(f"{LEASE_PREFIX}{key}")
+
+        return await self.inflight.run(key, run)
+
+    async def _lease(self, key: str) -> bool:
+        """Ждёт аренду ключа: True — поиск наш; False — готов свежий результат или аренда не освободилась за lease_ttl."""
+        lease = f"{LEASE_PREFIX}{key}"
+        deadline = time.monotonic() + self.lease_ttl
+        while True:
+            if self.backend.add(lease, os.getpid(), self.lease_ttl):
+                if not self._fresh(key):
+                    return True
+                # Аренду только что отпустили вместе с готовым результатом
+                self.backend.delete(lease)
+                return False
+            if self._fresh(key):
+                return False
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(self._LEASE_POLL)
+
+
+# Справочники (страны, города, питание, отели...) — без ограничения размера;
+# результаты поиска — LRU на SEARCH_CACHE_SIZE записей.
+list_cache = make_backend(settings.cache_backend, "lists")
+search_cache = SearchCache(
+    make_backend(settings.cache_backend, "search", max_size=settings.search_cache_size),
+    settings.search_cache_ttl,
+    settings.search_cache_size,
+    settings.search_stale_ttl,
+    settings.search_lease_ttl,
+)
@@ -14,10 +14,22 @@ def _json_env(name: str, default: Optional[Dict[str, str]] = None) -> Dict[str,
         return default or {}
 
 
+def _bool_env(name: str, default: bool) -> bool:
+    raw = os.environ.get(name)
+    if raw is None or not raw.strip():
+        return default
+    return raw.strip().lower() not in ("0", "false", "no", "off")
+
+
 @dataclass(frozen=True)
 class Settings:
     modsearch_url: str = os.environ.get("MODSEARCH_URL", "").strip()
     modresult_url: str = os.environ.get("MODRESULT_URL", "").strip()
+    modresult_shard_template: str = os.environ.get(
+        "MODRESULT_SHARD_TEMPLATE", "https://search{shard}.tourvisor.ru/modresult.php"
+    ).strip()
+    shard_keys: str = os.environ.get("SHARD_KEYS", "server,host,searchserver,resulthost").strip()
+    shard_ttl: int = int(os.environ.get("SHARD_TTL", "3600"))
     listcountry_url: str = os.environ.get("LISTCOUNTRY_URL", "https://tourvisor.ru/xml/listcountry.php").strip()
     listdep_url: str = os.environ.get("LISTDEP_URL", "https://tourvisor.ru/xml/listdep.php").strip()
     listhotel_url: str = os.environ.get("LISTHOTEL_URL", "https://tourvisor.ru/xml/listhotel.php").strip()
@@ -34,8 +46,71 @@ class Settings:
     request_timeout: int = int(os.environ.get("REQUEST_TIMEOUT", "30"))
     poll_interval: float = float(os.environ.get("POLL_INTERVAL", "2.0"))
     poll_attempts: int = int(os.environ.get("POLL_ATTEMPTS", "25"))
+    poll_min_interval: float = float(os.environ.get("POLL_MIN_INTERVAL", "0.5"))
+    poll_max_interval: float = float(os.environ.get("POLL_MAX_INTERVAL", "6.0"))
+    poll_backoff: float = float(os.environ.get("POLL_BACKOFF", "1.6"))
+    poll_timeout: float = float(os.environ.get("POLL_TIMEOUT", "50"))
+    poll_good_enough_tours: int = int(os.environ.get("POLL_GOOD_ENOUGH_TOURS", "100"))
     max_tours: int = int(os.environ.get("MAX_TOURS", "20"))
+    batch_max_searches: int = int(os.environ.get("BATCH_MAX_SEARCHES", "20"))
+    batch_concurrency: int = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+    plan_date_span: int = int(os.environ.get("PLAN_DATE_SPAN", "7"))
+    plan_nights_span: int = int(os.environ.get("PLAN_NIGHTS_SPAN", "3"))
+    plan_max_searches: int = int(os.environ.get("PLAN_MAX_SEARCHES", "12"))
+    upstream_rate_limit: float = float(os.environ.get("UPSTREAM_RATE_LIMIT", "10"))
+    upstream_rate_burst: float = float(os.environ.get("UPSTREAM_RATE_BURST", "20"))
+    retry_attempts: int = int(os.environ.get("RETRY_ATTEMPTS", "2"))
+    retry_base_delay: float = float(os.environ.get("RETRY_BASE_DELAY", "0.3"))
+    retry_max_delay: float = float(os.environ.get("RETRY_MAX_DELAY", "3"))
+    breaker_threshold: int = int(os.environ.get("BREAKER_THRESHOLD", "5"))
+    breaker_reset: float = float(os.environ.get("BREAKER_RESET", "30"))
     list_cache_ttl: int = int(os.environ.get("LIST_CACHE_TTL", "21600"))
+    list_cache_jitter: float = float(os.environ.get("LIST_CACHE_JITTER", "0.1"))
+    list_cache_stale_ttl: int = int(os.environ.get("LIST_CACHE_STALE_TTL", "604800"))
+    list_prewarm: bool = _bool_env("LIST_PREWARM", True)
+    hotel_db_path: str = os.environ.get("HOTEL_DB_PATH", "~/.cache/eto-tours-mcp/hotels.sqlite3").strip()
+    hotel_db_mmap: int = int(os.environ.get("HOTEL_DB_MMAP", str(256 * 1024 * 1024)))
+    prewarm_hotel_countries: str = os.environ.get("PREWARM_HOTEL_COUNTRIES", "").strip()
+    search_cache_ttl: int = int(os.environ.get("SEARCH_CACHE_TTL", "600"))
+    search_cache_size: int = int(os.environ.get("SEARCH_CACHE_SIZE", "256"))
+    search_stale_ttl: int = int(os.environ.get("SEARCH_STALE_TTL", "3600"))
+    search_lease_ttl: float = float(os.environ.get("SEARCH_LEASE_TTL", "60"))
+    search_registry_ttl: int = int(os.environ.get("SEARCH_REGISTRY_TTL", "3600"))
+    search_registry_size: int = int(os.environ.get("SEARCH_REGISTRY_SIZE", "1024"))
+    watch_enabled: bool = _bool_env("WATCH_ENABLED", True)
+    watch_db_path: str = os.environ.get("WATCH_DB_PATH", "~/.cache/eto-tours-mcp/watches.sqlite3").strip()
+    watch_tick: float = float(os.environ.get("WATCH_TICK", "5"))
+    watch_concurrency: int = int(os.environ.get("WATCH_CONCURRENCY", "4"))
+    watch_jitter: float = float(os.environ.get("WATCH_JITTER", "0.1"))
+    watch_interval: float = float(os.environ.get("WATCH_INTERVAL", "3600"))
+    watch_min_interval: float = float(os.environ.get("WATCH_MIN_INTERVAL", "300"))
+    watch_min_drop: int = int(os.environ.get("WATCH_MIN_DROP", "0"))
+    watch_retention_days: float = float(os.environ.get("WATCH_RETENTION_DAYS", "30"))
+    delta_ttl: int = int(os.environ.get("DELTA_TTL", "1800"))
+    delta_max_requests: int = int(os.environ.get("DELTA_MAX_REQUESTS", "1024"))
+    tour_index_ttl: int = int(os.environ.get("TOUR_INDEX_TTL", "900"))
+    tour_index_max: int = int(os.environ.get("TOUR_INDEX_MAX", "32"))
+    tour_index_max_tours: int = int(os.environ.get("TOUR_INDEX_MAX_TOURS", "200000"))
+    cache_backend: str = os.environ.get("CACHE_BACKEND", "memory").strip()
+    cache_path: str = os.environ.get("CACHE_PATH", "~/.cache/eto-tours-mcp/cache.sqlite3").strip()
+    redis_url: str = os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/0").strip()
+    cache_prefix: str = os.environ.get("CACHE_PREFIX", "eto-tours:").strip()
+    json_backend: str = os.environ.get("JSON_BACKEND", "auto").strip()
+    mcp_json_indent: int = int(os.environ.get("MCP_JSON_INDENT", "0"))
+    mcp_host: str = os.environ.get("MCP_HOST", "0.0.0.0").strip()
+    mcp_port: int = int(os.environ.get("MCP_PORT", "8081"))
+    mcp_workers: int = int(os.environ.get("MCP_WORKERS", "1"))
+    shutdown_timeout: float = float(os.environ.get("SHUTDOWN_TIMEOUT", "60"))
+    log_file: str = os.environ.get("LOG_FILE", "~/eto-tours-mcp.log").strip()
+    log_level: str = os.environ.get("LOG_LEVEL", "info").strip().lower()
+    log_max_bytes: int = int(os.environ.get("LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+    log_backups: int = int(os.environ.get("LOG_BACKUPS", "5"))
+    log_queue_size: int = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+    log_sample: str = os.environ.get("LOG_SAMPLE", "modresult_poll=0.1,http_request=1").strip()
+    http2: bool = _bool_env("HTTP2", True)
+    http_max_connections: int = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+    http_max_keepalive: int = int(os.environ.get("HTTP_MAX_KEEPALIVE", "20"))
+    http_keepalive_expiry: float = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
 
 
 settings = Settings()
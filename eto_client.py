@@ -1,21 +1,49 @@
 from __future__ import annotations
 
+import asyncio
+import heapq
+import random
+import threading
 import time
-from typing import Any, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Dict, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple, TypeVar
 from xml.etree import ElementTree
 
 import httpx
 
+import filters
+import jsonutil
+import logs
+import metrics
+import planner
+import resolver
+import sessions
+from cache import ThreadSingleFlight, list_cache, search_cache, search_key
 from config import settings
-
-
-_COUNTRY_CACHE: Tuple[float, Dict[str, int]] = (0.0, {})
-_DEPARTURE_CACHE: Tuple[float, Dict[str, int]] = (0.0, {})
-_MEAL_CACHE: Tuple[float, Dict[int, str]] = (0.0, {})
-_ROOM_CACHE: Tuple[float, Dict[int, str]] = (0.0, {})
-_OP_CACHE: Tuple[float, Dict[int, str]] = (0.0, {})
-_HOTEL_CACHE: Dict[int, Tuple[float, Dict[int, str]]] = {}
-_LAST_AUTH: Dict[str, str] = {}
+from hotel_directory import HotelInfo, hotel_directory, hotel_from_item
+from polling import PollScheduler, read_progress
+from resilience import RETRY_STATUSES, breaker, rate_limiter, retry_delay
+from shards import shard_router
+from snapshots import SnapshotDiff, snapshot_diffs
+from storage import searches
+
+
+_CLIENT: Optional[httpx.Client] = None
+_CLIENT_LOCK = threading.Lock()
+# Пул соединений на хост (шарды modresult — отдельно), см. get_async_client
+_ASYNC_CLIENTS: Dict[str, httpx.AsyncClient] = {}
+# Клиент, привязанный к текущему event loop (см. _run_sync)
+_LOOP_CLIENT: ContextVar[Optional[httpx.AsyncClient]] = ContextVar("_LOOP_CLIENT", default=None)
+_T = TypeVar("_T")
+_REFRESH_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="list-refresh")
+_REFRESH_LOCK = threading.Lock()
+_REFRESHING: set = set()
+# Холодная загрузка справочника: одновременные промахи ждут одну загрузку
+_LIST_FLIGHT = ThreadSingleFlight()
+_LOCAL_OPTIONS = ("limit", "max", "unique_hotels", "refresh_hotels", "sort", "filter", "cursor", "requestid", "request_id")
+SORT_KEYS = ("price", "price_per_night", "date", "stars")
 _COUNTRY_FALLBACK = {
     "египет": 1,
     "турция": 4,
@@ -47,6 +75,13 @@ _DEPARTURE_FALLBACK = {
 }
 
 
+def _check_sort(sort: Any) -> Optional[Dict[str, Any]]:
+    """Ошибка для неизвестного sort (одна для search_tours, batch, flexible и delta); None — sort годится."""
+    if sort is not None and sort not in SORT_KEYS:
+        return {"success": False, "error": f"sort должен быть одним из: {', '.join(SORT_KEYS)}"}
+    return None
+
+
 def _extract_request_id(payload: Any) -> Optional[str]:
     if isinstance(payload, dict):
         if "result" in payload and isinstance(payload["result"], dict):
@@ -59,37 +94,276 @@ def _extract_request_id(payload: Any) -> Optional[str]:
     return None
 
 
-def _request(url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+def _http2_available() -> bool:
+    if not settings.http2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _client_kwargs() -> Dict[str, Any]:
+    return {
+        "timeout": settings.request_timeout,
+        "http2": _http2_available(),
+        "limits": httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        ),
+    }
+
+
+def get_client() -> httpx.Client:
+    """Общий на процесс httpx.Client с пулом keep-alive соединений."""
+    global _CLIENT
+    client = _CLIENT
+    if client is None or client.is_closed:
+        with _CLIENT_LOCK:
+            if _CLIENT is None or _CLIENT.is_closed:
+                _CLIENT = httpx.Client(**_client_kwargs())
+            client = _CLIENT
+    return client
+
+
+def close_client() -> None:
+    global _CLIENT
+    with _CLIENT_LOCK:
+        client, _CLIENT = _CLIENT, None
+    if client is not None:
+        client.close()
+
+
+def get_async_client(host: str = "") -> httpx.AsyncClient:
+    """Общий httpx.AsyncClient для долгоживущего event loop (API, MCP).
+
+    У каждого хоста (шарда modresult) свой клиент и свой пул соединений,
+    чтобы медленный шард не занимал соединения остальных.
+    """
+    client = _LOOP_CLIENT.get()
+    if client is not None:
+        return client
+    client = _ASYNC_CLIENTS.get(host)
+    if client is None or client.is_closed:
+        client = _ASYNC_CLIENTS[host] = httpx.AsyncClient(**_client_kwargs())
+    return client
+
+
+async def aclose_clients() -> None:
+    clients = list(_ASYNC_CLIENTS.values())
+    _ASYNC_CLIENTS.clear()
+    for client in clients:
+        await client.aclose()
+    close_client()
+
+
+def _run_sync(coro: Coroutine[Any, Any, _T]) -> _T:
+    """Выполняет корутину в отдельном event loop со своим AsyncClient.
+
+    Общие _ASYNC_CLIENTS привязаны к loop сервера, поэтому для asyncio.run
+    заводится временный клиент, который закрывается вместе с loop.
+    """
+
+    async def runner() -> _T:
+        async with httpx.AsyncClient(**_client_kwargs()) as client:
+            token = _LOOP_CLIENT.set(client)
+            try:
+                return await coro
+            finally:
+                _LOOP_CLIENT.reset(token)
+
+    return asyncio.run(runner())
+
+
+def _endpoint(url: str) -> str:
+    """Ключ лимитов и предохранителя: хост + путь (modsearch и modresult — раздельно)."""
+    parsed = httpx.URL(url)
+    return f"{parsed.host}{parsed.path}"
+
+
+def _rate_group(url: str) -> str:
+    """Ключ token bucket: шарды search*.tourvisor.ru делят лимит своего домена.
+
+    Предохранитель остаётся на _endpoint — отказ одного шарда не выключает
+    остальные, а лимит UPSTREAM_RATE_LIMIT не умножается на число шардов.
+    """
+    parsed = httpx.URL(url)
+    labels = parsed.host.split(".")
+    host = parsed.host if len(labels) <= 2 or labels[-1].isdigit() else ".".join(labels[-2:])
+    return f"{host}{parsed.path}"
+
+
+def _parse_response(endpoint: str, r: httpx.Response) -> Dict[str, Any]:
+    metrics.upstream_bytes.inc(len(r.content), endpoint=endpoint)
+    try:
+        data = jsonutil.loads(r.content)
+    except Exception:
+        data = {"raw_text": r.text}
+    return {"success": True, "data": data}
+
+
+def _unavailable(endpoint: str, error: str) -> Dict[str, Any]:
+    """Ошибка «Tourvisor сейчас не отвечает» — повод отдать устаревший кэш."""
+    return {"success": False, "error": error, "unavailable": True, "endpoint": endpoint}
+
+
+# Запрос до Tourvisor не дошёл: повторять безопасно даже modsearch
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class _UpstreamCall:
+    """Решения одного GET к Tourvisor, общие для _request и _arequest.
+
+    Предохранитель, расписание повторов (с Retry-After), разбор ответа и
+    метрики — здесь; вызывающий только ждёт паузы/токен и делает запрос.
+    finish() вызывается в finally: пробный запрос half-open, который так и
+    не получил исхода (отмена, исключение не из httpx), снова открывает цепь.
+
+    Неидемпотентный запрос (modsearch — каждый вызов запускает новый поиск)
+    повторяется только если Tourvisor его точно не получил или не принял:
+    ошибка соединения или 429. Таймаут чтения или 5xx сразу дают «недоступен».
+    """
+
+    def __init__(self, url: str, idempotent: bool = True) -> None:
+        self.endpoint = _endpoint(url)
+        self.rate_key = _rate_group(url)
+        self.idempotent = idempotent
+        self._admission = breaker.admit(self.endpoint)
+        self._settled = False
+        self._error = ""
+        self._retry_after: Optional[str] = None
+
+    def rejected(self) -> Optional[Dict[str, Any]]:
+        """Ответ без запроса, если предохранитель открыт."""
+        if self._admission != "open":
+            return None
+        metrics.upstream_errors.inc(endpoint=self.endpoint, kind="circuit_open")
+        logs.event("upstream_circuit_open", "warning", endpoint=self.endpoint)
+        return _unavailable(self.endpoint, f"{self.endpoint} временно отключён после серии ошибок")
+
+    def delays(self) -> Iterator[float]:
+        """Пауза перед каждой попыткой (перед первой — 0)."""
+        for attempt in range(settings.retry_attempts + 1):
+            if not attempt:
+                yield 0.0
+                continue
+            logs.event("upstream_retry", "warning", endpoint=self.endpoint, attempt=attempt, error=self._error)
+            delay = retry_delay(attempt - 1, self._retry_after)
+            self._retry_after = None
+            yield delay
+
+    def failed(self, e: httpx.HTTPError) -> Optional[Dict[str, Any]]:
+        """Исключение httpx; None — попробовать ещё раз."""
+        if isinstance(e, httpx.TransportError):
+            metrics.upstream_errors.inc(endpoint=self.endpoint, kind="transport")
+            self._error = str(e) or type(e).__name__
+            if self.idempotent or isinstance(e, _NOT_SENT):
+                return None
+            return self.exhausted()
+        metrics.upstream_errors.inc(endpoint=self.endpoint, kind="http")
+        self._record(False)
+        return {"success": False, "error": str(e) or type(e).__name__}
+
+    def received(self, r: httpx.Response) -> Optional[Dict[str, Any]]:
+        """Ответ Tourvisor; None — попробовать ещё раз."""
+        metrics.upstream_requests.inc(endpoint=self.endpoint, status=r.status_code)
+        if r.status_code in RETRY_STATUSES:
+            metrics.upstream_errors.inc(endpoint=self.endpoint, kind="http")
+            self._error, self._retry_after = f"HTTP {r.status_code}", r.headers.get("retry-after")
+            if self.idempotent or r.status_code == 429:
+                return None
+            return self.exhausted()
+        self._record(True)
+        if r.is_error:
+            metrics.upstream_errors.inc(endpoint=self.endpoint, kind="http")
+            return {"success": False, "error": f"HTTP {r.status_code}"}
+        return _parse_response(self.endpoint, r)
+
+    def exhausted(self) -> Dict[str, Any]:
+        """Все попытки кончились таймаутами/429/5xx (или повторять нельзя)."""
+        self._record(False)
+        logs.event("upstream_unavailable", "error", endpoint=self.endpoint, error=self._error)
+        return _unavailable(self.endpoint, self._error)
+
+    def finish(self) -> None:
+        if self._admission == "probe" and not self._settled:
+            breaker.release(self.endpoint)
+
+    def _record(self, ok: bool) -> None:
+        self._settled = True
+        breaker.record(self.endpoint, ok)
+
+
+def _request(url: str, params: Dict[str, Any], idempotent: bool = True) -> Dict[str, Any]:
     if not url:
         return {"success": False, "error": "URL не задан. Укажи MODSEARCH_URL/MODRESULT_URL"}
 
+    call = _UpstreamCall(url, idempotent)
+    rejected = call.rejected()
+    if rejected is not None:
+        return rejected
     try:
-        with httpx.Client(timeout=settings.request_timeout) as client:
-            r = client.get(url, params=params, headers=settings.headers)
-            r.raise_for_status()
+        for delay in call.delays():
+            if delay > 0:
+                time.sleep(delay)
+            rate_limiter.wait_sync(call.rate_key)
             try:
-                data = r.json()
-            except Exception:
-                data = {"raw_text": r.text}
-            return {"success": True, "data": data}
-    except httpx.HTTPError as e:
-        return {"success": False, "error": str(e)}
+                r = get_client().get(url, params=params, headers=settings.headers)
+            except httpx.HTTPError as e:
+                result = call.failed(e)
+            else:
+                result = call.received(r)
+            if result is not None:
+                return result
+        return call.exhausted()
+    finally:
+        call.finish()
+
+
+async def _arequest(url: str, params: Dict[str, Any], idempotent: bool = True) -> Dict[str, Any]:
+    """GET к Tourvisor: token bucket, повторы с jitter, предохранитель (см. resilience)."""
+    if not url:
+        return {"success": False, "error": "URL не задан. Укажи MODSEARCH_URL/MODRESULT_URL"}
+
+    call = _UpstreamCall(url, idempotent)
+    rejected = call.rejected()
+    if rejected is not None:
+        return rejected
+    host = httpx.URL(url).host
+    try:
+        for delay in call.delays():
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await rate_limiter.wait(call.rate_key)
+            try:
+                r = await get_async_client(host).get(url, params=params, headers=settings.headers)
+            except httpx.HTTPError as e:
+                result = call.failed(e)
+            else:
+                result = call.received(r)
+            if result is not None:
+                return result
+        return call.exhausted()
+    finally:
+        call.finish()
 
 
+@metrics.timed("list_fetch")
 def _fetch_list(url: str, key_name: str, id_field: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
     if not url:
         return {}
     try:
-        with httpx.Client(timeout=settings.request_timeout) as client:
-            r = client.get(url, headers=settings.headers, params=params or {})
-            r.raise_for_status()
-            text = r.text or ""
+        r = get_client().get(url, headers=settings.headers, params=params or {})
+        r.raise_for_status()
+        text = r.text or ""
     except httpx.HTTPError:
         return {}
 
     # JSON
     try:
-        data = r.json()
+        data = jsonutil.loads(r.content)
         if isinstance(data, dict):
             items = data.get(key_name)
             if isinstance(items, list):
@@ -121,90 +395,176 @@ def _fetch_list(url: str, key_name: str, id_field: str, params: Optional[Dict[st
         return {}
 
 
+def _store_list(key: str, data: Dict[Any, Any]) -> float:
+    ttl = settings.list_cache_ttl
+    jitter = max(0.0, min(settings.list_cache_jitter, 1.0))
+    # Разный срок у разных справочников, чтобы они не протухали одновременно
+    fresh_for = ttl * random.uniform(1.0 - jitter, 1.0 + jitter)
+    entry = {"expires": time.time() + fresh_for, "data": data}
+    list_cache.set(key, entry, fresh_for + settings.list_cache_stale_ttl)
+    return entry["expires"]
 
 
-def _get_country_ids() -> Dict[str, int]:
-    global _COUNTRY_CACHE
-    ts, cached = _COUNTRY_CACHE
-    if time.time() - ts < settings.list_cache_ttl and cached:
-        return cached
-    data = _fetch_list(settings.listcountry_url, "country", "id")
-    if not data:
-        data = dict(_COUNTRY_FALLBACK)
-    _COUNTRY_CACHE = (time.time(), data)
-    return data
+def _reload_list(key: str, load: Callable[[], Dict[Any, Any]]) -> None:
+    data = load()
+    if data:
+        _store_list(key, data)
 
 
-def _get_departure_ids() -> Dict[str, int]:
-    global _DEPARTURE_CACHE
-    ts, cached = _DEPARTURE_CACHE
-    if time.time() - ts < settings.list_cache_ttl and cached:
-        return cached
-    data = _fetch_list(settings.listdep_url, "departure", "id")
-    if not data:
-        data = dict(_DEPARTURE_FALLBACK)
-    _DEPARTURE_CACHE = (time.time(), data)
-    return data
+def _run_refresh(key: str, refresh: Callable[[], None]) -> None:
+    try:
+        refresh()
+    except Exception as e:
+        logs.exception("list_refresh_failed", e, key=key)
+    finally:
+        with _REFRESH_LOCK:
+            _REFRESHING.discard(key)
+
+
+def _refresh_in_background(key: str, refresh: Callable[[], None]) -> None:
+    """Запускает refresh в фоновом пуле, не более одного на ключ."""
+    with _REFRESH_LOCK:
+        if key in _REFRESHING:
+            return
+        _REFRESHING.add(key)
+    _REFRESH_POOL.submit(_run_refresh, key, refresh)
+
+
+def _cached_list(key: str, load: Callable[[], Dict[Any, Any]]) -> Dict[Any, Any]:
+    """Справочник из list_cache по схеме stale-while-revalidate.
+
+    Протухшая копия отдаётся сразу, а обновление уходит в фоновый поток;
+    синхронно грузим только при полном отсутствии копии. Пустой результат
+    загрузки не кэшируется.
+    """
+    return _cached_list_versioned(key, load)[0]
+
+
+def _cached_list_versioned(key: str, load: Callable[[], Dict[Any, Any]]) -> Tuple[Dict[Any, Any], Optional[float]]:
+    """_cached_list и версия справочника — срок его записи в list_cache (меняется при каждом обновлении).
+
+    None — справочник не из кэша (пустая загрузка). Одновременные промахи
+    по одному ключу (пул потоков на холодном старте) делают одну загрузку.
+    """
+    entry = list_cache.get(key)
+    if entry and entry.get("data"):
+        if entry.get("expires", 0) < time.time():
+            metrics.cache_requests.inc(cache="list", result="stale")
+            _refresh_in_background(key, partial(_reload_list, key, load))
+        else:
+            metrics.cache_requests.inc(cache="list", result="hit")
+        return entry["data"], entry.get("expires")
+    metrics.cache_requests.inc(cache="list", result="miss")
 
+    def cold() -> Tuple[Dict[Any, Any], Optional[float]]:
+        # Пока ждали очереди, справочник мог загрузить предыдущий лидер
+        entry = list_cache.get(key)
+        if entry and entry.get("data"):
+            return entry["data"], entry.get("expires")
+        data = load()
+        if data:
+            return data, _store_list(key, data)
+        return data, None
 
-def _get_meal_names() -> Dict[int, str]:
-    global _MEAL_CACHE
-    ts, cached = _MEAL_CACHE
-    if time.time() - ts < settings.list_cache_ttl and cached:
-        return cached
-    raw = _fetch_list(settings.listmeal_url, "meal", "id")
+    return _LIST_FLIGHT.run(key, cold)
+
+
+async def aprewarm_lists() -> None:
+    await asyncio.to_thread(prewarm_lists)
+
+
+def prewarm_lists() -> None:
+    """Прогрев справочников на старте (страны, города, питание, номера, операторы, отели)."""
+    _get_country_ids()
+    _get_departure_ids()
+    _get_meal_names()
+    _get_room_names()
+    _get_operator_names()
+    for raw in settings.prewarm_hotel_countries.split(","):
+        country_id = _to_int(raw)
+        if country_id:
+            _ensure_hotels(country_id, session=None, referrer=None)
+
+
+def _by_id(raw: Dict[str, int]) -> Dict[int, str]:
     out: Dict[int, str] = {}
     for name, _id in raw.items():
         try:
             out[int(_id)] = name
         except Exception:
             continue
-    _MEAL_CACHE = (time.time(), out)
     return out
 
 
+def _int_keys(data: Dict[Any, str]) -> Dict[int, str]:
+    """Справочник id → имя из общего кэша (JSON: ключи-строки) — снова с int-ключами."""
+    if data and isinstance(next(iter(data)), str):
+        return {int(k): v for k, v in data.items()}
+    return data
+
+
+def _load_country_ids() -> Dict[str, int]:
+    return _fetch_list(settings.listcountry_url, "country", "id") or dict(_COUNTRY_FALLBACK)
+
+
+def _load_departure_ids() -> Dict[str, int]:
+    return _fetch_list(settings.listdep_url, "departure", "id") or dict(_DEPARTURE_FALLBACK)
+
+
+def _get_country_ids() -> Dict[str, int]:
+    return _cached_list("country", _load_country_ids)
+
+
+def _get_departure_ids() -> Dict[str, int]:
+    return _cached_list("departure", _load_departure_ids)
+
+
+def _country_index() -> resolver.Resolver:
+    return resolver.countries.get(*_cached_list_versioned("country", _load_country_ids))
+
+
+def _departure_index() -> resolver.Resolver:
+    return resolver.departures.get(*_cached_list_versioned("departure", _load_departure_ids))
+
+
+def _get_meal_names() -> Dict[int, str]:
+    return _int_keys(_cached_list("meal", lambda: _by_id(_fetch_list(settings.listmeal_url, "meal", "id"))))
+
+
 def _get_room_names() -> Dict[int, str]:
-    global _ROOM_CACHE
-    ts, cached = _ROOM_CACHE
-    if time.time() - ts < settings.list_cache_ttl and cached:
-        return cached
-    raw = _fetch_list(settings.listroom_url, "room", "id")
-    out: Dict[int, str] = {}
-    for name, _id in raw.items():
-        try:
-            out[int(_id)] = name
-        except Exception:
-            continue
-    _ROOM_CACHE = (time.time(), out)
-    return out
+    return _int_keys(_cached_list("room", lambda: _by_id(_fetch_list(settings.listroom_url, "room", "id"))))
 
 
 def _get_operator_names() -> Dict[int, str]:
-    global _OP_CACHE
-    ts, cached = _OP_CACHE
-    if time.time() - ts < settings.list_cache_ttl and cached:
-        return cached
-    raw = _fetch_list(settings.listoperator_url, "operator", "id")
-    out: Dict[int, str] = {}
-    for name, _id in raw.items():
-        try:
-            out[int(_id)] = name
-        except Exception:
-            continue
-    _OP_CACHE = (time.time(), out)
-    return out
+    return _int_keys(_cached_list("operator", lambda: _by_id(_fetch_list(settings.listoperator_url, "operator", "id"))))
+
 
+def _ensure_hotels(country_id: Optional[int], session: Optional[str], referrer: Optional[str], force_refresh: bool = False) -> None:
+    """Следит, чтобы отели страны были в hotel_directory.
 
-def _get_hotel_names(country_id: Optional[int], session: Optional[str], referrer: Optional[str], force_refresh: bool = False) -> Dict[int, str]:
+    Первую загрузку (и refresh_hotels) ждём синхронно, устаревший список
+    (старше LIST_CACHE_TTL) обновляется в фоне, а пока читается старый.
+    """
     if not country_id:
-        return {}
-    if not force_refresh:
-        cached = _HOTEL_CACHE.get(country_id)
-        if cached:
-            ts, data = cached
-            if time.time() - ts < settings.list_cache_ttl and data:
-                return data
-    out: Dict[int, str] = {}
+        return
+    refresh = partial(_refresh_hotels, country_id, session, referrer)
+    refreshed = hotel_directory.refreshed_at(country_id)
+    if force_refresh or refreshed is None:
+        refresh()
+    elif time.time() - refreshed > settings.list_cache_ttl:
+        _refresh_in_background(f"hotels:{country_id}", refresh)
+
+
+def _refresh_hotels(country_id: int, session: Optional[str], referrer: Optional[str]) -> None:
+    hotels = _load_hotels(country_id, session, referrer)
+    if hotels:
+        hotel_directory.upsert(hotels)
+        hotel_directory.mark_refreshed(country_id)
+
+
+@metrics.timed("hotel_list_fetch")
+def _load_hotels(country_id: int, session: Optional[str], referrer: Optional[str]) -> list[HotelInfo]:
+    out: Dict[int, HotelInfo] = {}
 
     # 1) listdev.php (allhotel)
     listdev_params = {
@@ -221,8 +581,7 @@ def _get_hotel_names(country_id: Optional[int], session: Optional[str], referrer
         data = resp.get("data")
         if isinstance(data, dict) and "raw_text" in data:
             try:
-                import json as _json
-                data = _json.loads(data.get("raw_text") or "{}")
+                data = jsonutil.loads(data.get("raw_text") or "{}")
             except Exception:
                 data = {}
         if isinstance(data, dict):
@@ -246,25 +605,16 @@ def _get_hotel_names(country_id: Optional[int], session: Optional[str], referrer
                 for h in hotels:
                     if not isinstance(h, dict):
                         continue
-                    hid = h.get("id") or h.get("hotelid")
-                    name = h.get("name")
-                    if hid is None or not name:
-                        continue
-                    try:
-                        out[int(hid)] = str(name)
-                    except Exception:
-                        continue
+                    info = hotel_from_item(h.get("id") or h.get("hotelid"), h, country_id)
+                    if info:
+                        out[info.id] = info
             elif isinstance(hotels, dict):
                 for hid, h in hotels.items():
                     if not isinstance(h, dict):
                         continue
-                    name = h.get("name")
-                    if not name:
-                        continue
-                    try:
-                        out[int(hid)] = str(name)
-                    except Exception:
-                        continue
+                    info = hotel_from_item(hid, h, country_id)
+                    if info:
+                        out[info.id] = info
 
             # If hotels are top-level numeric keys
             if not out:
@@ -273,22 +623,19 @@ def _get_hotel_names(country_id: Optional[int], session: Optional[str], referrer
                         continue
                     if not isinstance(v, dict) or "name" not in v:
                         continue
-                    try:
-                        out[int(k)] = str(v.get("name"))
-                    except Exception:
-                        continue
+                    info = hotel_from_item(k, v, country_id)
+                    if info:
+                        out[info.id] = info
 
     # 2) listhotel.php fallback
     if not out:
         raw = _fetch_list(settings.listhotel_url, "hotel", "id", params={"country": country_id})
         for name, _id in raw.items():
-            try:
-                out[int(_id)] = name
-            except Exception:
-                continue
+            info = hotel_from_item(_id, {"name": name}, country_id)
+            if info:
+                out[info.id] = info
 
-    _HOTEL_CACHE[country_id] = (time.time(), out)
-    return out
+    return list(out.values())
 
 
 def _normalize_date(value: Any) -> Any:
@@ -300,10 +647,20 @@ def _normalize_date(value: Any) -> Any:
     return s
 
 
+def _resolve(index: resolver.Resolver, kind: str, query: str) -> Optional[resolver.Match]:
+    """Страна/город по неточному имени; всё, кроме точного совпадения, пишется в лог."""
+    match = index.resolve(query)
+    if match is not None and match.method not in ("exact", "id"):
+        logs.event("name_resolved", kind=kind, query=query, resolved=match.name, method=match.method)
+    return match
+
+
+@metrics.timed("normalize_payload")
 def _normalize_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
     data = payload.copy()
-    data.pop("limit", None)
-    data.pop("max", None)
+    # Опции самого search_tours, а не параметры Tourvisor
+    for key in _LOCAL_OPTIONS:
+        data.pop(key, None)
 
     if "datefrom" not in data:
         if "date_from" in data:
@@ -332,12 +689,14 @@ def _normalize_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
     if "country" in data:
         val = data.pop("country")
         if isinstance(val, str):
-            key = val.strip().lower()
-            val = _get_country_ids().get(key)
-            if val is None:
-                data["__country_error"] = f"Страна '{key}' не найдена в базе Tourvisor"
+            index = _country_index()
+            match = _resolve(index, "country", val)
+            if match is None:
+                hints = index.suggest(val)
+                hint = f". Возможно: {', '.join(hints)}" if hints else ""
+                data["__country_error"] = f"Страна '{val.strip()}' не найдена в базе Tourvisor{hint}"
             else:
-                data["country"] = int(val)
+                data["country"] = match.id
         else:
             data["country"] = val
     elif "s_country" in data:
@@ -346,10 +705,14 @@ def _normalize_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
     if "city_from" in data:
         val = data.pop("city_from")
         if isinstance(val, str):
-            key = val.strip().lower()
-            val = _get_departure_ids().get(key, val)
-            if isinstance(val, str) and val.isdigit():
-                val = int(val)
+            index = _departure_index()
+            match = _resolve(index, "departure", val)
+            if match is None:
+                hints = index.suggest(val)
+                hint = f". Возможно: {', '.join(hints)}" if hints else ""
+                data["__departure_error"] = f"Город вылета '{val.strip()}' не найден в базе Tourvisor{hint}"
+            else:
+                val = match.id
         data["departure"] = val
     elif "s_flyfrom" in data:
         data["departure"] = data.pop("s_flyfrom")
@@ -377,87 +740,938 @@ def _normalize_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
     return data
 
 
-def search_tours(payload: Dict[str, Any]) -> Dict[str, Any]:
-    """modsearch -> poll modresult 1-3 раза -> вернуть нормализованные туры."""
-    normalized = _normalize_payload(payload or {})
-    limit = int(payload.get("limit") or payload.get("max") or settings.max_tours)
-    unique_hotels = payload.get("unique_hotels", True)
-    refresh_hotels = bool(payload.get("refresh_hotels"))
-    country_id = normalized.get("country")
-    if normalized.get("__country_error"):
-        return {"success": False, "error": normalized.get("__country_error")}
-    if normalized.get("session"):
-        _LAST_AUTH["session"] = str(normalized.get("session"))
-    if normalized.get("referrer"):
-        _LAST_AUTH["referrer"] = str(normalized.get("referrer"))
+def _block_payload(resp: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Ответ modresult, если в нём уже появился data.block (иначе None)."""
+    if not resp.get("success"):
+        return None
+    data = resp.get("data")
+    if not isinstance(data, dict):
+        return None
+    if isinstance(data.get("data"), dict) and "block" in data["data"]:
+        return data
+    if "block" in data:
+        return data
+    return None
+
+
+def _normalize_tours(
+    data: Dict[str, Any],
+    ctx: Dict[str, Any],
+    limit: int = 0,
+    unique_hotels: bool = False,
+    sort: Optional[str] = None,
+) -> list[Dict[str, Any]]:
+    """Туры снимка в формате выдачи (filters.tour_row), как у страниц из TourIndex."""
+    tours = _normalize_result(
+        data,
+        country_id=ctx["country_id"],
+        session=ctx["auth"][0],
+        referrer=ctx["auth"][1],
+        refresh_hotels=ctx["refresh_hotels"],
+        limit=limit,
+        unique_hotels=unique_hotels,
+        sort=sort,
+    )
+    attrs = _hotel_attrs(data, {t["hotel_id"] for t in tours if t["hotel_id"] is not None})
+    return [filters.tour_row(t, attrs.get(t["hotel_id"])) for t in tours]
+
+
+def _select_tours(
+    data: Dict[str, Any], ctx: Dict[str, Any], limit: int, request_id: Optional[str] = None
+) -> list[Dict[str, Any]]:
+    """Итоговая выдача: limit лучших туров (по отелю при unique_hotels) по ctx["sort"]."""
+    return _query_tours(data, ctx, limit, request_id)[0]
+
+
+def _query_tours(
+    data: Dict[str, Any], ctx: Dict[str, Any], limit: int, request_id: Optional[str] = None
+) -> Tuple[list[Dict[str, Any]], Optional[int]]:
+    """(выдача, сколько туров прошло ctx["filter"]); без filter второе — None.
+
+    Без filter лучшие туры отбираются по сырому ответу (_pick_tours). С filter
+    нужны все туры снимка со звёздами/курортом отеля: они разбираются один раз
+    в TourIndex сессии результата (sessions.result_sessions по requestid),
+    следующие запросы к тому же поиску с другими filter/sort и страницы по
+    cursor идут по готовым индексам.
+    """
+    if not ctx.get("filter"):
+        return _normalize_tours(data, ctx, limit, ctx["unique_hotels"], ctx["sort"] or "price"), None
+    sort = ctx["sort"] or "price"
+    if not request_id:
+        return _index_builder(ctx)(data).query(ctx["filter"], sort, limit, ctx["unique_hotels"])
+    return _session(data, ctx, request_id).page(ctx["filter"], sort, ctx["unique_hotels"], 0, limit)
+
+
+def _result_page(data: Dict[str, Any], ctx: Dict[str, Any], request_id: Optional[str]) -> Dict[str, Any]:
+    """Первая страница выдачи: tours, matched (с filter) и next_cursor, если туров больше limit.
+
+    Если следующая страница возможна, первая берётся из той же сессии
+    результата, что и страницы по cursor: один порядок сортировки на всю
+    выдачу, и next_cursor выдаётся только когда туров действительно больше.
+    Когда все туры помещаются в limit, остаётся быстрый путь _pick_tours.
+    """
+    limit = ctx["limit"]
+    paged = limit > 0 and bool(request_id) and (
+        bool(ctx.get("filter")) or _raw_tour_count(data, bool(ctx["unique_hotels"])) > limit
+    )
+    if not paged:
+        tours, matched = _query_tours(data, ctx, limit, request_id)
+        page: Dict[str, Any] = {"tours": tours}
+        if matched is not None:
+            page["matched"] = matched
+        return page
+    where = tuple(ctx.get("filter") or ())
+    sort = ctx["sort"] or "price"
+    unique_hotels = bool(ctx["unique_hotels"])
+    # Снимок остаётся в сессии, следующие страницы не ходят в Tourvisor
+    tours, total = _session(data, ctx, request_id).page(where, sort, unique_hotels, 0, limit)
+    page = {"tours": tours}
+    if where:
+        page["matched"] = total
+    if len(tours) < total:
+        page["next_cursor"] = sessions.encode_cursor(sessions.Cursor(
+            request_id=request_id,
+            offset=len(tours),
+            limit=limit,
+            sort=sort,
+            unique_hotels=unique_hotels,
+            where=where,
+            country_id=_to_int(ctx["country_id"]),
+        ))
+    return page
+
+
+def _raw_tour_count(data: Dict[str, Any], unique_hotels: bool) -> int:
+    """Сколько туров (или отелей с турами при unique_hotels) в сыром снимке — без нормализации."""
+    inner = data.get("data", data)
+    block = inner.get("block") if isinstance(inner, dict) else None
+    if not isinstance(block, list):
+        return 0
+    if unique_hotels:
+        return sum(1 for _, tours in _hotel_tours(block) if tours)
+    return sum(len(tours) for _, tours in _hotel_tours(block))
+
+
+def _snapshot_version(data: Dict[str, Any]) -> tuple:
+    """Чем различаются снимки одного requestid: состояние поиска и число туров/отелей/блоков."""
+    inner = data.get("data", data)
+    if not isinstance(inner, dict):
+        return ()
+    status = inner.get("status") if isinstance(inner.get("status"), dict) else {}
+    block = inner.get("block")
+    return (
+        status.get("state"),
+        status.get("toursfound"),
+        status.get("hotelsfound"),
+        len(block) if isinstance(block, list) else 0,
+    )
+
+
+def _hotel_attrs(data: Dict[str, Any], ids: set) -> Dict[int, filters.HotelAttrs]:
+    """Звёзды/курорт/рейтинг отелей: словарь hotels ответа, недостающие — из hotel_directory."""
+    inner = data.get("data", data)
+    hotels = inner.get("hotels") if isinstance(inner, dict) else None
+    out: Dict[int, filters.HotelAttrs] = {}
+    if isinstance(hotels, dict):
+        for key, item in hotels.items():
+            hid = _to_int(key)
+            if hid is not None and hid in ids and isinstance(item, dict):
+                out[hid] = filters.hotel_attrs(item)
+    missing = ids - out.keys()
+    if missing:
+        for hid, info in hotel_directory.lookup(missing).items():
+            out[hid] = filters.HotelAttrs(info.stars, info.region, None)
+    return out
+
+
+def _index_builder(ctx: Dict[str, Any]) -> Callable[[Dict[str, Any]], filters.TourIndex]:
+    def build(data: Dict[str, Any]) -> filters.TourIndex:
+        records = _normalize_result(
+            data,
+            country_id=ctx["country_id"],
+            session=ctx["auth"][0],
+            referrer=ctx["auth"][1],
+            refresh_hotels=ctx["refresh_hotels"],
+            compact=True,
+        )
+        ids = {t.hotel_id for t in records if t.hotel_id is not None}
+        return filters.TourIndex(records, _hotel_attrs(data, ids))
+
+    return build
+
+
+def _session(data: Dict[str, Any], ctx: Dict[str, Any], request_id: str) -> sessions.ResultSession:
+    inner = data.get("data", data)
+    status = inner.get("status") if isinstance(inner, dict) else None
+    size = _to_int(status.get("toursfound")) if isinstance(status, dict) else None
+    return sessions.result_sessions.open(request_id, _snapshot_version(data), data, _index_builder(ctx), size or 0)
+
+
+def _tour_index(data: Dict[str, Any], ctx: Dict[str, Any], request_id: Optional[str] = None) -> filters.TourIndex:
+    if not request_id:
+        return _index_builder(ctx)(data)
+    return _session(data, ctx, request_id).index
+
+
+async def _prepare_search(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Нормализует параметры поиска; modsearch запускает _start_search."""
+    normalized = await asyncio.to_thread(_normalize_payload, payload)
+    for error in ("__country_error", "__departure_error"):
+        if normalized.get(error):
+            return {"success": False, "error": normalized[error]}
+
+    sort = payload.get("sort")
+    sort_error = _check_sort(sort)
+    if sort_error:
+        return sort_error
+
+    try:
+        conditions = filters.parse_filter(payload.get("filter"))
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
 
     request_id = payload.get("requestid") or payload.get("request_id")
-    if request_id:
-        request_id = str(request_id)
+    return {
+        "success": True,
+        "normalized": normalized,
+        "requestid": str(request_id) if request_id else None,
+        "cache_key": search_key(normalized),
+        # session/referrer этого поиска: listdev.php для имён отелей ходит с ними
+        "auth": (
+            str(normalized["session"]) if normalized.get("session") else None,
+            str(normalized["referrer"]) if normalized.get("referrer") else None,
+        ),
+        "country_id": normalized.get("country"),
+        "limit": int(payload.get("limit") or payload.get("max") or settings.max_tours),
+        "unique_hotels": payload.get("unique_hotels", True),
+        "refresh_hotels": bool(payload.get("refresh_hotels")),
+        "sort": sort,
+        "filter": conditions,
+    }
+
+
+def _cacheable(ctx: Dict[str, Any]) -> bool:
+    # requestid — явный перезапрос конкретного поиска, refresh_hotels — явный промах
+    return search_cache.enabled and not ctx["requestid"] and not ctx["refresh_hotels"]
+
+
+def _stale_fallback(ctx: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """Tourvisor недоступен — устаревший результат из search_cache (stale=True), если он есть."""
+    if result.get("success") or not result.get("unavailable") or not _cacheable(ctx):
+        return result
+    stale = search_cache.get_stale(ctx["cache_key"])
+    if stale is None:
+        return result
+    logs.event("stale_served", "warning", requestid=stale.get("requestid"), error=result.get("error"))
+    return {**stale, "stale": True}
+
+
+async def _start_search(ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """modsearch, если requestid ещё нет; возвращает ошибку или None. Поиск попадает в реестр searches."""
+    if ctx["requestid"]:
+        searches.start(ctx["requestid"], ctx["normalized"], ctx["auth"], ctx["cache_key"])
+        return None
+    start = await async_modsearch(ctx["normalized"])
+    if not start.get("success"):
+        return start
+
+    request_id = _extract_request_id(start.get("data"))
+    if not request_id:
+        return {
+            "success": False,
+            "error": "По этому направлению сейчас нет пакетных туров",
+        }
+    ctx["requestid"] = request_id
+    searches.start(request_id, ctx["normalized"], ctx["auth"], ctx["cache_key"])
+    logs.event("search_started", requestid=request_id, country=ctx["country_id"])
+    return None
+
+
+def _observe(request_id: str, scheduler: PollScheduler, resp: Dict[str, Any]) -> None:
+    raw = resp.get("data") if resp.get("success") else None
+    progress = scheduler.observe(raw if isinstance(raw, dict) else None)
+    data = _block_payload(resp)
+    searches.observe(request_id, scheduler.attempts, progress, data if data is not None and _has_tour_data(data) else None)
+    logs.event(
+        "modresult_poll",
+        requestid=request_id,
+        attempt=scheduler.attempts,
+        ok=bool(resp.get("success")),
+        tours=progress.tours if progress else None,
+        finished=scheduler.finished,
+    )
+    # Предохранитель modresult открыт — до конца паузы все опросы сразу отказ
+    if resp.get("unavailable") and breaker.state(resp["endpoint"]) == "open":
+        scheduler.fail(resp)
+
+
+async def _poll_snapshots(
+    request_id: str, scheduler: PollScheduler
+) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """Опрашивает modresult по расписанию scheduler, отдавая _block_payload каждого ответа."""
+    while True:
+        resp = await async_modresult(request_id)
+        _observe(request_id, scheduler, resp)
+        yield _block_payload(resp)
+        if scheduler.done:
+            return
+        await asyncio.sleep(scheduler.next_delay())
+
+
+def _polls_done(request_id: str, scheduler: PollScheduler, found: bool) -> None:
+    metrics.search_polls.observe(scheduler.attempts)
+    searches.finish(request_id, found, scheduler.error.get("error") if scheduler.error else None)
+    logs.event(
+        "search_finished",
+        "info" if found else "warning",
+        requestid=request_id,
+        polls=scheduler.attempts,
+        found=found,
+        finished=scheduler.finished,
+        duration_ms=round(scheduler.elapsed * 1000, 1),
+        error=scheduler.error.get("error") if scheduler.error else None,
+    )
+
+
+def _poll_error(request_id: str, scheduler: PollScheduler, saw_block: bool) -> Dict[str, Any]:
+    if scheduler.error is not None:
+        return {**scheduler.error, "requestid": request_id}
+    if scheduler.finished and saw_block:
+        error = "Туры по заданным параметрам не найдены"
     else:
-        start = modsearch(normalized)
-        if not start.get("success"):
-            return start
-
-        request_id = _extract_request_id(start.get("data"))
-        if not request_id:
-            return {
-                "success": False,
-                "error": "По этому направлению сейчас нет пакетных туров",
-            }
+        error = "Туры с ценами ещё не готовы" if saw_block else "data.block не появился"
+    return {"success": False, "error": error, "requestid": request_id}
 
-    last: Optional[Dict[str, Any]] = None
+
+async def _run_search(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Полный цикл поиска; data — последний снимок modresult с турами."""
+    error = await _start_search(ctx)
+    if error:
+        return error
+    request_id = ctx["requestid"]
+
+    scheduler = PollScheduler.from_settings()
+    saw_block = False
+    best: Optional[Dict[str, Any]] = None
+    async for data in _poll_snapshots(request_id, scheduler):
+        if data is None:
+            continue
+        saw_block = True
+        if _has_tour_data(data):
+            best = data
+    _polls_done(request_id, scheduler, best is not None)
+
+    if best is None:
+        return _poll_error(request_id, scheduler, saw_block)
+    await asyncio.to_thread(_learn_hotels, best, ctx["country_id"])
+    return {"success": True, "requestid": request_id, "data": best}
+
+
+async def _search_result(
+    ctx: Dict[str, Any], run: Optional[Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = None
+) -> Dict[str, Any]:
+    """Снимок modresult для ctx: из search_cache, из уже идущего такого же поиска или новым поиском.
+
+    run — сам поиск (по умолчанию _run_search; пакет подставляет свой с общим циклом опроса).
+    """
+    run = run or _run_search
+    if _cacheable(ctx):
+        result = await search_cache.get_or_run(ctx["cache_key"], lambda: run(dict(ctx)))
+    else:
+        result = await run(ctx)
+    return _stale_fallback(ctx, result)
+
+
+async def async_search_tours(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """modsearch -> адаптивный poll modresult (asyncio.sleep) -> нормализованные туры.
+
+    Справочники и нормализация могут ходить в сеть/жечь CPU, поэтому они
+    выполняются в пуле потоков; ожидание результатов поток не занимает.
+    Одинаковые запросы берутся из search_cache или ждут уже идущий поиск;
+    если Tourvisor недоступен, отдаётся устаревший результат (stale=True).
+    С cursor (next_cursor прошлого ответа) — следующая страница, см. async_search_page.
+    """
+    payload = payload or {}
+    if payload.get("cursor"):
+        return await async_search_page(payload["cursor"], payload.get("limit"))
+    ctx = await _prepare_search(payload)
+    if not ctx.get("success"):
+        return ctx
+
+    result = await _search_result(ctx)
+    if not result.get("success"):
+        return result
+    page = await asyncio.to_thread(_result_page, result["data"], ctx, result["requestid"])
+    response = {"success": True, "requestid": result["requestid"], **page}
+    if result.get("stale"):
+        response["stale"] = True
+    return response
+
+
+async def async_search_tours_stream(payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Прогрессивный поиск: события по мере прихода снимков modresult.
+
+    - {"event": "started", "requestid"}
+    - {"event": "tours", "requestid", "tours"} — только туры, которых не было в
+      прошлых снимках (при unique_hotels — новые отели); нормализуется только
+      дельта снимка (SnapshotDiff), а не весь накопленный результат; filter
+      применяется и к дельте
+    - {"event": "done", ...} — итог в формате async_search_tours
+    """
+    payload = payload or {}
+    if payload.get("cursor"):
+        yield {"event": "done", **await async_search_page(payload["cursor"], payload.get("limit"))}
+        return
+    ctx = await _prepare_search(payload)
+    if not ctx.get("success"):
+        yield {"event": "done", **ctx}
+        return
+    unique_hotels = ctx["unique_hotels"]
+
+    cached = search_cache.get(ctx["cache_key"]) if _cacheable(ctx) else None
+    error = None if cached is not None else await _start_search(ctx)
+    if error:
+        fallback = _stale_fallback(ctx, error)
+        cached = fallback if fallback.get("success") else None
+    if cached is not None:
+        request_id = cached["requestid"]
+        yield {"event": "started", "requestid": request_id}
+        tours = await asyncio.to_thread(_select_tours, cached["data"], ctx, 0, request_id)
+        yield {"event": "tours", "requestid": request_id, "tours": tours}
+        page = await asyncio.to_thread(_result_page, cached["data"], ctx, request_id)
+        done = {"event": "done", "success": True, "requestid": request_id, **page}
+        if cached.get("stale"):
+            done["stale"] = True
+        yield done
+        return
+    if error:
+        yield {"event": "done", **error}
+        return
+    request_id = ctx["requestid"]
+    yield {"event": "started", "requestid": request_id}
+
+    scheduler = PollScheduler.from_settings()
     saw_block = False
-    for _ in range(settings.poll_attempts):
-        last = modresult(request_id)
-        if last.get("success"):
-            data = last.get("data")
-            if isinstance(data, dict) and "data" in data and isinstance(data["data"], dict):
-                if "block" in data["data"]:
-                    saw_block = True
-                    if _has_tour_data(data):
-                        tours = _normalize_result(
-                            data,
-                            country_id=country_id,
-                            session=_LAST_AUTH.get("session"),
-                            referrer=_LAST_AUTH.get("referrer"),
-                            refresh_hotels=refresh_hotels,
-                        )
-                        if unique_hotels:
-                            tours = _unique_hotels(tours)
-                        if limit > 0:
-                            tours = tours[:limit]
-                        return {"success": True, "requestid": request_id, "tours": tours}
-            if isinstance(data, dict) and "block" in data:
-                saw_block = True
-                if _has_tour_data(data):
-                    tours = _normalize_result(
-                        data,
-                        country_id=country_id,
-                        session=_LAST_AUTH.get("session"),
-                        referrer=_LAST_AUTH.get("referrer"),
-                        refresh_hotels=refresh_hotels,
-                    )
-                    if unique_hotels:
-                        tours = _unique_hotels(tours)
-                    if limit > 0:
-                        tours = tours[:limit]
-                    return {"success": True, "requestid": request_id, "tours": tours}
-        time.sleep(settings.poll_interval)
+    best: Optional[Dict[str, Any]] = None
+    diff = SnapshotDiff()
+    emitted: set = set()
+    async for data in _poll_snapshots(request_id, scheduler):
+        if data is None:
+            continue
+        saw_block = True
+        delta = diff.feed(data)
+        if delta is None:
+            if _has_tour_data(data):
+                best = data
+            continue
+        best = data
+        if ctx["filter"]:
+            tours, _ = await asyncio.to_thread(lambda: _tour_index(delta, ctx).query(ctx["filter"]))
+        else:
+            tours = await asyncio.to_thread(_normalize_tours, delta, ctx)
+        if unique_hotels:
+            tours = [t for t in _unique_hotels(tours) if t.get("hotel_id") not in emitted]
+            emitted.update(t.get("hotel_id") for t in tours)
+        if tours:
+            yield {"event": "tours", "requestid": request_id, "tours": tours}
+    _polls_done(request_id, scheduler, best is not None)
+
+    if best is None:
+        # Снимков с турами нет: устаревший кэш, если Tourvisor недоступен
+        result = _stale_fallback(ctx, _poll_error(request_id, scheduler, saw_block))
+        if result.get("success"):
+            page = await asyncio.to_thread(_result_page, result["data"], ctx, result["requestid"])
+            yield {"event": "done", "success": True, "requestid": result["requestid"], **page, "stale": True}
+        else:
+            yield {"event": "done", **result}
+        return
+    await asyncio.to_thread(_learn_hotels, best, ctx["country_id"])
+    if _cacheable(ctx):
+        search_cache.set(ctx["cache_key"], {"success": True, "requestid": request_id, "data": best})
+    page = await asyncio.to_thread(_result_page, best, ctx, request_id)
+    yield {"event": "done", "success": True, "requestid": request_id, **page}
+
+
+_BATCH_OPTIONS = ("searches", "limit", "max", "sort", "unique_hotels")
+
+
+class _PollEntry:
+    """Поиск в _PollLoop: его расписание, лучший снимок и кому отдать результат."""
+
+    def __init__(self, ctx: Dict[str, Any], future: "asyncio.Future[Dict[str, Any]]") -> None:
+        self.ctx = ctx
+        self.future = future
+        self.scheduler = PollScheduler.from_settings()
+        self.best: Optional[Dict[str, Any]] = None
+        self.saw_block = False
+        self.due_at = 0.0
+
+
+class _PollLoop:
+    """Общий цикл опроса modresult для поисков пакета.
+
+    Поиск присоединяется через result(), как только его modsearch вернул
+    requestid. У каждого поиска своё адаптивное расписание (PollScheduler), но
+    ждёт их один цикл: на каждом такте опрашиваются все, кому пора, не больше
+    slots запросов одновременно. Результаты — в формате _run_search.
+    """
+
+    def __init__(self, slots: asyncio.Semaphore) -> None:
+        self.slots = slots
+        self._pending: list[_PollEntry] = []
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def result(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        entry = _PollEntry(ctx, loop.create_future())
+        self._pending.append(entry)
+        self._wake.set()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        return await entry.future
+
+    async def _poll(self, entry: _PollEntry) -> None:
+        request_id = entry.ctx["requestid"]
+        async with self.slots:
+            resp = await async_modresult(request_id)
+        _observe(request_id, entry.scheduler, resp)
+        data = _block_payload(resp)
+        if data is not None:
+            entry.saw_block = True
+            if _has_tour_data(data):
+                entry.best = data
+
+    def _done(self, entry: _PollEntry) -> None:
+        request_id = entry.ctx["requestid"]
+        _polls_done(request_id, entry.scheduler, entry.best is not None)
+        if entry.best is None:
+            result = _poll_error(request_id, entry.scheduler, entry.saw_block)
+        else:
+            result = {"success": True, "requestid": request_id, "data": entry.best}
+        if not entry.future.done():
+            entry.future.set_result(result)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending:
+                now = loop.time()
+                due = [e for e in self._pending if e.due_at <= now]
+                if not due:
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), min(e.due_at for e in self._pending) - now)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await asyncio.gather(*(self._poll(e) for e in due))
+                for e in due:
+                    if e.scheduler.done:
+                        self._pending.remove(e)
+                        self._done(e)
+                    else:
+                        e.due_at = loop.time() + e.scheduler.next_delay()
+        except BaseException as exc:
+            pending, self._pending = self._pending, []
+            for e in pending:
+                if not e.future.done():
+                    e.future.set_exception(exc)
+            raise
+
+
+def _merge_key(sort: str, stars: Dict[int, Optional[int]]) -> Callable[[Dict[str, Any]], tuple]:
+    """Ключ сортировки нормализованного тура — как _sort_key для сырого."""
+    if sort == "price_per_night":
+        return lambda t: (t["price"] / t["nights"] if t.get("nights") else float(t["price"]), t["price"])
+    if sort == "date":
+        return lambda t: (_date_order(t.get("date")), t["price"])
+    if sort == "stars":
+        return lambda t: (-(stars.get(t.get("hotel_id")) or 0), t["price"])
+    return lambda t: (t["price"],)
+
+
+def _rank_tours(tours: list[Dict[str, Any]], limit: int, unique_hotels: bool, sort: str) -> list[Dict[str, Any]]:
+    """Общий рейтинг нормализованных туров из нескольких поисков."""
+    stars: Dict[int, Optional[int]] = {}
+    if sort == "stars":
+        found = hotel_directory.lookup(t.get("hotel_id") for t in tours)
+        stars = {hid: info.stars for hid, info in found.items()}
+    tours = sorted(tours, key=_merge_key(sort, stars))
+    if unique_hotels:
+        seen: set = set()
+        unique = []
+        for t in tours:
+            hid = t.get("hotel_id")
+            if hid is not None and hid in seen:
+                continue
+            seen.add(hid)
+            unique.append(t)
+        tours = unique
+    return tours[:limit] if limit > 0 else tours
+
+
+async def _run_batch(ctxs: list[Dict[str, Any]]) -> list[Dict[str, Any]]:
+    """Результаты (в формате _search_result) для списка ctx из _prepare_search.
+
+    Каждый поиск идёт через _search_result: search_cache, склейка с таким же
+    идущим поиском (в том числе у другого воркера) и устаревший кэш при
+    недоступном Tourvisor — как у async_search_tours. Запущенные здесь modsearch
+    (не больше BATCH_CONCURRENCY запросов одновременно) опрашиваются в одном
+    общем цикле (_PollLoop). Одинаковые поиски внутри списка не повторяются.
+    """
+    slots = asyncio.Semaphore(max(1, settings.batch_concurrency))
+    polls = _PollLoop(slots)
+
+    async def run(ctx: Dict[str, Any]) -> Dict[str, Any]:
+        async with slots:
+            error = await _start_search(ctx)
+        if error:
+            return error
+        result = await polls.result(ctx)
+        if result.get("success"):
+            await asyncio.to_thread(_learn_hotels, result["data"], ctx["country_id"])
+        return result
+
+    groups: Dict[tuple, list[int]] = {}
+    for i, ctx in enumerate(ctxs):
+        if ctx.get("success"):
+            groups.setdefault((ctx["cache_key"], ctx["requestid"]), []).append(i)
+    leaders = [members[0] for members in groups.values()]
+    results: list[Dict[str, Any]] = list(ctxs)
+    for i, result in zip(leaders, await asyncio.gather(*(_search_result(ctxs[i], run) for i in leaders))):
+        for j in groups[(ctxs[i]["cache_key"], ctxs[i]["requestid"])]:
+            results[j] = result
+    return results
+
+
+def _batch_summary(results: list[Dict[str, Any]], selected: list[list[Any]]) -> list[Dict[str, Any]]:
+    summary = []
+    for i, (r, tours) in enumerate(zip(results, selected)):
+        item: Dict[str, Any] = {"search": i, "success": bool(r.get("success")), "requestid": r.get("requestid")}
+        if item["success"]:
+            item["tours"] = len(tours)
+            if r.get("stale"):
+                item["stale"] = True
+        else:
+            item["error"] = r.get("error")
+        summary.append(item)
+    return summary
+
+
+async def async_search_tours_batch(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Несколько поисков за время самого медленного из них.
+
+    payload["searches"] — список параметров поиска; остальные поля payload
+    (даты, ночи, взрослые...) — общие значения для каждого поиска. Все modsearch
+    запускаются сразу (не больше BATCH_CONCURRENCY запросов одновременно,
+    в пределах UPSTREAM_RATE_LIMIT на эндпоинт), опрос идёт в одном общем цикле,
+    а туры сводятся в один рейтинг по sort (limit лучших на весь пакет).
+    Одинаковые поиски внутри пакета и поиски из search_cache не повторяются.
+    """
+    payload = payload or {}
+    searches = payload.get("searches")
+    if not isinstance(searches, list) or not searches or not all(isinstance(x, dict) for x in searches):
+        return {"success": False, "error": "searches должен быть непустым списком параметров поиска"}
+    if len(searches) > settings.batch_max_searches:
+        return {"success": False, "error": f"Не больше {settings.batch_max_searches} поисков в пакете"}
+    sort = payload.get("sort")
+    sort_error = _check_sort(sort)
+    if sort_error:
+        return sort_error
+    limit = int(payload.get("limit") or payload.get("max") or settings.max_tours)
+    unique_hotels = payload.get("unique_hotels", True)
+    base = {k: v for k, v in payload.items() if k not in _BATCH_OPTIONS}
+
+    ctxs = await asyncio.gather(*(
+        _prepare_search({**base, **search, "sort": sort, "unique_hotels": unique_hotels, "limit": limit})
+        for search in searches
+    ))
+    results = await _run_batch(list(ctxs))
+
+    def select() -> list[list[Dict[str, Any]]]:
+        return [
+            _select_tours(r["data"], ctx, limit, r.get("requestid")) if r.get("success") else []
+            for r, ctx in zip(results, ctxs)
+        ]
+
+    selected = await asyncio.to_thread(select)
+    summary = _batch_summary(results, selected)
+    if not any(item["success"] for item in summary):
+        return {"success": False, "error": "Ни один поиск пакета не дал туров", "searches": summary}
+    tagged = [dict(t, search=i) for i, part in enumerate(selected) for t in part]
+    tours = await asyncio.to_thread(_rank_tours, tagged, limit, unique_hotels, sort or "price")
+    return {"success": True, "tours": tours, "searches": summary}
+
+
+def _window_tours(result: Dict[str, Any], ctx: Dict[str, Any]) -> list[Dict[str, Any]]:
+    if ctx["filter"]:
+        return _tour_index(result["data"], ctx, result.get("requestid")).query(ctx["filter"])[0]
+    return _normalize_tours(result["data"], ctx)
+
+
+async def async_search_tours_flexible(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Широкий поиск («7–10 ночей в июле»), разбитый на параллельные подзапросы.
+
+    planner делит диапазон дат и ночей на окна (PLAN_DATE_SPAN дней ×
+    PLAN_NIGHTS_SPAN ночей, не больше PLAN_MAX_SEARCHES подзапросов), окна
+    ищутся как пакет (_run_batch), туры со всех окон сводятся без дублей
+    (отель/дата/ночи/номер/питание). В ответе — рейтинг туров (tour["search"] —
+    номер окна), calendar — самый дешёвый тур на каждую пару дата × ночи,
+    searches — окна и итог по каждому.
+    """
+    payload = payload or {}
+    sort = payload.get("sort")
+    sort_error = _check_sort(sort)
+    if sort_error:
+        return sort_error
+    try:
+        windows, base = planner.plan_payload(
+            payload, settings.plan_date_span, settings.plan_nights_span, settings.plan_max_searches
+        )
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    limit = int(payload.get("limit") or payload.get("max") or settings.max_tours)
+    unique_hotels = payload.get("unique_hotels", True)
+    base = {k: v for k, v in base.items() if k not in _BATCH_OPTIONS}
+
+    ctxs = await asyncio.gather(*(_prepare_search({**base, **w.params()}) for w in windows))
+    results = await _run_batch(list(ctxs))
+
+    def collect() -> Tuple[list[list[Dict[str, Any]]], list[Dict[str, Any]]]:
+        # Все туры окна, а не limit лучших: иначе календарь был бы неполным
+        per_window = [
+            _window_tours(r, ctx) if r.get("success") else []
+            for r, ctx in zip(results, ctxs)
+        ]
+        tagged = (dict(t, search=i) for i, part in enumerate(per_window) for t in part)
+        return per_window, planner.dedupe(tagged)
+
+    per_window, tours = await asyncio.to_thread(collect)
+    summary = _batch_summary(results, per_window)
+    for item, window in zip(summary, windows):
+        item.update(window.params())
+    if not tours:
+        return {"success": False, "error": "Туры по заданным параметрам не найдены", "searches": summary}
+    calendar = await asyncio.to_thread(planner.price_calendar, tours)
+    ranked = await asyncio.to_thread(_rank_tours, tours, limit, unique_hotels, sort or "price")
+    return {"success": True, "tours": ranked, "calendar": calendar, "searches": summary}
+
+
+def search_tours(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Синхронная обёртка над async_search_tours (для вызова вне event loop)."""
+    return _run_sync(async_search_tours(payload))
+
+
+async def async_search_page(cursor: str, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Страница выдачи по next_cursor: срез из сессии результата, без modsearch и без повторного разбора.
+
+    cursor хранит requestid, позицию, sort, unique_hotels и filter. Если сессии
+    уже нет (вытеснена, истёк TOUR_INDEX_TTL, другой воркер), результат один
+    раз перечитывается из modresult по requestid. total — сколько туров в
+    выдаче всего; next_cursor — только если есть следующая страница.
+    limit — не меньше 1 (по умолчанию размер прошлой страницы).
+    """
+    try:
+        position = sessions.decode_cursor(cursor)
+        limit = int(limit) if limit is not None else position.limit
+        if limit < 1:
+            raise ValueError("limit должен быть положительным числом")
+        # Страница не больше MAX_TOURS или размера, с которого начата выдача
+        limit = min(limit, max(settings.max_tours, position.limit))
+    except (TypeError, ValueError) as e:
+        return {"success": False, "error": str(e)}
+    request_id = position.request_id
+    session = sessions.result_sessions.get(request_id)
+    if session is None:
+        # Поиск ещё идёт в этом процессе — его последний снимок, иначе один опрос modresult
+        data = searches.snapshot(request_id) or _block_payload(await async_modresult(request_id))
+        if data is None or not _has_tour_data(data):
+            return {"success": False, "error": "Результаты поиска больше недоступны, повторите поиск", "requestid": request_id}
+        ctx = {"country_id": position.country_id, "refresh_hotels": False, "auth": searches.auth(request_id)}
+        session = _session(data, ctx, request_id)
+    tours, total = await asyncio.to_thread(
+        session.page, position.where, position.sort, position.unique_hotels, position.offset, limit
+    )
+    response: Dict[str, Any] = {"success": True, "requestid": request_id, "tours": tours, "total": total}
+    end = position.offset + len(tours)
+    if end < total:
+        response["next_cursor"] = sessions.encode_cursor(position._replace(offset=end, limit=limit))
+    return response
+
+
+def search_page(cursor: str, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Синхронная обёртка над async_search_page."""
+    return _run_sync(async_search_page(cursor, limit))
+
+
+async def async_search_state(request_id: str, limit: int = 0) -> Dict[str, Any]:
+    """Состояние поиска из реестра searches; limit > 0 — и лучшие уже найденные туры идущего поиска.
+
+    Туры берутся из последнего снимка, который уже получил цикл опроса, —
+    без запроса к Tourvisor.
+    """
+    state = searches.get(request_id)
+    if state is None:
+        return {"success": False, "error": "Поиск не найден (не запускался здесь или уже забыт)", "requestid": request_id}
+    response: Dict[str, Any] = {"success": True, **state.summary()}
+    snapshot = state.snapshot
+    if limit > 0 and snapshot is not None:
+        ctx = {
+            "country_id": state.payload.get("country"),
+            "refresh_hotels": False,
+            "auth": state.auth,
+            "unique_hotels": True,
+            "sort": None,
+        }
+        response["partial"] = await asyncio.to_thread(_normalize_tours, snapshot, ctx, limit, True, "price")
+    return response
+
+
+async def async_search_key(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Проверка параметров поиска без запроса к Tourvisor.
+
+    {"success": True, "cache_key": ...} или ошибка, как у search_tours.
+    Одинаковый cache_key — один и тот же поиск Tourvisor (filter и опции
+    выдачи на него не влияют), его результат делится через search_cache.
+    """
+    ctx = await _prepare_search(payload or {})
+    if not ctx.get("success"):
+        return ctx
+    return {"success": True, "cache_key": ctx["cache_key"]}
+
+
+async def async_search_all_tours(
+    payload: Dict[str, Any], filter_specs: Optional[Sequence[Any]] = None
+) -> Dict[str, Any]:
+    """Один поиск по payload (search_cache, склейка одинаковых) и все его туры, без limit.
+
+    filter_specs — несколько filter к одному результату: tours[i] — туры,
+    прошедшие filter_specs[i] (с filter — дополнены stars/region/rating);
+    по умолчанию — один список по payload["filter"]. stale=True — результат
+    из устаревшего кэша, пока Tourvisor недоступен.
+    """
+    payload = payload or {}
+    ctx = await _prepare_search(dict(payload, limit=0, unique_hotels=False))
+    if not ctx.get("success"):
+        return ctx
+    specs = list(filter_specs) if filter_specs is not None else [payload.get("filter")]
+    try:
+        wheres = [filters.parse_filter(spec) for spec in specs]
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    result = await _search_result(ctx)
+    if not result.get("success"):
+        return result
+
+    def collect() -> list[list[Dict[str, Any]]]:
+        plain: Optional[list[Dict[str, Any]]] = None
+        out = []
+        for where in wheres:
+            if where:
+                out.append(_tour_index(result["data"], ctx, result.get("requestid")).query(where)[0])
+                continue
+            if plain is None:
+                plain = _normalize_tours(result["data"], ctx)
+            out.append(plain)
+        return out
+
+    return {
+        "success": True,
+        "requestid": result.get("requestid"),
+        "cache_key": ctx["cache_key"],
+        "stale": bool(result.get("stale")),
+        "tours": await asyncio.to_thread(collect),
+    }
+
 
+async def async_result_delta(
+    request_id: str, country_id: Optional[int] = None, sort: Optional[str] = None
+) -> Dict[str, Any]:
+    """Один опрос modresult: только туры, появившиеся с прошлого вызова для этого requestid.
+
+    Первый вызов отдаёт всё, что уже найдено. total — сколько туров отдано за
+    все вызовы, finished — поиск на стороне Tourvisor завершён.
+    """
+    sort_error = _check_sort(sort)
+    if sort_error:
+        return sort_error
+    resp = await async_modresult(request_id)
+    if not resp.get("success"):
+        return resp
+    raw = resp.get("data")
+    progress = read_progress(raw if isinstance(raw, dict) else None)
+    diff = snapshot_diffs.get(request_id)
+    delta = diff.feed(_block_payload(resp))
+    tours: list[Dict[str, Any]] = []
+    if delta is not None:
+        ctx = {"country_id": country_id, "refresh_hotels": False, "auth": searches.auth(request_id)}
+        tours = await asyncio.to_thread(_normalize_tours, delta, ctx, 0, False, sort)
     return {
-        "success": False,
-        "error": "Туры с ценами ещё не готовы" if saw_block else "data.block не появился",
+        "success": True,
         "requestid": request_id,
+        "tours": tours,
+        "total": diff.tours,
+        "finished": bool(progress and progress.finished),
     }
 
 
+def result_delta(request_id: str, country_id: Optional[int] = None, sort: Optional[str] = None) -> Dict[str, Any]:
+    """Синхронная обёртка над async_result_delta."""
+    return _run_sync(async_result_delta(request_id, country_id, sort))
+
+
+def search_tours_batch(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Синхронная обёртка над async_search_tours_batch."""
+    return _run_sync(async_search_tours_batch(payload))
+
+
+def search_tours_flexible(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Синхронная обёртка над async_search_tours_flexible."""
+    return _run_sync(async_search_tours_flexible(payload))
+
+
+def _learn_shard(resp: Dict[str, Any]) -> None:
+    if resp.get("success"):
+        data = resp.get("data")
+        shard_router.learn(_extract_request_id(data), data)
+
+
 def modsearch(payload: Dict[str, Any]) -> Dict[str, Any]:
-    return _request(settings.modsearch_url, payload)
+    with metrics.span("modsearch"):
+        resp = _request(settings.modsearch_url, payload, idempotent=False)
+    _learn_shard(resp)
+    return resp
 
 
 def modresult(request_id: str) -> Dict[str, Any]:
-    return _request(settings.modresult_url, {settings.result_id_param: request_id})
+    resp: Dict[str, Any] = {}
+    with metrics.span("modresult"):
+        for url in shard_router.candidates(request_id):
+            resp = _request(url, {settings.result_id_param: request_id})
+            if not resp.get("unavailable"):
+                shard_router.stick(request_id, url)
+                break
+    return resp
+
+
+async def async_modsearch(payload: Dict[str, Any]) -> Dict[str, Any]:
+    with metrics.span("modsearch"):
+        resp = await _arequest(settings.modsearch_url, payload, idempotent=False)
+    _learn_shard(resp)
+    return resp
+
+
+async def async_modresult(request_id: str) -> Dict[str, Any]:
+    """modresult на шарде requestid (ShardRouter); недоступен — следующий шард."""
+    resp: Dict[str, Any] = {}
+    with metrics.span("modresult"):
+        for url in shard_router.candidates(request_id):
+            resp = await _arequest(url, {settings.result_id_param: request_id})
+            if not resp.get("unavailable"):
+                shard_router.stick(request_id, url)
+                break
+    return resp
 
 
 def _has_tour_data(raw: Dict[str, Any]) -> bool:
@@ -491,13 +1705,78 @@ def _has_tour_data(raw: Dict[str, Any]) -> bool:
     return False
 
 
+class TourRecord(NamedTuple):
+    """Компактная (tuple) запись тура; as_dict() даёт обычный JSON-формат."""
+
+    hotel_id: Optional[int]
+    hotel_name: Optional[str]
+    hotel: Optional[str]
+    hotel_link: Optional[str]
+    operator: Optional[int]
+    operator_name: Optional[str]
+    date: Optional[str]
+    nights: Optional[int]
+    price: int
+    room: Optional[int]
+    room_name: Optional[str]
+    meal: Optional[int]
+    meal_name: Optional[str]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(zip(TourRecord._fields, self))
+
+
+_TOUR_FIELDS = TourRecord._fields
+
+
+class _Memo(dict):
+    """Кэш «сырое значение поля → результат» на время одной нормализации."""
+
+    def __init__(self, resolve: Callable[[Any], Any]) -> None:
+        super().__init__()
+        self.resolve = resolve
+
+    def __missing__(self, key: Any) -> Any:
+        value = self[key] = self.resolve(key)
+        return value
+
+
+def _named(ids: Dict[str, Any], names: Dict[int, str]) -> Callable[[Any], Tuple[Optional[int], Optional[str]]]:
+    """id → (int id, имя) по словарю из ответа (ключи-строки) или справочнику."""
+
+    def resolve(raw: Any) -> Tuple[Optional[int], Optional[str]]:
+        value = _to_int(raw)
+        if value is None:
+            return None, None
+        if ids:
+            return value, (ids.get(str(value)) or {}).get("name")
+        return value, names.get(value)
+
+    return resolve
+
+
+@metrics.timed("normalize_result")
 def _normalize_result(
     raw: Dict[str, Any],
     country_id: Optional[int],
     session: Optional[str],
     referrer: Optional[str],
     refresh_hotels: bool = False,
-) -> list[Dict[str, Any]]:
+    compact: bool = False,
+    limit: int = 0,
+    unique_hotels: bool = False,
+    sort: Optional[str] = None,
+) -> list[Any]:
+    """Туры из ответа modresult за один проход.
+
+    Каждое поле тура разбирается один раз, повторяющиеся значения (операторы,
+    даты, номера, питание) — через _Memo, данные отеля — один раз на отель.
+    compact=True возвращает TourRecord вместо dict.
+
+    С limit/unique_hotels/sort сначала по сырым турам отбираются победители
+    (_pick_tours), и полностью нормализуются только они; результат
+    отсортирован по sort (по умолчанию — по цене).
+    """
     data = raw.get("data", raw)
     if not isinstance(data, dict):
         return []
@@ -542,14 +1821,96 @@ def _normalize_result(
                     continue
 
     # Fallback to list endpoints if needed
-    hotel_names = _get_hotel_names(
-        country_id, session=session, referrer=referrer, force_refresh=refresh_hotels
-    ) if not hotel_dict else {}
+    hotel_names: Dict[int, str] = {}
+    hotel_stars: Dict[int, Optional[int]] = {}
+    if hotel_dict:
+        if sort == "stars":
+            hotel_stars = {
+                hid: _to_int(v.get("stars"))
+                for hid, v in ((_to_int(k), v) for k, v in hotel_dict.items())
+                if hid is not None and isinstance(v, dict)
+            }
+    else:
+        _ensure_hotels(country_id, session=session, referrer=referrer, force_refresh=refresh_hotels)
     meal_names = _get_meal_names() if not meal_dict else {}
     room_names = _get_room_names() if not room_dict else {}
     op_names = _get_operator_names() if not op_dict else {}
 
-    tours: list[Dict[str, Any]] = []
+    selecting = unique_hotels or limit > 0 or sort is not None
+    if selecting:
+        if sort == "stars" and not hotel_dict:
+            found = hotel_directory.lookup(_block_hotel_ids(block))
+            hotel_stars = {hid: info.stars for hid, info in found.items()}
+        picked = _pick_tours(block, limit, unique_hotels, _sort_key(sort or "price", hotel_stars))
+    else:
+        picked = _hotel_tours(block)
+    if not hotel_dict:
+        # Имена нужны только отобранным отелям
+        picked = list(picked)
+        wanted = {_to_int(h.get("hotelid") or h.get("id")) for h, _ in picked}
+        hotel_names = {hid: info.name for hid, info in hotel_directory.lookup(wanted).items()}
+
+    def operator(raw_op: Any) -> Tuple[Optional[int], Optional[str]]:
+        value = _to_int(raw_op)
+        if value is None:
+            return None, None
+        return value, op_dict.get(value) if op_dict else op_names.get(value)
+
+    def hotel_fields(h: Dict[str, Any]) -> tuple:
+        raw_hotel_id = h.get("hotelid") or h.get("id")
+        hotel_id = _to_int(raw_hotel_id)
+        if hotel_dict and raw_hotel_id is not None:
+            info = hotel_dict.get(str(raw_hotel_id)) or {}
+            link = link_base + str(info.get("link")) if info.get("link") else None
+            return hotel_id, info.get("name"), info.get("name"), link
+        if hotel_id:
+            name = hotel_names.get(hotel_id) or f"Hotel {raw_hotel_id}"
+            return hotel_id, name, name, None
+        return hotel_id, None, f"Hotel {raw_hotel_id}", None
+
+    operators = _Memo(operator)
+    rooms = _Memo(_named(room_dict, room_names))
+    meals = _Memo(_named(meal_dict, meal_names))
+    dates = _Memo(_to_date)
+    ints = _Memo(_to_int)
+    link_base = settings.hotel_link_base
+
+    tours: list[Any] = []
+    append = tours.append
+    last_hotel: Optional[Dict[str, Any]] = None
+    hotel_values: tuple = ()
+    for h, tours_list in picked:
+        if h is not last_hotel:
+            last_hotel, hotel_values = h, hotel_fields(h)
+        for t in tours_list:
+            price = _to_int(t.get("price") or t.get("pr"))
+            if price is None:
+                continue
+            raw_op = t.get("operator") or t.get("op")
+            raw_date = t.get("date") or t.get("dt")
+            raw_nights = t.get("nights") or t.get("nt")
+            raw_room = t.get("room") or t.get("rm")
+            raw_meal = t.get("meal") or t.get("ml")
+            try:
+                op, op_name = operators[raw_op]
+                date = dates[raw_date]
+                nights = ints[raw_nights]
+                room, room_name = rooms[raw_room]
+                meal, meal_name = meals[raw_meal]
+            except TypeError:
+                # нехэшируемое значение (list/dict) — считаем без кэша
+                op, op_name = operators.resolve(raw_op)
+                date = _to_date(raw_date)
+                nights = _to_int(raw_nights)
+                room, room_name = rooms.resolve(raw_room)
+                meal, meal_name = meals.resolve(raw_meal)
+            values = hotel_values + (op, op_name, date, nights, price, room, room_name, meal, meal_name)
+            append(TourRecord(*values) if compact else dict(zip(_TOUR_FIELDS, values)))
+    return tours
+
+
+def _hotel_tours(block: list) -> Iterator[Tuple[Dict[str, Any], list]]:
+    """(отель, список туров) из data.block в исходном порядке."""
     for b in block:
         hotels = b.get("hotel") if isinstance(b, dict) else None
         if hotels is None:
@@ -561,7 +1922,6 @@ def _normalize_result(
         for h in hotels:
             if not isinstance(h, dict):
                 continue
-            hotel_id = h.get("hotelid") or h.get("id")
             tours_list = h.get("tour")
             if tours_list is None:
                 continue
@@ -569,56 +1929,114 @@ def _normalize_result(
                 tours_list = [tours_list]
             if not isinstance(tours_list, list):
                 continue
+            yield h, [t for t in tours_list if isinstance(t, dict)]
+
+
+def _date_order(value: Any) -> str:
+    s = str(value or "").strip()
+    if len(s) >= 10 and s[2] == "." and s[5] == ".":
+        return f"{s[6:10]}{s[3:5]}{s[0:2]}"
+    return s.replace("-", "")
+
+
+def _sort_key(sort: str, hotel_stars: Dict[int, Optional[int]]) -> Callable[[Optional[int], Dict[str, Any], int], tuple]:
+    """Ключ сортировки по сырому туру: (hotel_id, tour, price) -> tuple."""
+    if sort == "price_per_night":
+        ints = _Memo(_to_int)
+
+        def key(hid: Optional[int], t: Dict[str, Any], price: int) -> tuple:
+            raw = t.get("nights") or t.get("nt")
+            try:
+                nights = ints[raw]
+            except TypeError:
+                nights = None
+            return (price / nights if nights else float(price), price)
+    elif sort == "date":
+        orders = _Memo(_date_order)
+
+        def key(hid: Optional[int], t: Dict[str, Any], price: int) -> tuple:
+            raw = t.get("date") or t.get("dt")
+            try:
+                return (orders[raw], price)
+            except TypeError:
+                return (_date_order(raw), price)
+    elif sort == "stars":
+        def key(hid: Optional[int], t: Dict[str, Any], price: int) -> tuple:
+            return (-(hotel_stars.get(hid) or 0), price)
+    else:
+        def key(hid: Optional[int], t: Dict[str, Any], price: int) -> tuple:
+            return (price,)
+    return key
+
+
+def _pick_tours(
+    block: list,
+    limit: int,
+    unique_hotels: bool,
+    key: Callable[[Optional[int], Dict[str, Any], int], tuple],
+) -> list[Tuple[Dict[str, Any], list]]:
+    """Отбор лучших туров по сырым данным, до нормализации.
+
+    При unique_hotels держит по одному лучшему туру на отель (память — по числу
+    отелей), затем берёт limit лучших отелей; иначе — heapq.nsmallest по всем
+    турам (куча размера limit). Нормализовать потом нужно только победителей.
+    """
+
+    def candidates() -> Iterator[tuple]:
+        seq = 0
+        for h, tours_list in _hotel_tours(block):
+            hid = _to_int(h.get("hotelid") or h.get("id"))
             for t in tours_list:
-                if not isinstance(t, dict):
-                    continue
                 price = _to_int(t.get("price") or t.get("pr"))
                 if price is None:
                     continue
-                tours.append(
-                    {
-                        "hotel_id": _to_int(hotel_id),
-                        "hotel_name": (
-                            (hotel_dict.get(str(hotel_id)) or {}).get("name")
-                            if hotel_dict and hotel_id is not None
-                            else (hotel_names.get(_to_int(hotel_id)) or f"Hotel {hotel_id}") if _to_int(hotel_id) else None
-                        ),
-                        "hotel": (
-                            (hotel_dict.get(str(hotel_id)) or {}).get("name")
-                            if hotel_dict and hotel_id is not None
-                            else (hotel_names.get(_to_int(hotel_id)) or f"Hotel {hotel_id}") if _to_int(hotel_id) else f"Hotel {hotel_id}"
-                        ),
-                        "hotel_link": (
-                            settings.hotel_link_base + str((hotel_dict.get(str(hotel_id)) or {}).get("link"))
-                            if hotel_dict and hotel_id is not None and (hotel_dict.get(str(hotel_id)) or {}).get("link")
-                            else None
-                        ),
-                        "operator": _to_int(t.get("operator") or t.get("op")),
-                        "operator_name": (
-                            op_dict.get(_to_int(t.get("operator") or t.get("op")))
-                            if _to_int(t.get("operator") or t.get("op")) is not None
-                            else op_names.get(_to_int(t.get("operator") or t.get("op")))
-                        ),
-                        "date": _to_date(t.get("date") or t.get("dt")),
-                        "nights": _to_int(t.get("nights") or t.get("nt")),
-                        "price": price,
-                        "room": _to_int(t.get("room") or t.get("rm")),
-                        "room_name": (
-                            (room_dict.get(str(_to_int(t.get("room") or t.get("rm")))) or {}).get("name")
-                            if room_dict and _to_int(t.get("room") or t.get("rm")) is not None
-                            else room_names.get(_to_int(t.get("room") or t.get("rm")))
-                        ),
-                        "meal": _to_int(t.get("meal") or t.get("ml")),
-                        "meal_name": (
-                            (meal_dict.get(str(_to_int(t.get("meal") or t.get("ml")))) or {}).get("name")
-                            if meal_dict and _to_int(t.get("meal") or t.get("ml")) is not None
-                            else meal_names.get(_to_int(t.get("meal") or t.get("ml")))
-                        ),
-                    }
-                )
-    return tours
+                seq += 1
+                yield key(hid, t, price), seq, hid, h, t
+
+    if unique_hotels:
+        best: Dict[int, tuple] = {}
+        for item in candidates():
+            hid = item[2]
+            if hid is None:
+                continue
+            prev = best.get(hid)
+            if prev is None or item[:2] < prev[:2]:
+                best[hid] = item
+        pool: Iterable[tuple] = best.values()
+    else:
+        pool = candidates()
+    winners = heapq.nsmallest(limit, pool) if limit > 0 else sorted(pool)
+    return [(item[3], [item[4]]) for item in winners]
+
+
+def _learn_hotels(raw: Dict[str, Any], country_id: Optional[int]) -> None:
+    """Отели из словаря hotels ответа modresult пополняют hotel_directory."""
+    data = raw.get("data", raw)
+    hotels = data.get("hotels") if isinstance(data, dict) else None
+    if not isinstance(hotels, dict):
+        return
+    infos = (hotel_from_item(k, v, country_id) for k, v in hotels.items() if isinstance(v, dict))
+    # upsert переписывает только изменившиеся строки
+    hotel_directory.upsert(info for info in infos if info)
+
+
+def _block_hotel_ids(block: list) -> set:
+    ids = set()
+    for b in block:
+        hotels = b.get("hotel") if isinstance(b, dict) else None
+        if isinstance(hotels, dict):
+            hotels = [hotels]
+        if not isinstance(hotels, list):
+            continue
+        for h in hotels:
+            if isinstance(h, dict):
+                hid = _to_int(h.get("hotelid") or h.get("id"))
+                if hid is not None:
+                    ids.add(hid)
+    return ids
 
 
+@metrics.timed("unique_hotels")
 def _unique_hotels(tours: list[Dict[str, Any]]) -> list[Dict[str, Any]]:
     """Группирует туры по отелю и оставляет самый дешевый вариант."""
     best: Dict[int, Dict[str, Any]] = {}
@@ -635,8 +2053,12 @@ def _unique_hotels(tours: list[Dict[str, Any]]) -> list[Dict[str, Any]]:
 def _to_int(value: Any) -> Optional[int]:
     if value is None:
         return None
+    kind = type(value)
+    if kind is int:
+        return value
     try:
-        return int(str(value).strip())
+        # int() сам отбрасывает пробелы по краям строки
+        return int(value) if kind is str else int(str(value).strip())
     except Exception:
         return None
 
@@ -647,6 +2069,7 @@ def _to_date(value: Any) -> Optional[str]:
     s = str(value).strip()
     if len(s) == 10 and s[4] == "-" and s[7] == "-":
         return s
-    if len(s) >= 10 and s[4] == "." and s[7] == ".":
+    if len(s) >= 10 and s[2] == "." and s[5] == ".":
+        # DD.MM.YYYY из Tourvisor -> YYYY-MM-DD: filter и сортировка по дате сравнивают ISO-строки
         return f"{s[6:10]}-{s[3:5]}-{s[0:2]}"
     return s or None
@@ -0,0 +1,420 @@
+from __future__ import annotations
+
+import bisect
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import jsonutil
+
+# Классы питания по возрастанию: фильтр {"meal": {"gte": "HB"}} — HB, FB, AI, UAI
+MEAL_CLASSES = ("RO", "BB", "HB", "FB", "AI", "UAI")
+_MEAL_CODES = {
+    "RO": "RO", "OB": "RO", "AO": "RO", "SC": "RO", "NO": "RO", "BO": "RO",
+    "BB": "BB", "HB": "HB", "FB": "FB",
+    "AI": "AI", "ALL": "AI", "AL": "AI",
+    "UAI": "UAI", "UALL": "UAI", "UAL": "UAI",
+}
+# Русские названия, если кода в начале нет (порядок важен: «ультра» раньше «всё включено»)
+_MEAL_WORDS = (
+    ("ультра", "UAI"),
+    ("ultra", "UAI"),
+    ("все включено", "AI"),
+    ("всё включено", "AI"),
+    ("all inclusive", "AI"),
+    ("полный пансион", "FB"),
+    ("полупансион", "HB"),
+    ("завтрак", "BB"),
+    ("без питания", "RO"),
+)
+_MEAL_CODE = re.compile(r"[A-Za-z]+")
+
+# Поле фильтра -> тип значения
+FIELDS = {
+    "price": "number",
+    "price_per_night": "number",
+    "nights": "number",
+    "date": "date",
+    "stars": "number",
+    "rating": "number",
+    "meal": "meal",
+    "region": "text",
+    "hotel": "text",
+    "operator": "text",
+    "room": "text",
+}
+_FIELD_ALIASES = {"hotel_name": "hotel", "operator_name": "operator", "room_name": "room", "meal_name": "meal"}
+OPS = ("eq", "ne", "in", "nin", "gt", "gte", "lt", "lte", "contains")
+_OP_ALIASES = {"min": "gte", "max": "lte", "from": "gte", "to": "lte", "not": "ne"}
+# Операторы по типу поля: contains — только для текста, сравнения — только для упорядоченных значений
+_KIND_OPS = {
+    "number": ("eq", "ne", "in", "nin", "gt", "gte", "lt", "lte"),
+    "date": ("eq", "ne", "in", "nin", "gt", "gte", "lt", "lte"),
+    "meal": ("eq", "ne", "in", "nin", "gt", "gte", "lt", "lte"),
+    "text": ("eq", "ne", "in", "nin", "contains"),
+}
+# Поля с предрасчитанными индексами: цена — отсортированный массив, звёзды и питание — корзины
+_BUCKETS = ("stars", "meal")
+_ORDERS = ("price", "price_per_night", "date", "stars", "rating")
+
+
+class Condition(NamedTuple):
+    field: str
+    op: str
+    value: Any
+
+
+class HotelAttrs(NamedTuple):
+    stars: Optional[int]
+    region: Optional[str]
+    rating: Optional[float]
+
+
+def meal_class(name: Any) -> Optional[str]:
+    """«AI - Всё включено», «HB+», «Завтрак» -> класс из MEAL_CLASSES (или None)."""
+    if name is None:
+        return None
+    text = str(name).strip()
+    code = _MEAL_CODE.match(text)
+    if code:
+        found = _MEAL_CODES.get(code.group(0).upper())
+        if found:
+            return found
+    lowered = text.lower()
+    for word, found in _MEAL_WORDS:
+        if word in lowered:
+            return found
+    return None
+
+
+def _number(value: Any) -> Optional[float]:
+    if value in (None, ""):
+        return None
+    try:
+        return float(str(value).replace(",", ".").strip())
+    except ValueError:
+        return None
+
+
+def hotel_attrs(item: Dict[str, Any]) -> HotelAttrs:
+    """Звёзды, курорт и рейтинг из элемента словаря hotels ответа modresult."""
+    stars = _number(item.get("stars"))
+    rating = _number(item.get("rating"))
+    region = item.get("regionname") or item.get("region")
+    return HotelAttrs(
+        int(stars) if stars is not None else None,
+        str(region) if region else None,
+        rating if rating else None,
+    )
+
+
+def _iso_date(value: Any) -> Optional[str]:
+    s = str(value or "").strip()
+    if len(s) == 10 and s[2] == "." and s[5] == ".":
+        return f"{s[6:10]}-{s[3:5]}-{s[0:2]}"
+    if len(s) == 10 and s[4] == "-" and s[7] == "-":
+        return s
+    return None
+
+
+def _coerce(field: str, kind: str, value: Any) -> Any:
+    if kind == "number":
+        number = _number(value)
+        if number is None:
+            raise ValueError(f"filter.{field}: ожидается число, получено {value!r}")
+        return number
+    if kind == "date":
+        date = _iso_date(value)
+        if date is None:
+            raise ValueError(f"filter.{field}: ожидается дата YYYY-MM-DD, получено {value!r}")
+        return date
+    if kind == "meal":
+        found = meal_class(value)
+        if found is None:
+            raise ValueError(f"filter.{field}: неизвестное питание {value!r}, доступны: {', '.join(MEAL_CLASSES)}")
+        return MEAL_CLASSES.index(found)
+    # operator: число — id оператора, строка — часть названия
+    if field == "operator" and isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return str(value).strip().lower()
+
+
+def op_allowed(field: str, op: str) -> bool:
+    """Подходит ли оператор к полю (operator_id — id оператора, число)."""
+    kind = "number" if field == "operator_id" else FIELDS.get(field)
+    return kind is not None and op in _KIND_OPS[kind]
+
+
+def parse_filter(spec: Any) -> List[Condition]:
+    """{"stars": {"gte": 4}, "meal": ["AI", "UAI"], "region": "Кемер"} -> условия.
+
+    Значение-объект — операторы (eq, ne, in, nin, gt, gte, lt, lte, contains;
+    min/max — синонимы gte/lte), список — in, скаляр — eq (для текстовых
+    полей — вхождение подстроки без учёта регистра). Ошибки — ValueError с
+    текстом для ответа.
+    """
+    if isinstance(spec, str):
+        try:
+            spec = jsonutil.loads(spec) if spec.strip() else None
+        except Exception:
+            raise ValueError("filter должен быть объектом {поле: условие}") from None
+    if not spec:
+        return []
+    if not isinstance(spec, dict):
+        raise ValueError("filter должен быть объектом {поле: условие}")
+    conditions: List[Condition] = []
+    for raw_field, rule in spec.items():
+        field = _FIELD_ALIASES.get(raw_field, raw_field)
+        kind = FIELDS.get(field)
+        if kind is None:
+            raise ValueError(f"Неизвестное поле filter: {raw_field}. Доступны: {', '.join(FIELDS)}")
+        if isinstance(rule, dict):
+            items = list(rule.items())
+        elif isinstance(rule, list):
+            items = [("contains" if kind == "text" else "in", rule)]
+        else:
+            items = [("contains" if kind == "text" else "eq", rule)]
+        for raw_op, value in items:
+            op = _OP_ALIASES.get(raw_op, raw_op)
+            if op not in OPS:
+                raise ValueError(f"filter.{raw_field}: неизвестный оператор {raw_op}. Доступны: {', '.join(OPS)}")
+            if op not in _KIND_OPS[kind]:
+                raise ValueError(
+                    f"filter.{raw_field}: оператор {raw_op} не подходит к полю, доступны: {', '.join(_KIND_OPS[kind])}"
+                )
+            if op in ("in", "nin") or (op == "contains" and isinstance(value, list)):
+                values = value if isinstance(value, list) else [value]
+                condition = Condition(field, op, tuple(_coerce(field, kind, v) for v in values))
+            else:
+                if isinstance(value, (list, dict)):
+                    raise ValueError(f"filter.{raw_field}.{raw_op}: ожидается одно значение")
+                condition = Condition(field, op, _coerce(field, kind, value))
+            conditions.append(_by_operator_id(condition))
+    return conditions
+
+
+def _by_operator_id(c: Condition) -> Condition:
+    """{"operator": 16} / {"operator": [16, 17]} — сравнение по id оператора, а не по названию."""
+    if c.field != "operator":
+        return c
+    values = c.value if isinstance(c.value, tuple) else (c.value,)
+    if not values or not all(isinstance(v, int) for v in values):
+        return c
+    if c.op == "contains":
+        return Condition("operator_id", "in", values)
+    return Condition("operator_id", c.op, c.value)
+
+
+def tour_row(tour: Dict[str, Any], attrs: Optional[HotelAttrs]) -> Dict[str, Any]:
+    """Тур в формате выдачи: поля TourRecord + stars, region, rating отеля (None, если неизвестны).
+
+    Одна проекция для всех путей выдачи (быстрый отбор по сырому ответу и
+    TourIndex), чтобы набор ключей не зависел от размера результата и limit.
+    """
+    tour["stars"], tour["region"], tour["rating"] = attrs if attrs is not None else (None, None, None)
+    return tour
+
+
+def _compare(op: str, value: Any) -> Callable[[Any], bool]:
+    """Проверка одного значения столбца; неизвестное значение (None) проходит только ne/nin."""
+    if op == "eq":
+        return lambda v: v is not None and v == value
+    if op == "ne":
+        return lambda v: v is None or v != value
+    if op == "in":
+        allowed = set(value)
+        return lambda v: v is not None and v in allowed
+    if op == "nin":
+        banned = set(value)
+        return lambda v: v is None or v not in banned
+    if op == "gt":
+        return lambda v: v is not None and v > value
+    if op == "gte":
+        return lambda v: v is not None and v >= value
+    if op == "lt":
+        return lambda v: v is not None and v < value
+    if op == "lte":
+        return lambda v: v is not None and v <= value
+    parts = value if isinstance(value, tuple) else (value,)
+    return lambda v: v is not None and any(p in v for p in parts)
+
+
+class TourIndex:
+    """Туры одного снимка modresult в столбцах + индексы для filter и sort.
+
+    Строится один раз на снимок (sessions.result_sessions): цена — отсортированный массив
+    (диапазон цены — bisect), звёзды и класс питания — корзины «значение ->
+    строки», порядки выдачи по каждому sort считаются при первом обращении.
+    query() пересекает кандидатов из индексов, остальные условия проверяет по
+    столбцам и проходит строки уже в нужном порядке, поэтому повторный запрос
+    к тому же поиску с другим filter/sort не трогает сырые данные.
+    """
+
+    def __init__(self, tours: Sequence[Any], hotels: Dict[int, HotelAttrs]) -> None:
+        # tours — TourRecord из eto_client._normalize_result(compact=True)
+        self.tours = list(tours)
+        self.hotels = hotels
+        none = HotelAttrs(None, None, None)
+        attrs = [hotels.get(t.hotel_id, none) if t.hotel_id is not None else none for t in self.tours]
+        meal_ranks: Dict[Any, Optional[int]] = {}
+        meals: List[Optional[int]] = []
+        for t in self.tours:
+            rank = meal_ranks.get(t.meal_name, -1)
+            if rank == -1:
+                found = meal_class(t.meal_name)
+                rank = meal_ranks[t.meal_name] = MEAL_CLASSES.index(found) if found else None
+            meals.append(rank)
+        self._columns: Dict[str, List[Any]] = {
+            "price": [t.price for t in self.tours],
+            "nights": [t.nights for t in self.tours],
+            "date": [t.date for t in self.tours],
+            "stars": [a.stars for a in attrs],
+            "rating": [a.rating for a in attrs],
+            "meal": meals,
+        }
+        self._attrs = attrs
+        self._orders: Dict[str, List[int]] = {}
+        self._ranks: Dict[str, List[int]] = {}
+        self._buckets: Dict[str, Dict[Any, List[int]]] = {}
+        by_price = self._order("price")
+        self._prices = [self.tours[i].price for i in by_price]
+
+    def __len__(self) -> int:
+        return len(self.tours)
+
+    def _column(self, field: str) -> List[Any]:
+        column = self._columns.get(field)
+        if column is not None:
+            return column
+        if field == "price_per_night":
+            column = [t.price / t.nights if t.nights else float(t.price) for t in self.tours]
+        elif field == "region":
+            column = [a.region.lower() if a.region else None for a in self._attrs]
+        elif field == "hotel":
+            column = [(t.hotel_name or t.hotel or "").lower() or None for t in self.tours]
+        elif field == "operator":
+            column = [(t.operator_name or "").lower() or None for t in self.tours]
+        elif field == "operator_id":
+            column = [t.operator for t in self.tours]
+        elif field == "room":
+            column = [(t.room_name or "").lower() or None for t in self.tours]
+        else:
+            raise KeyError(field)
+        self._columns[field] = column
+        return column
+
+    def _order(self, sort: str) -> List[int]:
+        order = self._orders.get(sort)
+        if order is not None:
+            return order
+        price = self._columns["price"]
+        if sort == "stars":
+            stars = self._columns["stars"]
+            key: Callable[[int], tuple] = lambda i: (-(stars[i] or 0), price[i])
+        elif sort == "rating":
+            rating = self._columns["rating"]
+            key = lambda i: (-(rating[i] or 0.0), price[i])
+        elif sort == "date":
+            dates = self._columns["date"]
+            key = lambda i: (dates[i] or "", price[i])
+        elif sort == "price_per_night":
+            ppn = self._column("price_per_night")
+            key = lambda i: (ppn[i], price[i])
+        else:
+            key = lambda i: (price[i],)
+        order = self._orders[sort] = sorted(range(len(self.tours)), key=key)
+        rank = [0] * len(order)
+        for pos, row in enumerate(order):
+            rank[row] = pos
+        self._ranks[sort] = rank
+        return order
+
+    def _bucket(self, field: str) -> Dict[Any, List[int]]:
+        buckets = self._buckets.get(field)
+        if buckets is None:
+            buckets = {}
+            for i, value in enumerate(self._columns[field]):
+                buckets.setdefault(value, []).append(i)
+            self._buckets[field] = buckets
+        return buckets
+
+    def _price_range(self, conditions: List[Condition]) -> Optional[Set[int]]:
+        low, high = 0, len(self._prices)
+        for c in conditions:
+            if c.op == "gte":
+                low = max(low, bisect.bisect_left(self._prices, c.value))
+            elif c.op == "gt":
+                low = max(low, bisect.bisect_right(self._prices, c.value))
+            elif c.op == "lte":
+                high = min(high, bisect.bisect_right(self._prices, c.value))
+            elif c.op == "lt":
+                high = min(high, bisect.bisect_left(self._prices, c.value))
+            elif c.op == "eq":
+                low = max(low, bisect.bisect_left(self._prices, c.value))
+                high = min(high, bisect.bisect_right(self._prices, c.value))
+        if low == 0 and high == len(self._prices):
+            return None
+        return set(self._orders["price"][low:high]) if low < high else set()
+
+    def _candidates(self, where: Sequence[Condition]) -> Tuple[Optional[Set[int]], List[Condition]]:
+        """Строки, прошедшие индексируемые условия (None — все), и оставшиеся условия."""
+        allowed: Optional[Set[int]] = None
+        rest: List[Condition] = []
+        price = [c for c in where if c.field == "price" and c.op in ("gt", "gte", "lt", "lte", "eq")]
+        if price:
+            allowed = self._price_range(price)
+        for c in where:
+            if c in price:
+                continue
+            if c.field not in _BUCKETS:
+                rest.append(c)
+                continue
+            check = _compare(c.op, c.value)
+            rows: Set[int] = set()
+            for value, ids in self._bucket(c.field).items():
+                if check(value):
+                    rows.update(ids)
+            allowed = rows if allowed is None else allowed & rows
+        return allowed, rest
+
+    def row(self, i: int) -> Dict[str, Any]:
+        return tour_row(self.tours[i].as_dict(), self._attrs[i])
+
+    def select(self, where: Sequence[Condition] = (), sort: str = "price", unique_hotels: bool = False) -> List[int]:
+        """Номера строк, прошедших filter, в порядке sort (при unique_hotels — лучшая на отель)."""
+        sort = sort if sort in _ORDERS else "price"
+        order = self._order(sort)
+        allowed, rest = self._candidates(where)
+        rows: Sequence[int] = order
+        if allowed is not None and len(allowed) * 4 < len(order):
+            # Кандидатов мало — сортируем их по позиции в порядке, а не проходим весь порядок
+            rows = sorted(allowed, key=self._ranks[sort].__getitem__)
+            allowed = None
+        checks = [(self._column(c.field), _compare(c.op, c.value)) for c in rest]
+        hotel_ids = [t.hotel_id for t in self.tours] if unique_hotels else None
+        seen: Set[Any] = set()
+        out: List[int] = []
+        for i in rows:
+            if allowed is not None and i not in allowed:
+                continue
+            if checks and not all(check(column[i]) for column, check in checks):
+                continue
+            if hotel_ids is not None:
+                hid = hotel_ids[i]
+                if hid is None or hid in seen:
+                    continue
+                seen.add(hid)
+            out.append(i)
+        return out
+
+    def query(
+        self,
+        where: Sequence[Condition] = (),
+        sort: str = "price",
+        limit: int = 0,
+        unique_hotels: bool = False,
+        offset: int = 0,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """(туры offset..offset+limit в порядке sort, сколько всего прошло filter)."""
+        rows = self.select(where, sort, unique_hotels)
+        page = rows[offset:offset + limit] if limit > 0 else rows[offset:]
+        return [self.row(i) for i in page], len(rows)
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional
+
+from config import settings
+
+# SQLite ограничивает число параметров в запросе
+_LOOKUP_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hotels (
+    id INTEGER PRIMARY KEY,
+    country_id INTEGER,
+    name TEXT NOT NULL,
+    link TEXT,
+    stars INTEGER,
+    region TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS hotels_country ON hotels (country_id);
+CREATE TABLE IF NOT EXISTS countries (
+    country_id INTEGER PRIMARY KEY,
+    refreshed REAL NOT NULL
+);
+"""
+
+
+@dataclass(frozen=True)
+class HotelInfo:
+    id: int
+    name: str
+    country_id: Optional[int] = None
+    link: Optional[str] = None
+    stars: Optional[int] = None
+    region: Optional[str] = None
+
+
+class HotelDirectory:
+    """Справочник отелей на диске (SQLite + mmap).
+
+    В память процесса не грузится целиком: lookup достаёт только нужные id.
+    Обновление инкрементальное — upsert переписывает лишь изменившиеся строки,
+    а отели, пропавшие из listdev, остаются (их id ещё встречаются в выдаче).
+    """
+
+    def __init__(self, path: str, mmap_size: int = 0) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        if mmap_size > 0:
+            self._conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        self._conn.executescript(_SCHEMA)
+
+    def lookup(self, ids: Iterable[int]) -> Dict[int, HotelInfo]:
+        wanted = list({i for i in ids if i is not None})
+        out: Dict[int, HotelInfo] = {}
+        with self._lock:
+            for start in range(0, len(wanted), _LOOKUP_CHUNK):
+                chunk = wanted[start:start + _LOOKUP_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT id, name, country_id, link, stars, region FROM hotels WHERE id IN ({marks})",
+                    chunk,
+                ).fetchall()
+                for row in rows:
+                    out[row[0]] = HotelInfo(*row)
+        return out
+
+    def upsert(self, hotels: Iterable[HotelInfo]) -> int:
+        """Записывает отели; возвращает число реально изменённых строк."""
+        now = time.time()
+        rows = [(h.id, h.country_id, h.name, h.link, h.stars, h.region, now) for h in hotels]
+        if not rows:
+            return 0
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    """
+                    INSERT INTO hotels (id, country_id, name, link, stars, region, updated)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        country_id = COALESCE(excluded.country_id, hotels.country_id),
+                        name = excluded.name,
+                        link = COALESCE(excluded.link, hotels.link),
+                        stars = COALESCE(excluded.stars, hotels.stars),
+                        region = COALESCE(excluded.region, hotels.region),
+                        updated = excluded.updated
+                    WHERE excluded.name IS NOT hotels.name
+                        OR (excluded.country_id IS NOT NULL AND excluded.country_id IS NOT hotels.country_id)
+                        OR (excluded.link IS NOT NULL AND excluded.link IS NOT hotels.link)
+                        OR (excluded.stars IS NOT NULL AND excluded.stars IS NOT hotels.stars)
+                        OR (excluded.region IS NOT NULL AND excluded.region IS NOT hotels.region)
+                    """,
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.total_changes - before
+
+    def refreshed_at(self, country_id: int) -> Optional[float]:
+        """Когда список отелей страны последний раз грузился целиком (None — никогда)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT refreshed FROM countries WHERE country_id = ?", (country_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def mark_refreshed(self, country_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO countries (country_id, refreshed) VALUES (?, ?)",
+                (country_id, time.time()),
+            )
+
+    def count(self, country_id: Optional[int] = None) -> int:
+        with self._lock:
+            if country_id is None:
+                row = self._conn.execute("SELECT COUNT(*) FROM hotels").fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT COUNT(*) FROM hotels WHERE country_id = ?", (country_id,)
+                ).fetchone()
+        return row[0]
+
+
+def hotel_from_item(hotel_id: Any, item: Dict[str, Any], country_id: Optional[int] = None) -> Optional[HotelInfo]:
+    """HotelInfo из элемента listdev.php или словаря hotels ответа modresult."""
+    try:
+        hid = int(str(hotel_id).strip())
+    except Exception:
+        return None
+    name = item.get("name")
+    if not name:
+        return None
+    stars = item.get("stars")
+    try:
+        stars = int(str(stars).strip()) if stars not in (None, "") else None
+    except Exception:
+        stars = None
+    country = country_id
+    if country is None and item.get("country") not in (None, ""):
+        try:
+            country = int(str(item.get("country")).strip())
+        except Exception:
+            country = None
+    link = item.get("link")
+    region = item.get("regionname") or item.get("region")
+    return HotelInfo(
+        id=hid,
+        name=str(name),
+        country_id=country,
+        link=str(link) if link else None,
+        stars=stars,
+        region=str(region) if region else None,
+    )
+
+
+def _default_path() -> str:
+    path = settings.hotel_db_path
+    return path if path == ":memory:" else os.path.expanduser(path)
+
+
+hotel_directory = HotelDirectory(_default_path(), mmap_size=settings.hotel_db_mmap)
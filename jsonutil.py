@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, Tuple, Union
+
+from config import settings
+
+
+def _stdlib() -> Tuple[str, Callable[[Union[str, bytes]], Any], Callable[[Any, int], str]]:
+    def dumps(obj: Any, indent: int = 0) -> str:
+        if indent > 0:
+            return json.dumps(obj, ensure_ascii=False, indent=indent, default=str)
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+    return "json", json.loads, dumps
+
+
+def _orjson() -> Tuple[str, Callable[[Union[str, bytes]], Any], Callable[[Any, int], str]]:
+    import orjson
+
+    options = orjson.OPT_NON_STR_KEYS
+    _, _, fallback = _stdlib()
+
+    def dumps(obj: Any, indent: int = 0) -> str:
+        opts = options | orjson.OPT_INDENT_2 if indent > 0 else options
+        try:
+            return orjson.dumps(obj, default=str, option=opts).decode("utf-8")
+        except TypeError:
+            # например, int шире 64 бит
+            return fallback(obj, indent)
+
+    return "orjson", orjson.loads, dumps
+
+
+def _msgspec() -> Tuple[str, Callable[[Union[str, bytes]], Any], Callable[[Any, int], str]]:
+    import msgspec
+
+    encoder = msgspec.json.Encoder(enc_hook=str)
+    decoder = msgspec.json.Decoder()
+    _, _, fallback = _stdlib()
+
+    def dumps(obj: Any, indent: int = 0) -> str:
+        try:
+            raw = encoder.encode(obj)
+        except (TypeError, OverflowError, msgspec.EncodeError):
+            return fallback(obj, indent)
+        if indent > 0:
+            raw = msgspec.json.format(raw, indent=indent)
+        return raw.decode("utf-8")
+
+    return "msgspec", decoder.decode, dumps
+
+
+def _select(preferred: str) -> Tuple[str, Callable[[Union[str, bytes]], Any], Callable[[Any, int], str]]:
+    """JSON_BACKEND: auto (orjson → msgspec → json) или конкретный бэкенд."""
+    preferred = (preferred or "auto").strip().lower()
+    order = {"auto": (_orjson, _msgspec, _stdlib), "orjson": (_orjson, _stdlib), "msgspec": (_msgspec, _stdlib)}
+    for factory in order.get(preferred, (_stdlib,)):
+        try:
+            return factory()
+        except ImportError:
+            continue
+    return _stdlib()
+
+
+backend, _loads, _dumps = _select(settings.json_backend)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    return _loads(data)
+
+
+def dumps(obj: Any, indent: int = 0) -> str:
+    """JSON-строка без экранирования кириллицы; indent=0 — компактно, без пробелов."""
+    return _dumps(obj, indent)
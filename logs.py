@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import atexit
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+import jsonutil
+import metrics
+from config import settings
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+# Поля корреляции текущего запроса (call_id MCP, request_id HTTP, requestid поиска)
+_CONTEXT: ContextVar[Dict[str, Any]] = ContextVar("eto_log_context", default={})
+_STOP = object()
+
+
+def new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def bind(**fields: Any) -> Iterator[None]:
+    """Добавляет поля ко всем событиям внутри блока (и в задачах, созданных в нём)."""
+    token = _CONTEXT.set({**_CONTEXT.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _CONTEXT.reset(token)
+
+
+def _parse_sample(raw: str) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for item in raw.split(","):
+        name, _, rate = item.partition("=")
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+def _timestamp(ts: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ts)) + f".{int(ts % 1 * 1000):03d}Z"
+
+
+class JsonLogger:
+    """JSON lines в файл с ротацией по размеру; пишет фоновый поток.
+
+    event() только кладёт запись в ограниченную очередь и никогда не ждёт:
+    при переполнении запись отбрасывается (eto_log_events_total{result="dropped"}).
+    Сериализация, запись и ротация идут в потоке-писателе, поэтому вызов
+    из event loop не добавляет задержки. Частые события прореживаются
+    по доле из LOG_SAMPLE (в записи поле sample); warning и error — всегда.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        level: str = "info",
+        max_bytes: int = 0,
+        backups: int = 0,
+        queue_size: int = 10000,
+        sample: Optional[Dict[str, float]] = None,
+    ) -> None:
+        # {pid}: у каждого воркера свой файл и своя ротация
+        self.path = path if path in ("", "-") else os.path.expanduser(path.replace("{pid}", str(os.getpid())))
+        self.level = LEVELS.get(level, LEVELS["info"])
+        self.max_bytes = max_bytes
+        self.backups = max(0, backups)
+        self.sample = sample or {}
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, queue_size))
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._file: Optional[TextIO] = None
+        self._size = 0
+
+    @classmethod
+    def from_settings(cls) -> "JsonLogger":
+        return cls(
+            settings.log_file,
+            settings.log_level,
+            settings.log_max_bytes,
+            settings.log_backups,
+            settings.log_queue_size,
+            _parse_sample(settings.log_sample),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def event(self, name: str, level: str = "info", **fields: Any) -> None:
+        severity = LEVELS.get(level, LEVELS["info"])
+        if not self.path or severity < self.level:
+            return
+        record: Dict[str, Any] = {"ts": time.time(), "level": level, "event": name}
+        rate = self.sample.get(name)
+        if rate is not None and rate < 1.0 and severity < LEVELS["warning"]:
+            if random.random() >= rate:
+                metrics.log_events.inc(result="sampled_out")
+                return
+            record["sample"] = rate
+        record.update(_CONTEXT.get())
+        record.update(fields)
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            metrics.log_events.inc(result="dropped")
+
+    def exception(self, name: str, error: BaseException, **fields: Any) -> None:
+        trace = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+        self.event(name, "error", error=str(error) or type(error).__name__, traceback=trace, **fields)
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Дописывает очередь и останавливает поток (atexit, shutdown сервера)."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="eto-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        pid = os.getpid()
+        while True:
+            batch: List[Any] = [self._queue.get()]
+            while len(batch) < 512:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is _STOP for item in batch)
+            lines = []
+            for record in batch:
+                if record is _STOP:
+                    continue
+                record["ts"] = _timestamp(record["ts"])
+                record["pid"] = pid
+                lines.append(jsonutil.dumps(record) + "\n")
+            try:
+                self._write(lines)
+                metrics.log_events.inc(len(lines), result="written")
+            except Exception:
+                metrics.log_events.inc(len(lines), result="dropped")
+                self._close_file()
+            if stop:
+                self._close_file()
+                return
+
+    def _write(self, lines: List[str]) -> None:
+        if self.path == "-":
+            sys.stderr.write("".join(lines))
+            sys.stderr.flush()
+            return
+        for line in lines:
+            if self._file is None:
+                self._open()
+            size = len(line.encode("utf-8"))
+            if self.max_bytes > 0 and self._size and self._size + size > self.max_bytes:
+                self._rotate()
+            self._file.write(line)  # type: ignore[union-attr]
+            self._size += size
+        if self._file is not None:
+            self._file.flush()
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+            self._file = None
+
+    def _rotate(self) -> None:
+        """LOG_FILE -> LOG_FILE.1 -> … -> LOG_FILE.N (старейшая копия удаляется)."""
+        self._close_file()
+        if self.backups:
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+
+class RequestLogMiddleware:
+    """ASGI-обёртка: request_id на запрос (X-Request-ID или новый) и событие http_request."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = ""
+        for key, value in scope.get("headers") or ():
+            if key == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or new_id()
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_id(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", ()), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        with bind(request_id=request_id):
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                event(
+                    "http_request",
+                    "info" if status < 500 else "error",
+                    method=scope.get("method"),
+                    path=scope.get("path"),
+                    status=status,
+                    duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                )
+
+
+logger = JsonLogger.from_settings()
+event = logger.event
+exception = logger.exception
+atexit.register(logger.close)
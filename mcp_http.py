@@ -1,37 +1,159 @@
+import asyncio
+import signal
+import time
+from typing import Optional
+
 import uvicorn
 from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
 
+try:
+    from sse_starlette.sse import AppStatus
+except ImportError:  # pragma: no cover
+    AppStatus = None
+
+import logs
+import metrics
+from config import settings
+from eto_client import aclose_clients, aprewarm_lists
 from mcp_server import build_server
 
 
 class MCPASGIApp:
+    """ASGI-приложение MCP: /metrics, остальное — StreamableHTTPSessionManager.
+
+    При остановке (lifespan.shutdown) новые запросы получают 503, а идущие
+    поиски дорабатывают, прежде чем закроются менеджер сессий и HTTP-клиенты.
+    SHUTDOWN_TIMEOUT — один срок на всю остановку, считая от SIGTERM/SIGINT:
+    ожидание соединений в uvicorn и _drain делят его, а не ждут каждый по полному.
+    """
+
     def __init__(self, manager: StreamableHTTPSessionManager):
         self.manager = manager
         self._cm = None
+        self._prewarm = None
+        self._inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._draining = False
+        self._deadline: Optional[float] = None
 
     async def __call__(self, scope, receive, send):
         if scope["type"] == "lifespan":
             while True:
                 msg = await receive()
                 if msg["type"] == "lifespan.startup":
+                    self._watch_exit_signals()
                     self._cm = self.manager.run()
                     await self._cm.__aenter__()
+                    if settings.list_prewarm:
+                        self._prewarm = asyncio.create_task(aprewarm_lists())
                     await send({"type": "lifespan.startup.complete"})
                 elif msg["type"] == "lifespan.shutdown":
+                    if self._prewarm:
+                        self._prewarm.cancel()
+                    await self._drain()
+                    if AppStatus is not None:
+                        AppStatus.should_exit = True
                     if self._cm:
                         await self._cm.__aexit__(None, None, None)
+                    await aclose_clients()
+                    logs.logger.close()
                     await send({"type": "lifespan.shutdown.complete"})
                     return
+        elif scope["type"] == "http" and scope.get("path") == "/metrics":
+            await self._metrics(send)
+        elif scope["type"] == "http" and self._draining:
+            await self._unavailable(send)
         else:
-            await self.manager.handle_request(scope, receive, send)
+            self._inflight += 1
+            self._idle.clear()
+            try:
+                await self.manager.handle_request(scope, receive, send)
+            finally:
+                self._inflight -= 1
+                if not self._inflight:
+                    self._idle.set()
 
+    def _start_deadline(self) -> None:
+        if self._deadline is None and settings.shutdown_timeout:
+            self._deadline = time.monotonic() + settings.shutdown_timeout
 
-def main() -> None:
+    def _watch_exit_signals(self) -> None:
+        """Засекает срок остановки по сигналу, поверх обработчиков uvicorn (они остаются в силе)."""
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                previous = signal.getsignal(sig)
+                if not callable(previous):
+                    continue
+
+                def handler(signum, frame, previous=previous):
+                    self._start_deadline()
+                    previous(signum, frame)
+
+                signal.signal(sig, handler)
+            except ValueError:  # не главный поток — срок начнётся с lifespan.shutdown
+                return
+
+    async def _drain(self) -> None:
+        self._draining = True
+        self._start_deadline()
+        if self._inflight:
+            logs.event("shutdown_drain", "warning", inflight=self._inflight)
+            left = max(0.0, self._deadline - time.monotonic()) if self._deadline is not None else None
+            try:
+                await asyncio.wait_for(self._idle.wait(), left)
+            except asyncio.TimeoutError:
+                logs.event("shutdown_drain_timeout", "error", inflight=self._inflight)
+
+    async def _unavailable(self, send):
+        body = b'{"error":"server is shutting down"}'
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", b"1"),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _metrics(self, send):
+        body = metrics.render().encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", metrics.CONTENT_TYPE.encode()), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def build_app() -> logs.RequestLogMiddleware:
     server = build_server()
     # stateless=True, чтобы MCP-Session-Id не требовался на старте
     manager = StreamableHTTPSessionManager(server, stateless=True)
-    app = MCPASGIApp(manager)
-    uvicorn.run(app, host="0.0.0.0", port=8081, log_level="info")
+    # sse_starlette по SIGTERM обрывает SSE-ответы; в stateless-режиме каждый
+    # ответ заканчивается вместе с поиском, поэтому даём им дописаться (_drain)
+    if AppStatus is not None and hasattr(AppStatus, "disable_automatic_graceful_drain"):
+        AppStatus.disable_automatic_graceful_drain()
+    return logs.RequestLogMiddleware(MCPASGIApp(manager))
+
+
+def main() -> None:
+    """MCP_WORKERS > 1 — несколько процессов uvicorn на одном порту (каждый со своим build_app)."""
+    options = {
+        "host": settings.mcp_host,
+        "port": settings.mcp_port,
+        "log_level": "info",
+        # uvicorn сначала ждёт открытые соединения, затем lifespan.shutdown (_drain);
+        # _drain ждёт только остаток того же срока от сигнала
+        "timeout_graceful_shutdown": settings.shutdown_timeout or None,
+    }
+    if settings.mcp_workers > 1:
+        uvicorn.run("mcp_http:build_app", factory=True, workers=settings.mcp_workers, **options)
+    else:
+        uvicorn.run(build_app(), **options)
 
 
 if __name__ == "__main__":
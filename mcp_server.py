@@ -1,25 +1,53 @@
 import asyncio
-import json
-import os
-import traceback
-from typing import Dict, List
+import time
+from typing import Any, Dict, List, Optional
 
 from mcp.server import Server, NotificationOptions
 from mcp.server.models import InitializationOptions
 from mcp.server.stdio import stdio_server
 from mcp.types import CallToolResult, Tool, TextContent
 
-from eto_client import search_tours
+import jsonutil
+import logs
+from config import settings
+from eto_client import aclose_clients, async_search_tours, async_search_tours_batch, async_search_tours_flexible, async_search_tours_stream
 
-LOG_FILE = os.path.expanduser("~/eto-tours-mcp.log")
+FILTER_SCHEMA = {
+    "type": "object",
+    "description": (
+        "Отбор туров на сервере: {поле: условие}. Поля: price, price_per_night, nights, date, stars, rating, "
+        "meal (RO<BB<HB<FB<AI<UAI), region, hotel, operator, room. Условие — значение (текст — по вхождению), "
+        "список (любое из) или объект операторов eq, ne, in, nin, gt, gte, lt, lte, contains. "
+        "Пример: {\"stars\": {\"gte\": 4}, \"meal\": {\"gte\": \"AI\"}, \"region\": \"Кемер\", \"price\": {\"lte\": 150000}}"
+    ),
+    "additionalProperties": True,
+}
 
 
-def log(msg: str) -> None:
-    try:
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(msg + "\n")
-    except Exception:
-        pass
+async def _search_with_progress(server: Server, arguments: Dict) -> Dict[str, Any]:
+    """search_tours с notifications/progress на каждый снимок с новыми турами.
+
+    Работает, только если клиент передал progressToken; иначе — обычный поиск.
+    """
+    ctx = server.request_context
+    token = ctx.meta.progressToken if ctx.meta else None
+    if token is None:
+        return await async_search_tours(arguments)
+
+    result: Optional[Dict[str, Any]] = None
+    found = 0
+    async for event in async_search_tours_stream(arguments):
+        if event["event"] == "tours":
+            found += len(event["tours"])
+            await ctx.session.send_progress_notification(
+                token,
+                float(found),
+                message=jsonutil.dumps(event["tours"]),
+                related_request_id=str(ctx.request_id),
+            )
+        elif event["event"] == "done":
+            result = {k: v for k, v in event.items() if k != "event"}
+    return result or {"success": False, "error": "Поиск прерван"}
 
 
 def build_server() -> Server:
@@ -32,7 +60,10 @@ def build_server() -> Server:
                 name="search_tours",
                 description=(
                     "Принимает параметры поиска (country/city_from лучше строкой: \"Египет\", \"Москва\"), делает modsearch → несколько запросов modresult, "
-                    "ждёт появления data.block и возвращает JSON."
+                    "ждёт появления data.block и возвращает JSON. Если клиент передал progressToken, "
+                    "новые туры приходят в notifications/progress по мере ответа операторов. "
+                    "Ответ — список туров; с filter или если туров больше limit — объект {tours, matched, next_cursor}: "
+                    "next_cursor передайте как cursor за следующей страницей."
                 ),
                 inputSchema={
                     "type": "object",
@@ -49,7 +80,69 @@ def build_server() -> Server:
                         "requestid": {"type": "string"},
                         "unique_hotels": {"type": "boolean"},
                         "refresh_hotels": {"type": "boolean"},
+                        "sort": {"type": "string", "enum": ["price", "price_per_night", "date", "stars"]},
+                        "filter": FILTER_SCHEMA,
+                        "cursor": {
+                            "type": "string",
+                            "description": "next_cursor из прошлого ответа: следующая страница без нового поиска (остальные параметры не нужны, кроме limit)",
+                        },
+                    },
+                    "additionalProperties": True,
+                },
+            ),
+            Tool(
+                name="search_tours_batch",
+                description=(
+                    "Несколько поисков сразу (например, разные страны или даты): searches — список параметров, "
+                    "как у search_tours; поля верхнего уровня — общие для всех поисков. Поиски идут параллельно, "
+                    "ответ — общий рейтинг туров (поле search — номер поиска) и краткий итог по каждому поиску."
+                ),
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "searches": {
+                            "type": "array",
+                            "items": {"type": "object", "additionalProperties": True},
+                            "minItems": 1,
+                        },
+                        "date_from": {"type": "string"},
+                        "date_to": {"type": "string"},
+                        "nights": {"type": "integer"},
+                        "adults": {"type": "integer"},
+                        "country": {"type": ["integer", "string"]},
+                        "city_from": {"type": ["integer", "string"]},
+                        "limit": {"type": "integer"},
+                        "unique_hotels": {"type": "boolean"},
+                        "sort": {"type": "string", "enum": ["price", "price_per_night", "date", "stars"]},
+                        "filter": FILTER_SCHEMA,
+                    },
+                    "required": ["searches"],
+                    "additionalProperties": True,
+                },
+            ),
+            Tool(
+                name="search_tours_flexible",
+                description=(
+                    "Поиск по широкому диапазону (например, «7–10 ночей в июле»): диапазон дат и ночей делится "
+                    "на подзапросы, которые идут параллельно. Ответ — лучшие туры без дублей и calendar: "
+                    "самая низкая цена на каждую пару дата вылета × ночи."
+                ),
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "date_from": {"type": "string"},
+                        "date_to": {"type": "string"},
+                        "nights_from": {"type": "integer"},
+                        "nights_to": {"type": "integer"},
+                        "adults": {"type": "integer"},
+                        "country": {"type": ["integer", "string"]},
+                        "city_from": {"type": ["integer", "string"]},
+                        "limit": {"type": "integer"},
+                        "unique_hotels": {"type": "boolean"},
+                        "sort": {"type": "string", "enum": ["price", "price_per_night", "date", "stars"]},
+                        "filter": FILTER_SCHEMA,
                     },
+                    "required": ["date_from", "date_to"],
                     "additionalProperties": True,
                 },
             ),
@@ -57,41 +150,72 @@ def build_server() -> Server:
 
     @server.call_tool()
     async def call_tool(name: str, arguments: Dict) -> CallToolResult:
+        with logs.bind(call_id=str(server.request_context.request_id), tool=name):
+            return await _call_tool(name, arguments)
+
+    async def _call_tool(name: str, arguments: Dict) -> CallToolResult:
+        started = time.perf_counter()
         try:
             if name == "search_tours":
-                result = await asyncio.to_thread(search_tours, arguments)
+                result = await _search_with_progress(server, arguments)
+            elif name == "search_tours_batch":
+                result = await async_search_tours_batch(arguments)
+            elif name == "search_tours_flexible":
+                result = await async_search_tours_flexible(arguments)
             else:
                 result = {"success": False, "error": f"Unknown tool: {name}"}
 
-            if isinstance(result, dict) and result.get("success") is True:
-                text = json.dumps(result.get("tours", []), ensure_ascii=False, indent=2)
+            if name in ("search_tours_batch", "search_tours_flexible") and result.get("success") is True:
+                text = jsonutil.dumps(
+                    {k: v for k, v in result.items() if k != "success"}, indent=settings.mcp_json_indent
+                )
+            elif isinstance(result, dict) and result.get("success") is True:
+                text = jsonutil.dumps(_tours_reply(result), indent=settings.mcp_json_indent)
             else:
-                text = json.dumps(result, ensure_ascii=False, indent=2)
+                text = jsonutil.dumps(result, indent=settings.mcp_json_indent)
+            logs.event(
+                "tool_call",
+                duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                success=result.get("success") is True,
+                requestid=result.get("requestid"),
+                error=result.get("error"),
+            )
             return CallToolResult(content=[TextContent(type="text", text=text)])
         except Exception as e:
-            log(f"call_tool error: {e}\n{traceback.format_exc()}")
+            logs.exception("tool_call_failed", e, duration_ms=round((time.perf_counter() - started) * 1000, 1))
             return CallToolResult(
-                content=[TextContent(type="text", text=json.dumps({"success": False, "error": str(e)}, ensure_ascii=False))]
+                content=[TextContent(type="text", text=jsonutil.dumps({"success": False, "error": str(e)}))]
             )
 
     return server
 
 
+def _tours_reply(result: Dict[str, Any]) -> Any:
+    """Ответ search_tours для MCP: список туров, а с matched/next_cursor — объект с ними."""
+    tours = result.get("tours", [])
+    extra = {k: result[k] for k in ("matched", "next_cursor") if result.get(k) is not None}
+    return {"tours": tours, **extra} if extra else tours
+
+
 async def main_stdio() -> None:
     server = build_server()
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="eto-tours",
-                server_version="0.1.0",
-                capabilities=server.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={},
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="eto-tours",
+                    server_version="0.1.0",
+                    capabilities=server.get_capabilities(
+                        notification_options=NotificationOptions(),
+                        experimental_capabilities={},
+                    ),
                 ),
-            ),
-        )
+            )
+    finally:
+        await aclose_clients()
+        logs.logger.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple, TypeVar
+
+_F = TypeVar("_F", bound=Callable[..., Any])
+
+# Границы бакетов гистограмм (секунды для span, штуки для polls)
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34)
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> _Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: _Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items
+    )
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name: str, doc: str) -> None:
+        self.name = name
+        self.doc = doc
+        self._lock = threading.Lock()
+        self._values: Dict[_Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(_labels(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, buckets: Tuple[float, ...] = SECONDS_BUCKETS) -> None:
+        self.name = name
+        self.doc = doc
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labels -> (счётчики по бакетам, сумма, количество)
+        self._values: Dict[_Labels, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            counts, total, n = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, n + 1)
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            item = self._values.get(_labels(labels))
+        return item[2] if item else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(c), s, n)) for k, (c, s, n) in self._values.items())
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {n}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {n}")
+        return lines
+
+
+spans = Histogram("eto_span_seconds", "Время участков горячего пути (span)")
+cache_requests = Counter("eto_cache_requests_total", "Обращения к кэшам (cache, result=hit|miss|stale)")
+search_polls = Histogram("eto_search_polls", "Опросов modresult на один поиск", COUNT_BUCKETS)
+upstream_requests = Counter("eto_upstream_requests_total", "Запросы к Tourvisor по эндпоинту и статусу")
+upstream_bytes = Counter("eto_upstream_bytes_total", "Байт получено от Tourvisor")
+upstream_errors = Counter("eto_upstream_errors_total", "Ошибки запросов к Tourvisor (kind=transport|http|circuit_open)")
+log_events = Counter("eto_log_events_total", "События структурированного лога (result=written|dropped|sampled_out)")
+
+REGISTRY = (spans, cache_requests, search_polls, upstream_requests, upstream_bytes, upstream_errors, log_events)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Замер участка кода в eto_span_seconds{span=name}; годится и для await внутри."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans.observe(time.perf_counter() - started, span=name)
+
+
+def timed(name: str) -> Callable[[_F], _F]:
+    """Декоратор синхронной функции: каждый вызов — span name."""
+
+    def decorate(fn: _F) -> _F:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                spans.observe(time.perf_counter() - started, span=name)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus (text/plain; version=0.0.4)."""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
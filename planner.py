@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Ключи дат/ночей, которые понимает _normalize_payload; в подзапросах их
+# заменяют границы окна
+_DATE_FROM_KEYS = ("date_from", "datefrom", "s_j_date_from")
+_DATE_TO_KEYS = ("date_to", "dateto", "s_j_date_to")
+_NIGHTS_FROM_KEYS = ("nights_from", "nightsfrom", "s_nights_from")
+_NIGHTS_TO_KEYS = ("nights_to", "nightsto", "s_nights_to")
+RANGE_KEYS = _DATE_FROM_KEYS + _DATE_TO_KEYS + _NIGHTS_FROM_KEYS + _NIGHTS_TO_KEYS + ("nights",)
+
+
+@dataclass(frozen=True)
+class SearchWindow:
+    """Один подзапрос: диапазон дат вылета и ночей."""
+
+    date_from: date
+    date_to: date
+    nights_from: int
+    nights_to: int
+
+    def params(self) -> Dict[str, Any]:
+        return {
+            "date_from": self.date_from.isoformat(),
+            "date_to": self.date_to.isoformat(),
+            "nights_from": self.nights_from,
+            "nights_to": self.nights_to,
+        }
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """YYYY-MM-DD или DD.MM.YYYY (как принимает search_tours)."""
+    if isinstance(value, date):
+        return value
+    s = str(value or "").strip()
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _first(payload: Dict[str, Any], keys: Iterable[str]) -> Any:
+    for key in keys:
+        if payload.get(key) not in (None, ""):
+            return payload[key]
+    return None
+
+
+def _int(value: Any) -> Optional[int]:
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def split_range(lo: int, hi: int, parts: int) -> List[Tuple[int, int]]:
+    """[lo, hi] на parts почти равных непересекающихся отрезков."""
+    total = hi - lo + 1
+    parts = max(1, min(parts, total))
+    size, extra = divmod(total, parts)
+    out = []
+    start = lo
+    for i in range(parts):
+        end = start + size - 1 + (1 if i < extra else 0)
+        out.append((start, end))
+        start = end + 1
+    return out
+
+
+def plan(
+    date_from: date,
+    date_to: date,
+    nights_from: int,
+    nights_to: int,
+    date_span: int,
+    nights_span: int,
+    max_searches: int,
+) -> List[SearchWindow]:
+    """Делит широкий запрос на окна не шире date_span дней и nights_span ночей.
+
+    Если окон получается больше max_searches, окна укрупняются — сначала по
+    измерению, где их больше, — так что число подзапросов не превышает лимит,
+    а окна остаются примерно одного размера.
+    """
+    days = (date_to - date_from).days + 1
+    nights = nights_to - nights_from + 1
+    date_parts = math.ceil(days / max(1, date_span))
+    nights_parts = math.ceil(nights / max(1, nights_span))
+    limit = max(1, max_searches)
+    while date_parts * nights_parts > limit:
+        if date_parts >= nights_parts and date_parts > 1:
+            date_parts -= 1
+        else:
+            nights_parts -= 1
+    windows = []
+    for d_lo, d_hi in split_range(0, days - 1, date_parts):
+        for n_lo, n_hi in split_range(nights_from, nights_to, nights_parts):
+            windows.append(SearchWindow(
+                date_from + timedelta(days=d_lo), date_from + timedelta(days=d_hi), n_lo, n_hi
+            ))
+    return windows
+
+
+def plan_payload(
+    payload: Dict[str, Any], date_span: int, nights_span: int, max_searches: int
+) -> Tuple[List[SearchWindow], Dict[str, Any]]:
+    """Окна для payload search_tours и общие параметры без дат/ночей.
+
+    ValueError — если даты или ночи не заданы либо заданы неверно.
+    """
+    date_from = parse_date(_first(payload, _DATE_FROM_KEYS))
+    date_to = parse_date(_first(payload, _DATE_TO_KEYS))
+    if date_from is None or date_to is None:
+        raise ValueError("Нужны date_from и date_to (YYYY-MM-DD)")
+    if date_to < date_from:
+        raise ValueError("date_to раньше date_from")
+    nights_from = _int(_first(payload, _NIGHTS_FROM_KEYS + ("nights",)))
+    nights_to = _int(_first(payload, _NIGHTS_TO_KEYS + ("nights",)))
+    if nights_from is None or nights_to is None:
+        raise ValueError("Нужны nights_from и nights_to (или nights)")
+    if nights_to < nights_from or nights_from < 1:
+        raise ValueError("Некорректный диапазон ночей")
+    base = {k: v for k, v in payload.items() if k not in RANGE_KEYS}
+    return plan(date_from, date_to, nights_from, nights_to, date_span, nights_span, max_searches), base
+
+
+def tour_identity(tour: Dict[str, Any]) -> tuple:
+    """Один и тот же тур из разных подзапросов: отель, дата, ночи, номер, питание."""
+    return (tour.get("hotel_id"), tour.get("date"), tour.get("nights"), tour.get("room"), tour.get("meal"))
+
+
+def dedupe(tours: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Оставляет самый дешёвый вариант каждого тура (окна на стыках пересекаются по выдаче)."""
+    best: Dict[tuple, Dict[str, Any]] = {}
+    for t in tours:
+        key = tour_identity(t)
+        prev = best.get(key)
+        if prev is None or t["price"] < prev["price"]:
+            best[key] = t
+    return list(best.values())
+
+
+def price_calendar(tours: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Самый дешёвый тур на каждую пару дата × ночи: {date: {nights: {...}}}."""
+    cells: Dict[tuple, Dict[str, Any]] = {}
+    for t in tours:
+        if t.get("date") is None or t.get("nights") is None:
+            continue
+        key = (t["date"], t["nights"])
+        prev = cells.get(key)
+        if prev is None or t["price"] < prev["price"]:
+            cells[key] = t
+    calendar: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for (day, nights), t in sorted(cells.items(), key=lambda kv: (_day_order(kv[0][0]), kv[0][1])):
+        calendar.setdefault(day, {})[str(nights)] = {
+            "price": t["price"],
+            "hotel_id": t.get("hotel_id"),
+            "hotel_name": t.get("hotel_name"),
+        }
+    return calendar
+
+
+def _day_order(value: str) -> str:
+    parsed = parse_date(value)
+    return parsed.isoformat() if parsed else str(value)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from config import settings
+
+_FINISHED_STATES = {"finished", "finish", "done", "complete", "completed", "ready"}
+
+
+@dataclass(frozen=True)
+class PollProgress:
+    """Прогресс поиска по одному снимку modresult."""
+
+    finished: bool = False
+    tours: int = 0
+    hotels: int = 0
+    operators_done: int = 0
+
+    @property
+    def key(self) -> tuple:
+        return (self.tours, self.hotels, self.operators_done)
+
+
+def _status_int(status: Dict[str, Any], *names: str) -> Optional[int]:
+    for name in names:
+        value = status.get(name)
+        if value is None:
+            continue
+        try:
+            return int(str(value).strip())
+        except Exception:
+            continue
+    return None
+
+
+def _count_priced(data: Dict[str, Any]) -> tuple:
+    hotels_count = 0
+    tours_count = 0
+    block = data.get("block")
+    if not isinstance(block, list):
+        return 0, 0
+    for b in block:
+        hotels = b.get("hotel") if isinstance(b, dict) else None
+        if isinstance(hotels, dict):
+            hotels = [hotels]
+        if not isinstance(hotels, list):
+            continue
+        for h in hotels:
+            tours = h.get("tour") if isinstance(h, dict) else None
+            if isinstance(tours, dict):
+                tours = [tours]
+            if not isinstance(tours, list) or not tours:
+                continue
+            hotels_count += 1
+            tours_count += len(tours)
+    return hotels_count, tours_count
+
+
+def read_progress(raw: Optional[Dict[str, Any]]) -> Optional[PollProgress]:
+    """Достаёт из ответа modresult state/progress/число отелей и туров.
+
+    Если upstream не прислал status, считает отели и туры по data.block;
+    finished в этом случае неизвестен и остаётся False.
+    """
+    if not isinstance(raw, dict):
+        return None
+    data = raw.get("data", raw)
+    if not isinstance(data, dict):
+        return None
+    status = data.get("status") if isinstance(data.get("status"), dict) else {}
+
+    finished = False
+    state = status.get("state")
+    if isinstance(state, str) and state.strip().lower() in _FINISHED_STATES:
+        finished = True
+    percent = _status_int(status, "progress", "percent")
+    if percent is not None and percent >= 100:
+        finished = True
+    ops_done = _status_int(status, "operatorsfinished", "operators_finished", "opfinished") or 0
+    ops_all = _status_int(status, "operatorscount", "operatorsall", "operators_count", "opcount")
+    if ops_all and ops_done >= ops_all:
+        finished = True
+
+    hotels = _status_int(status, "hotelsfound", "hotels_found")
+    tours = _status_int(status, "toursfound", "tours_found")
+    if hotels is None or tours is None:
+        counted_hotels, counted_tours = _count_priced(data)
+        hotels = counted_hotels if hotels is None else hotels
+        tours = counted_tours if tours is None else tours
+
+    return PollProgress(
+        finished=finished,
+        tours=tours,
+        hotels=hotels,
+        operators_done=ops_done,
+    )
+
+
+class PollScheduler:
+    """Адаптивный интервал опроса modresult.
+
+    Пока данные прибывают — интервал сокращается до min_interval, пока снимок
+    не меняется — растёт экспоненциально до max_interval. Опрос заканчивается,
+    когда поиск завершён, набрано good_enough туров, исчерпаны попытки или
+    истёк timeout. Без status в ответе завершением считается снимок с турами,
+    не изменившийся с прошлого опроса.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        min_interval: float,
+        max_interval: float,
+        backoff: float,
+        good_enough: int,
+        max_attempts: int,
+        timeout: float,
+    ) -> None:
+        self.min_interval = max(0.0, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.backoff = max(1.0, backoff)
+        self.good_enough = good_enough
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.attempts = 0
+        self.finished = False
+        self.satisfied = False
+        self.error: Optional[Dict[str, Any]] = None
+        self._delay = min(max(interval, self.min_interval), self.max_interval)
+        self._last: Optional[PollProgress] = None
+        self._started = time.monotonic()
+
+    @classmethod
+    def from_settings(cls) -> "PollScheduler":
+        return cls(
+            interval=settings.poll_interval,
+            min_interval=settings.poll_min_interval,
+            max_interval=settings.poll_max_interval,
+            backoff=settings.poll_backoff,
+            good_enough=settings.poll_good_enough_tours,
+            max_attempts=settings.poll_attempts,
+            timeout=settings.poll_timeout,
+        )
+
+    def observe(self, raw: Optional[Dict[str, Any]]) -> Optional[PollProgress]:
+        """Учитывает очередной снимок (None — ответа с data.block ещё нет)."""
+        self.attempts += 1
+        progress = read_progress(raw)
+        prev = self._last
+        if progress is None:
+            self._delay = min(self.max_interval, self._delay * self.backoff)
+            return None
+
+        changed = prev is None or progress.key != prev.key
+        if changed and progress.tours:
+            self._delay = max(self.min_interval, self._delay / self.backoff)
+        elif not changed:
+            self._delay = min(self.max_interval, self._delay * self.backoff)
+
+        self.finished = progress.finished
+        if self.good_enough > 0 and progress.tours >= self.good_enough:
+            self.satisfied = True
+        no_status = not _has_status(raw)
+        if no_status and not changed and progress.tours:
+            self.finished = True
+        self._last = progress
+        return progress
+
+    def fail(self, error: Dict[str, Any]) -> None:
+        """Прекращает опрос: upstream недоступен, ждать дальше бессмысленно."""
+        self.error = error
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    @property
+    def exhausted(self) -> bool:
+        if self.max_attempts > 0 and self.attempts >= self.max_attempts:
+            return True
+        return self.timeout > 0 and time.monotonic() - self._started >= self.timeout
+
+    @property
+    def done(self) -> bool:
+        return self.finished or self.satisfied or self.exhausted or self.error is not None
+
+    def next_delay(self) -> float:
+        if self.timeout > 0:
+            left = self.timeout - (time.monotonic() - self._started)
+            return max(0.0, min(self._delay, left))
+        return self._delay
+
+
+def _has_status(raw: Optional[Dict[str, Any]]) -> bool:
+    if not isinstance(raw, dict):
+        return False
+    data = raw.get("data", raw)
+    return isinstance(data, dict) and isinstance(data.get("status"), dict)
+
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from config import settings
+
+# Ответы, после которых есть смысл повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Token bucket на ключ (эндпоинт): rate запросов в секунду, всплеск до burst.
+
+    reserve() сразу списывает токен (баланс может уйти в минус) и говорит,
+    сколько ждать, поэтому одновременные запросы встают в очередь, а не
+    просыпаются все разом. Работает из потоков и из разных event loop.
+    """
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._lock = threading.Lock()
+        self._state: Dict[str, Tuple[float, float]] = {}
+
+    def reserve(self, key: str) -> float:
+        """Занимает токен; возвращает, сколько секунд подождать до запроса."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._state.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate) - 1.0
+            self._state[key] = (tokens, now)
+        return 0.0 if tokens >= 0 else -tokens / self.rate
+
+    def wait_sync(self, key: str) -> None:
+        delay = self.reserve(key)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait(self, key: str) -> None:
+        delay = self.reserve(key)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@dataclass
+class _Circuit:
+    failures: int = 0
+    opened_at: Optional[float] = None
+    probing: bool = False
+
+
+class CircuitBreaker:
+    """Предохранитель на ключ (эндпоинт).
+
+    closed — запросы идут; после threshold неудач подряд — open: reset_timeout
+    секунд запросы сразу отклоняются; затем half-open — пропускается один
+    пробный запрос, успех закрывает цепь, неудача снова открывает.
+    threshold <= 0 — предохранитель выключен.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._circuits: Dict[str, _Circuit] = {}
+
+    def allow(self, key: str) -> bool:
+        return self.admit(key) != "open"
+
+    def admit(self, key: str) -> str:
+        """closed — запрос идёт как обычно; probe — это пробный запрос half-open; open — отклонить.
+
+        Кто получил probe, обязан закончить его record() или release().
+        """
+        if self.threshold <= 0:
+            return "closed"
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.opened_at is None:
+                return "closed"
+            if time.monotonic() - circuit.opened_at < self.reset_timeout or circuit.probing:
+                return "open"
+            circuit.probing = True
+            return "probe"
+
+    def release(self, key: str) -> None:
+        """Пробный запрос закончился без исхода (отменён, упал не на HTTP): считается неудачей.
+
+        Иначе probing остался бы навсегда и эндпоинт отклонялся бы до рестарта.
+        """
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is not None and circuit.probing:
+                circuit.probing = False
+                circuit.opened_at = time.monotonic()
+
+    def record(self, key: str, ok: bool) -> None:
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            circuit.probing = False
+            if ok:
+                circuit.failures = 0
+                circuit.opened_at = None
+                return
+            circuit.failures += 1
+            if circuit.failures >= self.threshold:
+                circuit.opened_at = time.monotonic()
+
+    def state(self, key: str) -> str:
+        """closed | open | half-open."""
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.opened_at is None:
+                return "closed"
+            if time.monotonic() - circuit.opened_at < self.reset_timeout:
+                return "open"
+            return "half-open"
+
+
+def retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Пауза перед повтором attempt (0, 1, ...): full jitter по RETRY_BASE_DELAY.
+
+    Retry-After из ответа (секунды) учитывается, но не дольше RETRY_MAX_DELAY.
+    """
+    cap = settings.retry_max_delay
+    if retry_after:
+        try:
+            return min(cap, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, settings.retry_base_delay * (2 ** attempt)))
+
+
+rate_limiter = TokenBucket(settings.upstream_rate_limit, settings.upstream_rate_burst)
+breaker = CircuitBreaker(settings.breaker_threshold, settings.breaker_reset)
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+# Синонимы по каноническому имени из справочника Tourvisor; применяются,
+# только если такое имя в справочнике есть
+COUNTRY_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "турция": ("turkey", "turkiye", "türkiye", "анталия", "анталья", "стамбул", "аланья", "кемер"),
+    "египет": ("egypt", "хургада", "шарм", "шарм-эль-шейх", "шарм эль шейх", "марса алам"),
+    "оаэ": ("uae", "эмираты", "объединенные арабские эмираты", "united arab emirates", "дубай", "dubai", "абу-даби", "шарджа"),
+    "таиланд": ("тайланд", "thailand", "пхукет", "паттайя", "самуи"),
+    "кипр": ("cyprus",),
+    "греция": ("greece", "крит", "родос", "корфу"),
+    "испания": ("spain", "тенерифе", "барселона", "майорка"),
+    "италия": ("italy", "рим", "сардиния", "сицилия"),
+    "франция": ("france", "париж"),
+    "мальдивы": ("maldives",),
+    "вьетнам": ("vietnam", "нячанг", "фукуок"),
+    "индонезия": ("indonesia", "бали", "bali"),
+    "доминикана": ("доминиканская республика", "dominican republic", "пунта кана"),
+    "куба": ("cuba", "варадеро"),
+    "тунис": ("tunisia",),
+    "шри-ланка": ("sri lanka", "цейлон"),
+    "абхазия": ("abkhazia",),
+    "россия": ("russia", "рф"),
+    "черногория": ("montenegro",),
+    "грузия": ("georgia", "батуми"),
+    "китай": ("china", "хайнань"),
+    "катар": ("qatar",),
+    "сейшелы": ("seychelles",),
+    "маврикий": ("mauritius",),
+    "мексика": ("mexico", "канкун"),
+}
+DEPARTURE_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "москва": ("мск", "moscow"),
+    "санкт-петербург": ("спб", "питер", "петербург", "saint petersburg", "st petersburg", "ленинград"),
+    "екатеринбург": ("екб", "екат"),
+    "новосибирск": ("нск",),
+    "нижний новгород": ("нижний", "нн"),
+    "ростов-на-дону": ("ростов",),
+    "минеральные воды": ("минводы", "мин воды"),
+    "казань": ("kazan",),
+    "минск": ("minsk",),
+}
+
+# Не несут смысла в «из Москвы», «страна Турция»
+_STOPWORDS = {"из", "в", "во", "на", "с", "со", "г", "город", "страна", "вылет", "от", "до"}
+# Падежные окончания, самые длинные первыми
+_ENDINGS = tuple(sorted(
+    ("иями", "ями", "ами", "ией", "ия", "ии", "ию", "ие", "ей", "ой", "ом", "ем", "ам", "ах", "ях", "ы", "а", "я", "и", "у", "ю", "е", "о", "ь"),
+    key=len,
+    reverse=True,
+))
+_VOWELS = set("аеёиоуыэюя")
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh", "з": "z", "и": "i",
+    "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t",
+    "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sch", "ъ": "", "ы": "y", "ь": "",
+    "э": "e", "ю": "yu", "я": "ya",
+}
+_NON_WORD = re.compile(r"[^\w]+")
+_PARTS = re.compile(r"[(),/;]+")
+# Порог похожести по триграммам (коэффициент Дайса) для подсказок в ошибке
+_FUZZY_SUGGEST = 0.3
+
+
+class Match(NamedTuple):
+    id: int
+    name: str
+    method: str  # exact | alias | stem | translit | id
+
+
+def normalize(text: str) -> str:
+    """«  Санкт-Петербург » -> «санкт петербург»: регистр, ё, пунктуация, пробелы."""
+    return " ".join(_NON_WORD.sub(" ", text.lower().replace("ё", "е")).split())
+
+
+def translit(text: str) -> str:
+    return "".join(_TRANSLIT.get(ch, ch) for ch in text)
+
+
+def _stem_word(word: str) -> str:
+    if len(word) <= 4:
+        return word
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[: -len(ending)]
+    return word
+
+
+def _stems(text: str) -> Set[str]:
+    """Основы фразы, включая вариант с беглой гласной (египет -> египт)."""
+    words = [_stem_word(w) for w in text.split() if w not in _STOPWORDS]
+    stem = " ".join(words)
+    out = {stem} if stem else set()
+    if words and len(words[-1]) >= 5:
+        last = words[-1]
+        if last[-2] in "ео" and last[-1] not in _VOWELS and last[-3] not in _VOWELS:
+            out.add(" ".join(words[:-1] + [last[:-2] + last[-1]]))
+    return out
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Resolver:
+    """Индекс справочника «имя -> id» для неточных запросов.
+
+    Строится один раз на версию справочника; resolve() перебирает формы от
+    точной к нечёткой: имя, синоним, основа слова (падежи, беглая гласная),
+    транслитерация. Запрос из нескольких частей («ОАЭ (Дубай)», «из Москвы»)
+    разбирается и по частям. Похожесть по триграммам только подсказывает
+    (suggest): сама по себе она не выбирает запись — незнакомое, но настоящее
+    место (Индия, Омск) легко похоже на другое (Индонезия, Москва).
+    """
+
+    def __init__(self, names: Dict[str, int], aliases: Optional[Dict[str, Iterable[str]]] = None) -> None:
+        self._names: Dict[int, str] = {}
+        self._exact: Dict[str, int] = {}
+        self._alias: Dict[str, int] = {}
+        self._stem: Dict[str, Optional[int]] = {}
+        self._latin: Dict[str, Optional[int]] = {}
+        self._forms: List[Tuple[str, int, Set[str]]] = []
+        self._by_gram: Dict[str, List[int]] = defaultdict(list)
+        for raw, _id in names.items():
+            try:
+                _id = int(_id)
+            except (TypeError, ValueError):
+                continue
+            name = normalize(str(raw))
+            if not name:
+                continue
+            self._names.setdefault(_id, str(raw))
+            self._exact[name] = _id
+            self._add_variants(name, _id)
+        for canonical, synonyms in (aliases or {}).items():
+            _id = self._exact.get(normalize(canonical))
+            if _id is None:
+                continue
+            for synonym in synonyms:
+                form = normalize(synonym)
+                if form and form not in self._exact:
+                    self._alias[form] = _id
+                    self._add_variants(form, _id)
+
+    def _add_variants(self, form: str, _id: int) -> None:
+        for stem in _stems(form):
+            # одна основа у разных записей — по основе не решаем
+            self._stem[stem] = _id if self._stem.get(stem, _id) == _id else None
+        latin = translit(form)
+        self._latin[latin] = _id if self._latin.get(latin, _id) == _id else None
+        for text in {form, latin}:
+            grams = _trigrams(text)
+            index = len(self._forms)
+            self._forms.append((text, _id, grams))
+            for gram in grams:
+                self._by_gram[gram].append(index)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def name(self, _id: int) -> Optional[str]:
+        return self._names.get(_id)
+
+    def resolve(self, query: str) -> Optional[Match]:
+        text = normalize(query)
+        if not text:
+            return None
+        if text.isdigit():
+            _id = int(text)
+            return Match(_id, self._names.get(_id, text), "id")
+        match = self._lookup(text)
+        if match is not None:
+            return match
+        parts = [normalize(p) for p in _PARTS.split(query.lower())]
+        candidates = [p for p in parts if p and p != text]
+        candidates += [w for w in text.split() if w not in _STOPWORDS and w not in candidates]
+        for part in candidates:
+            match = self._lookup(part)
+            if match is not None:
+                return match
+        return None
+
+    def _lookup(self, text: str) -> Optional[Match]:
+        """Все способы, кроме триграмм."""
+        _id = self._exact.get(text)
+        if _id is not None:
+            return Match(_id, self._names[_id], "exact")
+        _id = self._alias.get(text)
+        if _id is not None:
+            return Match(_id, self._names[_id], "alias")
+        for stem in _stems(text):
+            _id = self._stem.get(stem)
+            if _id is not None:
+                return Match(_id, self._names[_id], "stem")
+        _id = self._latin.get(translit(text))
+        if _id is not None:
+            return Match(_id, self._names[_id], "translit")
+        return None
+
+    def _scores(self, text: str) -> Dict[int, float]:
+        """Лучший коэффициент Дайса по триграммам для каждого id."""
+        best: Dict[int, float] = {}
+        for query in {text, translit(text)}:
+            grams = _trigrams(query)
+            common: Dict[int, int] = defaultdict(int)
+            for gram in grams:
+                for index in self._by_gram.get(gram, ()):
+                    common[index] += 1
+            for index, shared in common.items():
+                _, _id, form_grams = self._forms[index]
+                score = 2.0 * shared / (len(grams) + len(form_grams))
+                if score > best.get(_id, 0.0):
+                    best[_id] = score
+        return best
+
+    def suggest(self, query: str, limit: int = 3) -> List[str]:
+        """Ближайшие имена — для сообщения об ошибке."""
+        ranked = sorted(self._scores(normalize(query)).items(), key=lambda item: item[1], reverse=True)
+        return [self._names[_id] for _id, score in ranked[:limit] if score >= _FUZZY_SUGGEST]
+
+
+class ResolverCache:
+    """Resolver, перестраиваемый только при смене справочника (после обновления list_cache).
+
+    Справочник узнаётся по версии его записи в list_cache, а без версии —
+    по самому объекту словаря: содержимое на каждом поиске не хэшируется.
+    """
+
+    def __init__(self, aliases: Dict[str, Iterable[str]]) -> None:
+        self.aliases = aliases
+        self._lock = threading.Lock()
+        self._names: Optional[Dict[str, int]] = None
+        self._version: Optional[float] = None
+        self._resolver: Optional[Resolver] = None
+
+    def get(self, names: Dict[str, int], version: Optional[float] = None) -> Resolver:
+        with self._lock:
+            resolver = self._resolver
+            if resolver is not None and (
+                (version is not None and version == self._version) or (version is None and names is self._names)
+            ):
+                return resolver
+        resolver = Resolver(names, self.aliases)
+        with self._lock:
+            self._names, self._version, self._resolver = names, version, resolver
+        return resolver
+
+
+countries = ResolverCache(COUNTRY_ALIASES)
+departures = ResolverCache(DEPARTURE_ALIASES)
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import jsonutil
+from config import settings
+from filters import Condition, TourIndex, op_allowed
+
+# Сколько разных выборок (filter × sort × unique_hotels) держать в одной сессии
+_SELECTIONS = 8
+
+
+class Cursor(NamedTuple):
+    """Позиция в выдаче поиска; в ответе — непрозрачная строка (encode_cursor)."""
+
+    request_id: str
+    offset: int
+    limit: int
+    sort: str
+    unique_hotels: bool
+    where: Tuple[Condition, ...]
+    country_id: Optional[int]
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    body = {
+        "r": cursor.request_id,
+        "o": cursor.offset,
+        "l": cursor.limit,
+        "s": cursor.sort,
+        "u": int(cursor.unique_hotels),
+        "w": [[c.field, c.op, list(c.value) if isinstance(c.value, tuple) else c.value] for c in cursor.where],
+        "c": cursor.country_id,
+    }
+    return base64.urlsafe_b64encode(jsonutil.dumps(body).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(raw: str) -> Cursor:
+    """Строка из next_cursor -> Cursor; испорченный курсор — ValueError."""
+    try:
+        text = str(raw).strip()
+        body = jsonutil.loads(base64.urlsafe_b64decode(text + "=" * (-len(text) % 4)))
+        where = []
+        for field, op, value in body.get("w") or ():
+            if not op_allowed(field, op):
+                raise ValueError(field)
+            where.append(Condition(field, op, tuple(value) if isinstance(value, list) else value))
+        country = body.get("c")
+        return Cursor(
+            request_id=str(body["r"]),
+            offset=max(0, int(body.get("o") or 0)),
+            limit=max(0, int(body.get("l") or 0)),
+            sort=str(body.get("s") or "price"),
+            unique_hotels=bool(body.get("u")),
+            where=tuple(where),
+            country_id=int(country) if country is not None else None,
+        )
+    except (ValueError, TypeError, KeyError, AttributeError, binascii.Error):
+        raise ValueError("Некорректный cursor") from None
+
+
+class ResultSession:
+    """Результат одного поиска (requestid) для постраничной выдачи.
+
+    Хранит сырой снимок modresult, пока не попросят страницу: TourIndex
+    (компактные TourRecord + индексы) строится при первом обращении, после
+    чего снимок отпускается. Выборки (номера строк в нужном порядке) по
+    filter × sort × unique_hotels кэшируются, поэтому следующая страница —
+    срез списка и нормализация только её туров.
+    """
+
+    def __init__(self, version: Any, data: Dict[str, Any], build: Callable[[Dict[str, Any]], TourIndex], size: int) -> None:
+        self.version = version
+        self._data: Optional[Dict[str, Any]] = data
+        self._build = build
+        self._size = size
+        self._index: Optional[TourIndex] = None
+        self._lock = threading.Lock()
+        self._selections: "OrderedDict[tuple, List[int]]" = OrderedDict()
+
+    @property
+    def size(self) -> int:
+        """Сколько туров держит сессия (для бюджета TOUR_INDEX_MAX_TOURS)."""
+        return len(self._index) if self._index is not None else self._size
+
+    @property
+    def index(self) -> TourIndex:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._build(self._data or {})
+                    self._data = None
+        return self._index
+
+    def select(self, where: Sequence[Condition], sort: str, unique_hotels: bool) -> List[int]:
+        key = (tuple(where), sort, unique_hotels)
+        with self._lock:
+            rows = self._selections.get(key)
+            if rows is not None:
+                self._selections.move_to_end(key)
+                return rows
+        rows = self.index.select(where, sort, unique_hotels)
+        with self._lock:
+            self._selections[key] = rows
+            while len(self._selections) > _SELECTIONS:
+                self._selections.popitem(last=False)
+        return rows
+
+    def page(
+        self, where: Sequence[Condition], sort: str, unique_hotels: bool, offset: int, limit: int
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """(туры offset..offset+limit, сколько всего в выборке)."""
+        rows = self.select(where, sort, unique_hotels)
+        part = rows[offset:offset + limit] if limit > 0 else rows[offset:]
+        index = self.index
+        return [index.row(i) for i in part], len(rows)
+
+
+class ResultSessions:
+    """ResultSession по requestid: LRU с TTL от последнего обращения и общим бюджетом туров."""
+
+    def __init__(self, ttl: float, max_sessions: int, max_tours: int) -> None:
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_tours = max_tours
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[float, ResultSession]]" = OrderedDict()
+
+    def get(self, request_id: str) -> Optional[ResultSession]:
+        with self._lock:
+            item = self._items.get(request_id)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._items[request_id]
+                return None
+            self._items[request_id] = (time.time() + self.ttl, item[1])
+            self._items.move_to_end(request_id)
+            return item[1]
+
+    def open(
+        self,
+        request_id: str,
+        version: Any,
+        data: Dict[str, Any],
+        build: Callable[[Dict[str, Any]], TourIndex],
+        size: int = 0,
+    ) -> ResultSession:
+        """Сессия requestid; новый снимок (другая version) заменяет старую."""
+        session = self.get(request_id)
+        if session is not None and session.version == version:
+            return session
+        session = ResultSession(version, data, build, size)
+        with self._lock:
+            self._items[request_id] = (time.time() + self.ttl, session)
+            self._items.move_to_end(request_id)
+            self._evict()
+        return session
+
+    def forget(self, request_id: str) -> None:
+        with self._lock:
+            self._items.pop(request_id, None)
+
+    def _evict(self) -> None:
+        now = time.time()
+        for key in [k for k, (expires, _) in self._items.items() if expires < now]:
+            del self._items[key]
+        total = sum(session.size for _, session in self._items.values())
+        # самая свежая сессия остаётся, даже если одна больше бюджета
+        while len(self._items) > 1 and (
+            (self.max_sessions > 0 and len(self._items) > self.max_sessions)
+            or (self.max_tours > 0 and total > self.max_tours)
+        ):
+            _, (_, session) = self._items.popitem(last=False)
+            total -= session.size
+
+
+result_sessions = ResultSessions(settings.tour_index_ttl, settings.tour_index_max, settings.tour_index_max_tours)
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from cache import MemoryBackend
+from config import settings
+
+# Сколько requestid помнить вместе с их шардом
+_MAX_REQUESTS = 4096
+
+
+def shard_url(value: Any, default_url: str, template: str) -> Optional[str]:
+    """URL modresult по значению из ответа modsearch.
+
+    Полный URL берётся как есть, имя хоста (search3.tourvisor.ru) подставляется
+    в MODRESULT_URL вместо его хоста, номер (3) — в MODRESULT_SHARD_TEMPLATE.
+    """
+    s = str(value or "").strip()
+    if not s:
+        return None
+    if s.startswith(("http://", "https://")):
+        return s
+    if s.isdigit():
+        return template.format(shard=s) if template else None
+    if "." in s and "/" not in s and default_url:
+        try:
+            return str(httpx.URL(default_url).copy_with(host=s))
+        except Exception:
+            return None
+    return None
+
+
+class ShardRouter:
+    """Куда опрашивать modresult для requestid.
+
+    modsearch может вернуть шард (search*.tourvisor.ru), на котором живёт поиск:
+    learn() запоминает его, и все опросы этого requestid идут туда. Без
+    известного шарда — только MODRESULT_URL: чужой шард не падает, а отвечает
+    пустым результатом или «не найдено», и такой ответ выглядел бы как пустой
+    поиск. Если известный шард недоступен, candidates() даёт MODRESULT_URL.
+    """
+
+    def __init__(self, default_url: str, keys: List[str], template: str, ttl: float, max_size: int) -> None:
+        self.default_url = default_url
+        self.keys = keys
+        self.template = template
+        self.ttl = ttl
+        self._sticky = MemoryBackend(max_size=max_size)
+
+    def learn(self, request_id: Optional[str], data: Any) -> Optional[str]:
+        """Шард из ответа modsearch (поле из SHARD_KEYS, в т.ч. внутри result)."""
+        if not request_id or not isinstance(data, dict):
+            return None
+        sources = [data]
+        if isinstance(data.get("result"), dict):
+            sources.insert(0, data["result"])
+        for source in sources:
+            for key in self.keys:
+                url = shard_url(source.get(key), self.default_url, self.template)
+                if url:
+                    self.stick(request_id, url)
+                    return url
+        return None
+
+    def stick(self, request_id: str, url: str) -> None:
+        if self._sticky.get(request_id) != url:
+            self._sticky.set(request_id, url, self.ttl)
+
+    def candidates(self, request_id: str) -> List[str]:
+        """URL в порядке попыток: шард из modsearch (если известен), затем MODRESULT_URL."""
+        learned = self._sticky.get(request_id)
+        if learned and learned != self.default_url:
+            return [learned, self.default_url]
+        return [self.default_url]
+
+
+def _split(value: str) -> List[str]:
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+
+shard_router = ShardRouter(
+    settings.modresult_url,
+    _split(settings.shard_keys),
+    settings.modresult_shard_template,
+    settings.shard_ttl,
+    _MAX_REQUESTS,
+)
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from cache import MemoryBackend
+from config import settings
+
+# Словари ответа modresult, которые нужны нормализации дельты
+_DICT_KEYS = ("hotels", "hotel", "rooms", "meal", "operators")
+
+
+def _tour_identity(t: Dict[str, Any]) -> tuple:
+    """По каким полям тур считается тем же самым; цена не входит — переоценка
+    уже отданного тура новым туром не считается."""
+    return (
+        t.get("operator") or t.get("op"),
+        t.get("date") or t.get("dt"),
+        t.get("nights") or t.get("nt"),
+        t.get("room") or t.get("rm"),
+        t.get("meal") or t.get("ml"),
+    )
+
+
+def _hotel_entries(block: list) -> Iterator[Tuple[int, Dict[str, Any], list]]:
+    """(номер блока, отель, туры) — как _hotel_tours в eto_client, но с индексом блока."""
+    for index, b in enumerate(block):
+        hotels = b.get("hotel") if isinstance(b, dict) else None
+        if isinstance(hotels, dict):
+            hotels = [hotels]
+        if not isinstance(hotels, list):
+            continue
+        for h in hotels:
+            if not isinstance(h, dict):
+                continue
+            tours = h.get("tour")
+            if isinstance(tours, dict):
+                tours = [tours]
+            if isinstance(tours, list) and tours:
+                yield index, h, tours
+
+
+class SnapshotDiff:
+    """Разница между последовательными снимками modresult одного requestid.
+
+    modresult каждый раз отдаёт весь накопленный результат. feed() помнит,
+    какие (отель, тур) уже видели, и возвращает снимок того же формата, но
+    только с новыми турами — нормализовать нужно лишь его. Отель, у которого
+    число туров в блоке не изменилось, пропускается без разбора туров, так что
+    каждый опрос стоит O(отелей), а разбор туров за весь поиск — O(туров).
+    """
+
+    def __init__(self) -> None:
+        self.tours = 0
+        self.snapshots = 0
+        self._seen: Dict[Any, set] = {}
+        self._counts: Dict[Tuple[int, Any], int] = {}
+
+    def feed(self, data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Новые туры снимка в формате data (block + словари) или None, если их нет."""
+        if not isinstance(data, dict):
+            return None
+        inner = data.get("data", data)
+        block = inner.get("block") if isinstance(inner, dict) else None
+        if not isinstance(block, list):
+            return None
+        self.snapshots += 1
+
+        fresh_blocks: Dict[int, list] = {}
+        for index, h, tours in _hotel_entries(block):
+            hotel_key = h.get("hotelid") or h.get("id")
+            if not isinstance(hotel_key, (str, int)):
+                hotel_key = str(hotel_key)
+            slot = (index, hotel_key)
+            if self._counts.get(slot) == len(tours):
+                continue
+            self._counts[slot] = len(tours)
+            seen = self._seen.setdefault(hotel_key, set())
+            fresh = []
+            for t in tours:
+                if not isinstance(t, dict) or not (t.get("price") or t.get("pr")):
+                    continue
+                identity = _tour_identity(t)
+                try:
+                    if identity in seen:
+                        continue
+                except TypeError:
+                    # нехэшируемое поле (list/dict)
+                    identity = tuple(map(str, identity))
+                    if identity in seen:
+                        continue
+                seen.add(identity)
+                fresh.append(t)
+            if fresh:
+                self.tours += len(fresh)
+                fresh_blocks.setdefault(index, []).append({**h, "tour": fresh})
+
+        if not fresh_blocks:
+            return None
+        delta: Dict[str, Any] = {k: inner[k] for k in _DICT_KEYS if k in inner}
+        delta["block"] = [{"hotel": hotels} for _, hotels in sorted(fresh_blocks.items())]
+        return delta
+
+    def __len__(self) -> int:
+        return self.tours
+
+
+class SnapshotDiffs:
+    """SnapshotDiff по requestid для API «новое с прошлого опроса» (LRU + TTL)."""
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self._items = MemoryBackend(max_size=max_size)
+
+    def get(self, request_id: str) -> SnapshotDiff:
+        diff = self._items.get(request_id)
+        if diff is None:
+            diff = SnapshotDiff()
+            self._items.set(request_id, diff, self.ttl)
+        return diff
+
+    def forget(self, request_id: str) -> None:
+        self._items.delete(request_id)
+
+
+snapshot_diffs = SnapshotDiffs(settings.delta_ttl, settings.delta_max_requests)
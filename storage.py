@@ -1,25 +1,170 @@
+from __future__ import annotations
+
 import threading
-from typing import Any, Dict, Optional
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from polling import PollProgress
+
+# Параметры modsearch, которые не показываются в /searches
+_PRIVATE_PARAMS = ("session", "referrer")
+
+
+@dataclass
+class SearchState:
+    """Поиск одного requestid: параметры, авторизация, прогресс опроса и частичный результат."""
 
+    request_id: str
+    payload: Dict[str, Any]
+    auth: Tuple[Optional[str], Optional[str]]  # (session, referrer)
+    cache_key: Optional[str] = None
+    started: float = field(default_factory=time.time)
+    updated: float = field(default_factory=time.time)
+    status: str = "running"  # running | done | failed
+    polls: int = 0
+    tours: int = 0
+    hotels: int = 0
+    finished: bool = False
+    error: Optional[str] = None
+    # Последний снимок modresult с турами — только пока поиск идёт
+    snapshot: Optional[Dict[str, Any]] = None
 
-class SearchStore:
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "requestid": self.request_id,
+            "status": self.status,
+            "polls": self.polls,
+            "tours": self.tours,
+            "hotels": self.hotels,
+            "finished": self.finished,
+            "error": self.error,
+            "started": round(self.started, 3),
+            "updated": round(self.updated, 3),
+            "age_s": round(time.time() - self.started, 1),
+            "params": {k: v for k, v in self.payload.items() if k not in _PRIVATE_PARAMS},
+        }
+
+
+class _Shard:
     def __init__(self) -> None:
-        self._lock = threading.Lock()
-        self._last_search_id: Optional[str] = None
-        self._last_payload: Optional[Dict[str, Any]] = None
+        self.lock = threading.Lock()
+        self.items: "OrderedDict[str, SearchState]" = OrderedDict()
+
+
+class SearchRegistry:
+    """Идущие и недавние поиски по requestid.
+
+    Состояние у каждого requestid своё: параметры и session/referrer поиска
+    (а не последние увиденные в процессе), прогресс опроса и последний снимок
+    с турами. Записи разложены по shards частям со своими блокировками, так
+    что опросы разных поисков не ждут друг друга; в каждой части — LRU по
+    последнему обновлению и TTL. Снимок хранится, только пока поиск идёт:
+    готовый результат живёт в search_cache и sessions.
+    """
+
+    def __init__(self, ttl: float, max_size: int, shards: int = 16) -> None:
+        self.ttl = ttl
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._shard_size = max(1, -(-max_size // len(self._shards))) if max_size > 0 else 0
+
+    def _shard(self, request_id: str) -> _Shard:
+        return self._shards[zlib.crc32(request_id.encode("utf-8")) % len(self._shards)]
+
+    def _live(self, shard: _Shard, request_id: str) -> Optional[SearchState]:
+        state = shard.items.get(request_id)
+        if state is not None and self.ttl > 0 and state.updated + self.ttl < time.time():
+            del shard.items[request_id]
+            return None
+        return state
+
+    def start(
+        self,
+        request_id: str,
+        payload: Dict[str, Any],
+        auth: Tuple[Optional[str], Optional[str]],
+        cache_key: Optional[str] = None,
+    ) -> SearchState:
+        """Регистрирует поиск; повторный опрос известного requestid продолжает его запись."""
+        shard = self._shard(request_id)
+        with shard.lock:
+            state = self._live(shard, request_id)
+            if state is None:
+                state = SearchState(request_id, dict(payload), auth, cache_key)
+                shard.items[request_id] = state
+            else:
+                state.status, state.error, state.updated = "running", None, time.time()
+            shard.items.move_to_end(request_id)
+            while self._shard_size and len(shard.items) > self._shard_size:
+                shard.items.popitem(last=False)
+            return state
+
+    def get(self, request_id: str) -> Optional[SearchState]:
+        shard = self._shard(request_id)
+        with shard.lock:
+            return self._live(shard, request_id)
+
+    def observe(
+        self,
+        request_id: str,
+        polls: int,
+        progress: Optional[PollProgress],
+        snapshot: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Очередной опрос modresult: прогресс и (если есть туры) новый снимок."""
+        shard = self._shard(request_id)
+        with shard.lock:
+            state = self._live(shard, request_id)
+            if state is None:
+                return
+            state.polls = polls
+            state.updated = time.time()
+            if progress is not None:
+                state.tours, state.hotels, state.finished = progress.tours, progress.hotels, progress.finished
+            if snapshot is not None:
+                state.snapshot = snapshot
+            shard.items.move_to_end(request_id)
+
+    def finish(self, request_id: str, found: bool, error: Optional[str] = None) -> None:
+        shard = self._shard(request_id)
+        with shard.lock:
+            state = self._live(shard, request_id)
+            if state is None:
+                return
+            state.status = "done" if found else "failed"
+            state.error = error
+            state.snapshot = None
+            state.updated = time.time()
+
+    def auth(self, request_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """session/referrer, с которыми запускался requestid (иначе — из настроек)."""
+        state = self.get(request_id)
+        if state is not None:
+            return state.auth
+        return settings.default_session or None, settings.default_referrer or None
 
-    def set_last(self, search_id: Optional[str], payload: Dict[str, Any]) -> None:
-        with self._lock:
-            self._last_search_id = search_id
-            self._last_payload = payload
+    def snapshot(self, request_id: str) -> Optional[Dict[str, Any]]:
+        state = self.get(request_id)
+        return state.snapshot if state is not None else None
 
-    def get_last_id(self) -> Optional[str]:
-        with self._lock:
-            return self._last_search_id
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Сводки поисков, новые первыми."""
+        states: List[SearchState] = []
+        for shard in self._shards:
+            with shard.lock:
+                for request_id in list(shard.items):
+                    state = self._live(shard, request_id)
+                    if state is not None and (status is None or state.status == status):
+                        states.append(state)
+        states.sort(key=lambda s: s.started, reverse=True)
+        selected = states[:limit] if limit > 0 else states
+        return [s.summary() for s in selected]
 
-    def get_last_payload(self) -> Optional[Dict[str, Any]]:
-        with self._lock:
-            return self._last_payload
+    def __len__(self) -> int:
+        return sum(len(shard.items) for shard in self._shards)
 
 
-store = SearchStore()
+searches = SearchRegistry(settings.search_registry_ttl, settings.search_registry_size)
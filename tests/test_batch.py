@@ -0,0 +1,44 @@
+import asyncio
+
+import eto_client
+from bench.payloads import modresult_payload
+
+
+def _fake_upstream(monkeypatch):
+    started = []
+
+    async def modsearch(payload):
+        await asyncio.sleep(0.01)
+        started.append(payload)
+        return {"success": True, "data": {"result": {"requestid": f"batch-{len(started)}"}}}
+
+    async def modresult(request_id):
+        return {"success": True, "data": modresult_payload(50, seed=3)}
+
+    monkeypatch.setattr(eto_client, "async_modsearch", modsearch)
+    monkeypatch.setattr(eto_client, "async_modresult", modresult)
+    return started
+
+
+def test_batch_shares_search_cache_and_inflight(monkeypatch):
+    started = _fake_upstream(monkeypatch)
+    search = {"country": 4, "city_from": 1, "nights_from": 9, "nights_to": 9}
+
+    async def together():
+        return await asyncio.gather(
+            eto_client.async_search_tours(dict(search)),
+            eto_client.async_search_tours_batch({"searches": [dict(search), dict(search)]}),
+        )
+
+    single, batch = asyncio.run(together())
+    assert single["success"] is True and batch["success"] is True
+    # одиночный поиск и пакет склеились в один modsearch
+    assert len(started) == 1
+    assert {item["requestid"] for item in batch["searches"]} == {single["requestid"]}
+
+    # результат пакета лежит в search_cache
+    other = {"country": 4, "city_from": 1, "nights_from": 11, "nights_to": 11}
+    asyncio.run(eto_client.async_search_tours_batch({"searches": [other]}))
+    assert len(started) == 2
+    assert asyncio.run(eto_client.async_search_tours(dict(other)))["success"] is True
+    assert len(started) == 2
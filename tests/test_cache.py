@@ -0,0 +1,51 @@
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import eto_client
+from cache import LEASE_PREFIX, SQLiteBackend
+
+
+class _Boom:
+    def __reduce__(self):
+        return (exec, ("raise SystemExit('pickle payload executed')",))
+
+
+def test_sqlite_values_are_json(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite3"), table="search")
+    backend.set("k", {"success": True, "data": {"block": [1, 2]}, "rating": 4.5}, 60)
+    assert backend.get("k") == {"success": True, "data": {"block": [1, 2]}, "rating": 4.5}
+
+    # чужая запись в общем файле не выполняется, а считается промахом
+    backend._conn.execute("UPDATE search SET value = ? WHERE key = 'k'", (pickle.dumps(_Boom()),))
+    assert backend.get("k") is None
+
+
+def test_prune_keeps_leases(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite3"), table="search", max_size=2)
+    assert backend.add(LEASE_PREFIX + "a", 123, 5)
+    for i in range(5):
+        backend.set(f"r{i}", {"i": i}, 600)
+    backend._prune()
+    assert backend.get(LEASE_PREFIX + "a") == 123
+    assert [backend.get(f"r{i}") for i in range(5)].count(None) == 3
+
+
+def test_cold_list_is_loaded_once():
+    calls = []
+    gate = threading.Event()
+
+    def load():
+        calls.append(1)
+        gate.wait(1)
+        return {"турция": 4}
+
+    key = f"cold-{time.time()}"
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(eto_client._cached_list_versioned, key, load) for _ in range(8)]
+        time.sleep(0.05)
+        gate.set()
+        results = [f.result() for f in futures]
+    assert len(calls) == 1
+    assert all(r == results[0] and r[0] == {"турция": 4} for r in results)
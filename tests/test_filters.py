@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+import eto_client
+from eto_client import _index_builder, _to_date
+from filters import parse_filter
+
+
+def _modresult(dates):
+    tours = [
+        {"price": str(50000 + i * 1000), "operator": "1", "date": d, "nights": "7", "room": "30", "meal": "3"}
+        for i, d in enumerate(dates)
+    ]
+    return {
+        "data": {
+            "status": {"state": "finished", "hotelsfound": 1, "toursfound": len(tours)},
+            "block": [{"hotel": [{"hotelid": "100", "tour": tours}]}],
+            "hotels": {"100": {"name": "HOTEL", "stars": "4", "region": "Kemer"}},
+            "rooms": {"30": {"name": "standard"}},
+            "meal": {"3": {"name": "BB"}},
+            "operators": [{"id": "1", "name": "Operator 1"}],
+        }
+    }
+
+
+_CTX = {"country_id": 4, "auth": (None, None), "refresh_hotels": False}
+
+
+def test_to_date_iso():
+    assert _to_date("20.07.2026") == "2026-07-20"
+    assert _to_date("2026-07-20") == "2026-07-20"
+    assert _to_date("") is None
+
+
+def test_date_filter_on_upstream_dates():
+    index = _index_builder(_CTX)(_modresult(["20.07.2026", "02.08.2026", "10.07.2026"]))
+    rows, total = index.query(parse_filter({"date": {"gte": "2026-07-16"}}), "date", 0, False)
+    assert total == 2
+    assert [t["date"] for t in rows] == ["2026-07-20", "2026-08-02"]
+
+    rows, total = index.query(parse_filter({"date": {"lte": "31.07.2026"}}), "date", 0, False)
+    assert [t["date"] for t in rows] == ["2026-07-10", "2026-07-20"]
+
+
+def test_unknown_sort_rejected_everywhere():
+    calls = [
+        eto_client.async_search_tours({"country": 4, "sort": "cheap"}),
+        eto_client.async_search_tours_batch({"searches": [{"country": 4}], "sort": "cheap"}),
+        eto_client.async_search_tours_flexible({"country": 4, "date_from": "2026-07-01", "date_to": "2026-07-10", "sort": "cheap"}),
+        eto_client.async_result_delta("req", sort="cheap"),
+    ]
+    errors = {asyncio.run(call)["error"] for call in calls}
+    assert errors == {"sort должен быть одним из: price, price_per_night, date, stars"}
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        {"price": {"contains": 5}},
+        {"stars": {"contains": [4, 5]}},
+        {"nights": {"contains": 7}},
+        {"meal": {"contains": "AI"}},
+        {"date": {"contains": "2026-07-20"}},
+        {"region": {"gte": "Кемер"}},
+    ],
+)
+def test_unsupported_operator_for_field_is_rejected(spec):
+    with pytest.raises(ValueError, match="не подходит к полю"):
+        parse_filter(spec)
+
+
+def test_unsupported_operator_is_an_error_response():
+    result = asyncio.run(eto_client.async_search_tours({"country": 4, "filter": {"price": {"contains": 5}}}))
+    assert result["success"] is False and "filter.price" in result["error"]
+    assert parse_filter({"operator": 16, "hotel": ["rixos", "titanic"]})
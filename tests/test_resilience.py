@@ -0,0 +1,110 @@
+import asyncio
+
+import httpx
+
+import eto_client
+from resilience import CircuitBreaker
+
+URL = "http://tourvisor.test/modresult"
+
+
+def _trip(breaker):
+    breaker.record("tourvisor.test/modresult", False)
+    assert breaker.state("tourvisor.test/modresult") == "half-open"
+
+
+async def _with_client(handler, coro_factory):
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        token = eto_client._LOOP_CLIENT.set(client)
+        try:
+            return await coro_factory()
+        finally:
+            eto_client._LOOP_CLIENT.reset(token)
+
+
+def test_cancelled_probe_is_released(monkeypatch):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.0)
+    monkeypatch.setattr(eto_client, "breaker", breaker)
+    _trip(breaker)
+
+    async def hang(request):
+        await asyncio.sleep(10)
+
+    async def cancel_probe():
+        task = asyncio.create_task(eto_client._arequest(URL, {}))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(_with_client(hang, cancel_probe))
+    # без release probing остался бы True и admit() всегда отвечал бы open
+    assert breaker.admit("tourvisor.test/modresult") == "probe"
+
+
+def test_probe_success_closes_circuit(monkeypatch):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.0)
+    monkeypatch.setattr(eto_client, "breaker", breaker)
+    _trip(breaker)
+
+    result = asyncio.run(_with_client(lambda request: httpx.Response(200, json={"ok": 1}), lambda: eto_client._arequest(URL, {})))
+    assert result == {"success": True, "data": {"ok": 1}}
+    assert breaker.state("tourvisor.test/modresult") == "closed"
+
+
+def test_retries_then_unavailable(monkeypatch):
+    monkeypatch.setattr(eto_client, "breaker", CircuitBreaker(threshold=0, reset_timeout=0.0))
+    monkeypatch.setattr(eto_client, "retry_delay", lambda attempt, retry_after=None: 0.0)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    result = asyncio.run(_with_client(handler, lambda: eto_client._arequest(URL, {})))
+    assert result["unavailable"] is True and result["error"] == "HTTP 503"
+    assert len(calls) == eto_client.settings.retry_attempts + 1
+
+
+def test_sync_request_shares_decisions(monkeypatch):
+    monkeypatch.setattr(eto_client, "breaker", CircuitBreaker(threshold=1, reset_timeout=60.0))
+    monkeypatch.setattr(eto_client, "retry_delay", lambda attempt, retry_after=None: 0.0)
+    monkeypatch.setattr(eto_client, "_CLIENT", httpx.Client(transport=httpx.MockTransport(lambda r: httpx.Response(502))))
+
+    assert eto_client._request(URL, {})["unavailable"] is True
+    # цепь открыта: следующий запрос отклоняется без обращения к Tourvisor
+    assert "временно отключён" in eto_client._request(URL, {})["error"]
+
+
+def test_modsearch_not_retried_after_read_timeout(monkeypatch):
+    monkeypatch.setattr(eto_client, "breaker", CircuitBreaker(threshold=0, reset_timeout=0.0))
+    monkeypatch.setattr(eto_client, "retry_delay", lambda attempt, retry_after=None: 0.0)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        raise httpx.ReadTimeout("timeout", request=request)
+
+    result = asyncio.run(_with_client(handler, lambda: eto_client._arequest(URL, {}, idempotent=False)))
+    # соединение не установилось — повтор; таймаут чтения — поиск мог уже начаться
+    assert result["unavailable"] is True and len(calls) == 2
+
+    calls.clear()
+    result = asyncio.run(_with_client(handler, lambda: eto_client._arequest(URL, {})))
+    assert len(calls) == eto_client.settings.retry_attempts + 1
+
+
+def test_non_transport_error_is_not_success(monkeypatch):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=60.0)
+    monkeypatch.setattr(eto_client, "breaker", breaker)
+
+    def handler(request):
+        raise httpx.TooManyRedirects("loop", request=request)
+
+    result = asyncio.run(_with_client(handler, lambda: eto_client._arequest(URL, {})))
+    assert result["success"] is False and "unavailable" not in result
+    assert breaker.state("tourvisor.test/modresult") == "open"
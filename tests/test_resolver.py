@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+import eto_client
+from resolver import COUNTRY_ALIASES, DEPARTURE_ALIASES, Resolver, ResolverCache
+
+
+def test_resolver_cache_by_version():
+    cache = ResolverCache(COUNTRY_ALIASES)
+    first = cache.get({"турция": 4, "египет": 1}, 1.0)
+    # другой объект словаря (после JSON из общего кэша), та же версия — без перестройки
+    assert cache.get({"турция": 4, "египет": 1}, 1.0) is first
+    assert cache.get({"турция": 4, "египет": 1, "оаэ": 9}, 2.0) is not first
+
+
+def test_resolver_cache_by_identity():
+    cache = ResolverCache(COUNTRY_ALIASES)
+    names = {"турция": 4}
+    first = cache.get(names)
+    assert cache.get(names) is first
+    assert cache.get(dict(names)) is not first
+
+
+def test_country_index_follows_list_refresh():
+    eto_client._store_list("country", {"турция": 4, "египет": 1})
+    index = eto_client._country_index()
+    assert eto_client._country_index() is index
+    assert index.resolve("Турции").id == 4
+
+    eto_client._store_list("country", {"турция": 4, "египет": 1, "оаэ": 9})
+    assert eto_client._country_index() is not index
+
+
+@pytest.mark.parametrize(
+    "query, aliases, fallback",
+    [
+        ("Индия", COUNTRY_ALIASES, eto_client._COUNTRY_FALLBACK),
+        ("Германия", COUNTRY_ALIASES, eto_client._COUNTRY_FALLBACK),
+        ("Иордания", COUNTRY_ALIASES, eto_client._COUNTRY_FALLBACK),
+        ("Омск", DEPARTURE_ALIASES, eto_client._DEPARTURE_FALLBACK),
+        ("Томск", DEPARTURE_ALIASES, eto_client._DEPARTURE_FALLBACK),
+        ("Калининград", DEPARTURE_ALIASES, eto_client._DEPARTURE_FALLBACK),
+    ],
+)
+def test_unlisted_place_is_not_swapped_for_similar(query, aliases, fallback):
+    assert Resolver(fallback, aliases).resolve(query) is None
+
+
+def test_unknown_names_return_error_with_hints():
+    eto_client._store_list("country", dict(eto_client._COUNTRY_FALLBACK))
+    eto_client._store_list("departure", dict(eto_client._DEPARTURE_FALLBACK))
+    country = asyncio.run(eto_client.async_search_key({"country": "Индия"}))
+    assert country["success"] is False and "Страна 'Индия' не найдена" in country["error"]
+    departure = asyncio.run(eto_client.async_search_key({"country": "Турция", "city_from": "Омск"}))
+    assert departure["success"] is False and "Город вылета 'Омск' не найден" in departure["error"]
+    typo = asyncio.run(eto_client.async_search_key({"country": "Египед"}))
+    assert "Возможно: " in typo["error"] and "египет" in typo["error"].lower()
+    assert asyncio.run(eto_client.async_search_key({"country": "Турции", "city_from": "из Питера"}))["success"] is True
@@ -0,0 +1,72 @@
+import asyncio
+
+from bench.payloads import modresult_payload
+from config import settings
+from eto_client import _result_page, async_search_page
+
+
+def _ctx(limit, sort="price", unique_hotels=False):
+    return {
+        "country_id": 4,
+        "auth": (None, None),
+        "refresh_hotels": False,
+        "limit": limit,
+        "sort": sort,
+        "unique_hotels": unique_hotels,
+        "filter": [],
+    }
+
+
+def _all_pages(data, ctx, request_id):
+    page = _result_page(data, ctx, request_id)
+    tours = list(page["tours"])
+    while page.get("next_cursor"):
+        page = asyncio.run(async_search_page(page["next_cursor"]))
+        assert page["success"] is True
+        tours.extend(page["tours"])
+    return tours
+
+
+def _key(t):
+    return (t["hotel_id"], t["date"], t["nights"], t["price"], t["operator"], t["room"], t["meal"])
+
+
+def test_date_pages_are_contiguous():
+    data = modresult_payload(200, seed=3)
+    tours = _all_pages(data, _ctx(17, "date"), "req-date")
+    assert len(tours) == 200
+    assert len({_key(t) for t in tours}) == 200
+    assert [(t["date"], t["price"]) for t in tours] == sorted((t["date"], t["price"]) for t in tours)
+
+
+def test_unique_hotel_pages():
+    data = modresult_payload(300, tours_per_hotel=10, seed=4)
+    tours = _all_pages(data, _ctx(7, "price", unique_hotels=True), "req-unique")
+    assert len({t["hotel_id"] for t in tours}) == len(tours) == 30
+
+
+def test_no_cursor_when_exactly_limit():
+    data = modresult_payload(20, seed=5)
+    page = _result_page(data, _ctx(20), "req-exact")
+    assert len(page["tours"]) == 20
+    assert "next_cursor" not in page
+
+
+def test_same_tour_schema_paged_or_not():
+    data = modresult_payload(300, seed=2)
+    small = _result_page(data, _ctx(500), "req-schema-all")
+    paged = _result_page(data, _ctx(5), "req-schema-paged")
+    assert "next_cursor" in paged and "next_cursor" not in small
+    assert set(small["tours"][0]) == set(paged["tours"][0])
+    assert {"stars", "region", "rating"} <= set(paged["tours"][0])
+
+
+def test_page_limit_is_validated():
+    data = modresult_payload(200, seed=6)
+    cursor = _result_page(data, _ctx(5), "req-limit")["next_cursor"]
+    for bad in (0, -3, "x"):
+        page = asyncio.run(async_search_page(cursor, bad))
+        assert page["success"] is False
+    page = asyncio.run(async_search_page(cursor, 10**6))
+    assert len(page["tours"]) == settings.max_tours and page["next_cursor"]
+    assert len(asyncio.run(async_search_page(cursor))["tours"]) == 5
@@ -0,0 +1,27 @@
+from eto_client import _endpoint, _rate_group
+from shards import ShardRouter
+
+DEFAULT = "http://tourvisor.ru/xml/modresult.php"
+
+
+def _router():
+    return ShardRouter(DEFAULT, ["server"], "http://search{shard}.tourvisor.ru/xml/modresult.php", 60, 16)
+
+
+def test_unknown_request_goes_to_default_only():
+    assert _router().candidates("req-1") == [DEFAULT]
+
+
+def test_learned_shard_first_then_default():
+    router = _router()
+    assert router.learn("req-1", {"result": {"requestid": "req-1", "server": 3}}) == "http://search3.tourvisor.ru/xml/modresult.php"
+    assert router.candidates("req-1") == ["http://search3.tourvisor.ru/xml/modresult.php", DEFAULT]
+    assert router.candidates("req-2") == [DEFAULT]
+
+
+def test_shards_share_rate_limit_not_breaker():
+    a, b = "http://search1.tourvisor.ru/xml/modresult.php", "http://search3.tourvisor.ru/xml/modresult.php"
+    assert _rate_group(a) == _rate_group(b) == _rate_group(DEFAULT)
+    assert _endpoint(a) != _endpoint(b)
+    assert _rate_group(DEFAULT) != _rate_group("http://tourvisor.ru/xml/modsearch.php")
+    assert _rate_group("http://127.0.0.1:8000/modresult") == "127.0.0.1/modresult"
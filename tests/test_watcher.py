@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import eto_client
+from bench.payloads import modresult_payload
+from watcher import Watcher, WatchStore, cheapest_offers
+
+
+def _fake_search(payloads):
+    calls = []
+
+    async def search_result(ctx):
+        calls.append(ctx["cache_key"])
+        return {"success": True, "requestid": f"req-{len(calls)}", "data": payloads[min(len(calls), len(payloads)) - 1]}
+
+    return search_result, calls
+
+
+def test_watches_share_one_search_and_report_changes(monkeypatch):
+    first = modresult_payload(200, seed=7)
+    second = modresult_payload(200, seed=7)
+    # одна цена снизилась, у другого отеля появилась новая дата
+    second["data"]["block"][0]["hotel"][0]["tour"][0]["price"] = "1000"
+    second["data"]["block"][0]["hotel"][1]["tour"].append(
+        {"price": "50000", "operator": "1", "date": "01.09.2026", "nights": "7", "room": "30", "meal": "3"}
+    )
+    search_result, calls = _fake_search([first, second])
+    monkeypatch.setattr(eto_client, "_search_result", search_result)
+
+    store = WatchStore(":memory:")
+    plain = store.add({"country": 4, "city_from": 1}, 3600)
+    stars = store.add({"country": 4, "city_from": 1, "filter": {"stars": {"gte": 2}}}, 3600)
+    watcher = Watcher(store, tick=1, concurrency=2, jitter=0)
+
+    assert asyncio.run(watcher.run_due()) == 1
+    assert len(calls) == 1
+    assert store.events(plain["id"]) == [] and store.events(stars["id"]) == []
+
+    for watch in (plain, stars):
+        store._conn.execute("UPDATE watches SET next_run = 0 WHERE id = ?", (watch["id"],))
+    assert asyncio.run(watcher.run_due()) == 1
+    assert len(calls) == 2
+    kinds = sorted(e["kind"] for e in store.events(plain["id"]))
+    assert kinds == ["drop", "new"]
+    assert sorted(e["kind"] for e in store.events(stars["id"])) == kinds
+    new = next(e for e in store.events(plain["id"]) if e["kind"] == "new")
+    assert new["tour"]["date"] == "2026-09-01"
+
+
+def test_search_all_tours_per_filter(monkeypatch):
+    search_result, calls = _fake_search([modresult_payload(100, seed=8)])
+    monkeypatch.setattr(eto_client, "_search_result", search_result)
+    result = asyncio.run(eto_client.async_search_all_tours({"country": 4}, [None, {"price": {"lte": 0}}]))
+    assert result["success"] is True and len(calls) == 1
+    assert len(result["tours"][0]) == 100 and result["tours"][1] == []
+
+    assert asyncio.run(eto_client.async_search_key({"country": 4, "sort": "nope"}))["success"] is False
+
+
+def test_partial_run_does_not_repeat_events():
+    store = WatchStore(":memory:")
+    watch = store.add({"country": 4}, 3600)
+    a = {"hotel_id": 1, "date": "2026-07-20", "nights": 7, "price": 50000}
+    b = {"hotel_id": 2, "date": "2026-07-20", "nights": 7, "price": 60000}
+    full = cheapest_offers([a, b])
+    assert store.apply(watch["id"], full) == []
+    # опрос остановился раньше и увидел только один отель
+    assert store.apply(watch["id"], cheapest_offers([a])) == []
+    assert store.apply(watch["id"], full) == []
+    assert [e["kind"] for e in store.apply(watch["id"], cheapest_offers([a, dict(b, price=55000)]))] == ["drop"]
+
+    store.prune(time.time() + 1)
+    assert store._conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0] == 0
@@ -0,0 +1,406 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import jsonutil
+import logs
+from config import settings
+from eto_client import async_search_all_tours, async_search_key
+
+# Опции выдачи search_tours: на наблюдение не влияют
+_OUTPUT_OPTIONS = ("limit", "max", "sort", "unique_hotels", "cursor", "requestid", "request_id", "interval")
+# Поля тура в событии
+_EVENT_FIELDS = ("hotel_id", "hotel_name", "hotel_link", "date", "nights", "price", "meal_name", "room_name", "operator_name", "stars", "region")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watches (
+    id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    interval REAL NOT NULL,
+    created REAL NOT NULL,
+    next_run REAL NOT NULL,
+    last_run REAL,
+    last_error TEXT,
+    runs INTEGER NOT NULL DEFAULT 0,
+    primed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS watches_next_run ON watches (next_run);
+CREATE TABLE IF NOT EXISTS prices (
+    watch_id TEXT NOT NULL,
+    hotel_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    nights INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    seen REAL NOT NULL,
+    PRIMARY KEY (watch_id, hotel_id, date, nights)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS price_history (
+    watch_id TEXT NOT NULL,
+    hotel_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    nights INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS price_history_key ON price_history (watch_id, hotel_id, date, nights, ts);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    watch_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    old_price INTEGER,
+    tour TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_watch ON events (watch_id, id);
+"""
+
+_WATCH_COLUMNS = "id, payload, interval, created, next_run, last_run, last_error, runs"
+
+Offer = Tuple[int, str, int]  # (hotel_id, date, nights)
+
+
+def cheapest_offers(tours: Iterable[Dict[str, Any]]) -> Dict[Offer, Dict[str, Any]]:
+    """Самый дешёвый тур на каждую тройку отель × дата × ночи."""
+    best: Dict[Offer, Dict[str, Any]] = {}
+    for t in tours:
+        hid, date, nights, price = t.get("hotel_id"), t.get("date"), t.get("nights"), t.get("price")
+        if hid is None or not date or nights is None or price is None:
+            continue
+        key = (hid, date, nights)
+        prev = best.get(key)
+        if prev is None or price < prev["price"]:
+            best[key] = t
+    return best
+
+
+class WatchStore:
+    """Наблюдения, их последние цены, история цен и события (SQLite).
+
+    prices — последняя известная цена «отель × дата × ночи» на наблюдение
+    (seen — когда предложение видели в последний раз); в price_history
+    пишется только изменившаяся цена, так что история компактна. Файл общий для воркеров: claim_due забирает
+    наблюдение атомарным UPDATE, и один запуск достаётся одному процессу.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _watch(row: tuple) -> Dict[str, Any]:
+        return {
+            "id": row[0],
+            "payload": jsonutil.loads(row[1]),
+            "interval": row[2],
+            "created": row[3],
+            "next_run": row[4],
+            "last_run": row[5],
+            "last_error": row[6],
+            "runs": row[7],
+        }
+
+    def add(self, payload: Dict[str, Any], interval: float) -> Dict[str, Any]:
+        watch_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO watches (id, payload, interval, created, next_run) VALUES (?, ?, ?, ?, ?)",
+                (watch_id, jsonutil.dumps(payload), interval, now, now),
+            )
+        return self.get(watch_id) or {}
+
+    def get(self, watch_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_WATCH_COLUMNS} FROM watches WHERE id = ?", (watch_id,)).fetchone()
+        return self._watch(row) if row else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {_WATCH_COLUMNS} FROM watches ORDER BY created").fetchall()
+        return [self._watch(row) for row in rows]
+
+    def remove(self, watch_id: str) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                removed = self._conn.execute("DELETE FROM watches WHERE id = ?", (watch_id,)).rowcount
+                for table in ("prices", "price_history", "events"):
+                    self._conn.execute(f"DELETE FROM {table} WHERE watch_id = ?", (watch_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return removed > 0
+
+    def claim_due(self, now: float, limit: int, jitter: float) -> List[Dict[str, Any]]:
+        """Наблюдения, которым пора; следующий запуск сразу сдвигается на interval ± jitter."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_WATCH_COLUMNS} FROM watches WHERE next_run <= ? ORDER BY next_run LIMIT ?", (now, limit)
+            ).fetchall()
+            claimed = []
+            for row in rows:
+                watch = self._watch(row)
+                spread = 1.0 + random.uniform(-jitter, jitter)
+                updated = self._conn.execute(
+                    "UPDATE watches SET next_run = ? WHERE id = ? AND next_run = ?",
+                    (now + watch["interval"] * spread, watch["id"], watch["next_run"]),
+                ).rowcount
+                # 0 — запуск уже забрал другой воркер
+                if updated:
+                    claimed.append(watch)
+        return claimed
+
+    def finish(self, watch_id: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE watches SET last_run = ?, last_error = ?, runs = runs + 1 WHERE id = ?",
+                (time.time(), error, watch_id),
+            )
+
+    def apply(self, watch_id: str, offers: Dict[Offer, Dict[str, Any]], min_drop: int = 0) -> List[Dict[str, Any]]:
+        """Сравнивает новый снимок с прошлым и сохраняет его; возвращает события.
+
+        new — тройки, которой ещё не видели, drop — цена ниже последней известной
+        больше чем на min_drop. Первый удачный запуск только запоминает цены.
+        Рост цены и пропавшие предложения событий не дают. Пропавшие не
+        удаляются: опрос может остановиться на POLL_GOOD_ENOUGH_TOURS и увидеть
+        лишь часть выдачи, и вернувшееся предложение иначе стало бы «новым».
+        Их цены живут до prune() по seen.
+        """
+        now = time.time()
+        with self._lock:
+            primed = self._conn.execute("SELECT primed FROM watches WHERE id = ?", (watch_id,)).fetchone()
+            if primed is None:
+                return []
+            first = not primed[0]
+            previous = {
+                (row[0], row[1], row[2]): row[3]
+                for row in self._conn.execute(
+                    "SELECT hotel_id, date, nights, price FROM prices WHERE watch_id = ?", (watch_id,)
+                )
+            }
+            events: List[Dict[str, Any]] = []
+            seen = []
+            changed = []
+            for key, tour in offers.items():
+                price = tour["price"]
+                old = previous.get(key)
+                seen.append((watch_id, *key, price, now))
+                if old == price:
+                    continue
+                changed.append((watch_id, *key, price, now))
+                if first:
+                    continue
+                if old is None:
+                    events.append({"kind": "new", "price": price, "old_price": None, "tour": tour})
+                elif price < old - min_drop:
+                    events.append({"kind": "drop", "price": price, "old_price": old, "tour": tour})
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    """
+                    INSERT INTO prices (watch_id, hotel_id, date, nights, price, seen) VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(watch_id, hotel_id, date, nights) DO UPDATE SET price = excluded.price, seen = excluded.seen
+                    """,
+                    seen,
+                )
+                self._conn.executemany(
+                    "INSERT INTO price_history (watch_id, hotel_id, date, nights, price, ts) VALUES (?, ?, ?, ?, ?, ?)",
+                    changed,
+                )
+                for event in events:
+                    tour = {k: event["tour"].get(k) for k in _EVENT_FIELDS if event["tour"].get(k) is not None}
+                    cursor = self._conn.execute(
+                        "INSERT INTO events (watch_id, ts, kind, price, old_price, tour) VALUES (?, ?, ?, ?, ?, ?)",
+                        (watch_id, now, event["kind"], event["price"], event["old_price"], jsonutil.dumps(tour)),
+                    )
+                    event.update(id=cursor.lastrowid, ts=now, tour=tour)
+                if first:
+                    self._conn.execute("UPDATE watches SET primed = 1 WHERE id = ?", (watch_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return events
+
+    def events(self, watch_id: str, since: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, ts, kind, price, old_price, tour FROM events WHERE watch_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (watch_id, since, limit),
+            ).fetchall()
+        return [
+            {"id": row[0], "ts": row[1], "kind": row[2], "price": row[3], "old_price": row[4], "tour": jsonutil.loads(row[5])}
+            for row in rows
+        ]
+
+    def history(self, watch_id: str, hotel_id: int, date: str, nights: int) -> List[Tuple[float, int]]:
+        """(время, цена) по одному предложению — только моменты изменения цены."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ts, price FROM price_history WHERE watch_id = ? AND hotel_id = ? AND date = ? AND nights = ? ORDER BY ts",
+                (watch_id, hotel_id, date, nights),
+            ).fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def prune(self, before: float) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM price_history WHERE ts < ?", (before,))
+            self._conn.execute("DELETE FROM events WHERE ts < ?", (before,))
+            self._conn.execute("DELETE FROM prices WHERE seen < ?", (before,))
+
+
+class Watcher:
+    """Периодические поиски по наблюдениям из WatchStore.
+
+    Каждые tick секунд забирает наблюдения, которым пора, и группирует их
+    по ключу поиска (search_key нормализованных параметров): наблюдения с
+    одинаковыми параметрами, но разными filter, делят один поиск — один
+    modsearch и один цикл опроса на такт. Одновременно идёт не больше
+    concurrency поисков. Ответ сводится к самой низкой цене на отель × дата
+    × ночи, в события попадают только новые предложения и снижения цены.
+    """
+
+    def __init__(
+        self,
+        store: WatchStore,
+        tick: float,
+        concurrency: int,
+        jitter: float,
+        min_drop: int = 0,
+        retention: float = 0,
+    ) -> None:
+        self.store = store
+        self.tick = tick
+        self.concurrency = max(1, concurrency)
+        self.jitter = max(0.0, min(0.5, jitter))
+        self.min_drop = min_drop
+        self.retention = retention
+        self._task: Optional[asyncio.Task] = None
+        self._pruned = 0.0
+
+    async def run_due(self) -> int:
+        """Один такт: запускает всё, чему пора; возвращает число поисков."""
+        now = time.time()
+        watches = await asyncio.to_thread(self.store.claim_due, now, self.concurrency * 16, self.jitter)
+        if not watches:
+            return 0
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for watch in watches:
+            checked = await async_search_key(watch["payload"])
+            if not checked.get("success"):
+                await asyncio.to_thread(self.store.finish, watch["id"], checked.get("error"))
+                continue
+            groups.setdefault(checked["cache_key"], []).append(watch)
+        slots = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._run_group(group, slots) for group in groups.values()))
+        if self.retention > 0 and now - self._pruned > 3600:
+            self._pruned = now
+            await asyncio.to_thread(self.store.prune, now - self.retention)
+        return len(groups)
+
+    async def _run_group(self, group: List[Dict[str, Any]], slots: asyncio.Semaphore) -> None:
+        async with slots:
+            result = await async_search_all_tours(group[0]["payload"], [w["payload"].get("filter") for w in group])
+        error = None
+        if not result.get("success"):
+            error = result.get("error") or "Поиск не удался"
+        elif result.get("stale"):
+            # Устаревший кэш при недоступном Tourvisor — не повод для событий
+            error = "Tourvisor недоступен"
+        if error:
+            for watch in group:
+                await asyncio.to_thread(self.store.finish, watch["id"], error)
+            logs.event("watch_failed", "warning", watches=[w["id"] for w in group], error=error)
+            return
+        for watch, tours in zip(group, result["tours"]):
+            offers = await asyncio.to_thread(cheapest_offers, tours)
+            events = await asyncio.to_thread(self.store.apply, watch["id"], offers, self.min_drop)
+            await asyncio.to_thread(self.store.finish, watch["id"], None)
+            for event in events:
+                logs.event(
+                    "watch_offer",
+                    watch=watch["id"],
+                    kind=event["kind"],
+                    price=event["price"],
+                    old_price=event["old_price"],
+                    hotel_id=event["tour"].get("hotel_id"),
+                    date=event["tour"].get("date"),
+                    nights=event["tour"].get("nights"),
+                )
+        logs.event("watch_run", requestid=result.get("requestid"), watches=len(group))
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logs.exception("watch_tick_failed", e)
+            await asyncio.sleep(self.tick)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+async def add_watch(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Регистрирует наблюдение: параметры как у search_tours (с filter) и interval в секундах."""
+    payload = payload or {}
+    try:
+        interval = float(payload.get("interval") or settings.watch_interval)
+    except (TypeError, ValueError):
+        return {"success": False, "error": "interval должен быть числом секунд"}
+    if interval < settings.watch_min_interval:
+        return {"success": False, "error": f"interval не меньше {settings.watch_min_interval} секунд"}
+    params = {k: v for k, v in payload.items() if k not in _OUTPUT_OPTIONS}
+    # Проверка параметров сразу, а не при первом запуске
+    checked = await async_search_key(params)
+    if not checked.get("success"):
+        return checked
+    watch = await asyncio.to_thread(watch_store.add, params, interval)
+    return {"success": True, "watch": watch}
+
+
+def _default_path() -> str:
+    path = settings.watch_db_path
+    return path if path == ":memory:" else os.path.expanduser(path)
+
+
+watch_store = WatchStore(_default_path())
+watcher = Watcher(
+    watch_store,
+    tick=settings.watch_tick,
+    concurrency=settings.watch_concurrency,
+    jitter=settings.watch_jitter,
+    min_drop=settings.watch_min_drop,
+    retention=settings.watch_retention_days * 86400,
+)